@@ -0,0 +1,88 @@
+import json
+import threading
+
+from const import (
+    DEFAULT_ADAPTIVE_FACTOR,
+    DEFAULT_ADAPTIVE_THRESHOLD,
+    DEFAULT_ADAPTIVE_RANGE,
+)
+
+
+class AdaptiveInterval:
+    """
+    Picks the update interval of a device from its readings. When any reading changed by more than its threshold
+    since the previous update the interval is divided by factor, down to min_interval. Otherwise it is multiplied
+    by factor, up to max_interval.
+    """
+
+    def __init__(self, interval, config):
+        self.factor = config.get("factor", DEFAULT_ADAPTIVE_FACTOR)
+        self.threshold = config.get("threshold", DEFAULT_ADAPTIVE_THRESHOLD)
+        self.thresholds = config.get("thresholds", {})
+        self.min_interval = config.get(
+            "min_interval", max(1, interval // DEFAULT_ADAPTIVE_RANGE)
+        )
+        self.max_interval = config.get("max_interval", interval * DEFAULT_ADAPTIVE_RANGE)
+        self.interval = interval
+        self._readings = {}
+        self._lock = threading.Lock()
+
+    def reset(self, interval):
+        """Starts over from a new interval, e.g. one set over MQTT"""
+        with self._lock:
+            self.interval = interval
+
+    def update(self, messages):
+        """Returns the interval to use after an update which published the given messages"""
+        readings = self._readings_of(messages)
+        if not readings:
+            return self.interval
+
+        with self._lock:
+            if not self._readings:
+                self._readings.update(readings)
+                return self.interval
+
+            changed = any(
+                self._changed(name, self._readings.get(name), value)
+                for name, value in readings.items()
+            )
+            self._readings.update(readings)
+            if changed:
+                self.interval = self._clamp(self.interval / self.factor)
+            else:
+                self.interval = self._clamp(self.interval * self.factor)
+            return self.interval
+
+    def _changed(self, name, previous, value):
+        if previous is None:
+            return False
+
+        try:
+            delta = abs(float(value) - float(previous))
+        except (TypeError, ValueError):
+            return value != previous
+
+        attr = name.split("/")[-1]
+        return delta > self.thresholds.get(attr, self.threshold)
+
+    def _clamp(self, interval):
+        return int(round(min(self.max_interval, max(self.min_interval, interval))))
+
+    @staticmethod
+    def _readings_of(messages):
+        readings = {}
+        for message in messages:
+            payload = message.raw_payload
+            if isinstance(payload, str):
+                # Workers publishing json.dumps() of their readings
+                try:
+                    payload = json.loads(payload)
+                except ValueError:
+                    pass
+            if isinstance(payload, dict):
+                for key, value in payload.items():
+                    readings["{}/{}".format(message.topic, key)] = value
+            else:
+                readings[message.topic] = payload
+        return readings
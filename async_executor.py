@@ -0,0 +1,172 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from const import DEFAULT_ASYNC_THREADS
+from exceptions import WorkerTimeoutError, DeviceTimeoutError, IsolatedWorkerError
+from timeouts import Deadline
+from workers_executor import WorkersExecutor
+from workers_queue import _WORKERS_QUEUE, PRIORITY_COMMAND
+import logger
+import workers_executor
+
+_LOGGER = logger.get(__name__)
+
+
+class AsyncWorkersExecutor(WorkersExecutor):
+    """
+    Executes queued commands on an asyncio event loop run by the thread calling process(). Up to `workers`
+    commands run at the same time, limited per bluetooth adapter. Commands of workers with coroutine hooks
+    (async def status_update / on_command) are awaited on the loop, the others are offloaded to a pool of
+    `threads` threads.
+    """
+
+    def __init__(self, config, mqtt):
+        super().__init__(config, mqtt)
+        self._threads_count = config.get("threads", DEFAULT_ASYNC_THREADS)
+        self._loop = None
+        self._pool = None
+        # Waiting for the queue blocks, it gets a thread of its own so it never waits for a busy pool
+        self._queue_waiter = None
+        self._sessions = None
+        self._async_adapters = {}
+        # Urgent commands waiting for an adapter semaphore by adapter, read by commands running on threads
+        self._urgent_waiting = {}
+        self._urgent_changed = threading.Condition(threading.Lock())
+        self._dispatcher = None
+        self._tasks = set()
+
+    @property
+    def threaded(self):
+        return False
+
+    def start(self):
+        workers_executor._EXECUTOR = self
+        self._running.set()
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._pool = ThreadPoolExecutor(max_workers=self._threads_count)
+        self._queue_waiter = ThreadPoolExecutor(max_workers=1)
+        self._sessions = asyncio.Semaphore(self._workers)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+        _LOGGER.debug(
+            "Started asyncio runtime, %d sessions and %d threads", self._workers, self._threads_count
+        )
+
+    def stop(self, timeout=None):
+        """Like WorkersExecutor.stop, commands still running after timeout seconds are cancelled"""
+        if self._loop is None:
+            self._running.clear()
+            return
+
+        deadline = Deadline(timeout)
+        self._draining.set()
+        # The dispatcher ends once the queue is empty, sessions it started may still be running
+        self._loop.run_until_complete(asyncio.wait([self._dispatcher], timeout=deadline.remaining()))
+        self._running.clear()
+        if self._tasks:
+            self._loop.run_until_complete(asyncio.wait(list(self._tasks), timeout=deadline.remaining()))
+
+        if self._tasks:
+            _LOGGER.warning("Cancelling %d commands still running after %s seconds", len(self._tasks), timeout)
+            for task in self._tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.wait(list(self._tasks)))
+        if not self._dispatcher.done():
+            self._loop.run_until_complete(self._dispatcher)
+        # Sync commands can't be cancelled, their threads are left behind
+        self._pool.shutdown(wait=False)
+        self._queue_waiter.shutdown()
+        self._loop.close()
+        self._loop = None
+
+    def process(self, timeout):
+        """Has to be called periodically from the main thread, runs the event loop for up to timeout seconds"""
+        self._loop.run_until_complete(asyncio.sleep(timeout))
+        if self._fatal_error_event.is_set():
+            raise self._fatal_error
+
+    def _adapter_semaphore(self, adapter):
+        if adapter not in self._async_adapters:
+            self._async_adapters[adapter] = asyncio.Semaphore(self._adapter_concurrency)
+        return self._async_adapters[adapter]
+
+    def preemption_requested(self, adapter):
+        return self._urgent_waiting.get(adapter, 0) > 0 or _WORKERS_QUEUE.has_pending(PRIORITY_COMMAND, adapter)
+
+    def _hand_over(self, adapter):
+        """Temporarily releases the adapter semaphore held by the calling command to urgent commands waiting for it"""
+        if not self._urgent_waiting.get(adapter):
+            return
+        semaphore = self._adapter_semaphore(adapter)
+        self._loop.call_soon_threadsafe(semaphore.release)
+        try:
+            with self._urgent_changed:
+                self._urgent_changed.wait_for(lambda: not self._urgent_waiting.get(adapter))
+        finally:
+            asyncio.run_coroutine_threadsafe(semaphore.acquire(), self._loop).result()
+
+    def _set_urgent(self, adapter, delta):
+        with self._urgent_changed:
+            self._urgent_waiting[adapter] = self._urgent_waiting.get(adapter, 0) + delta
+            self._urgent_changed.notify_all()
+
+    async def _dispatch(self):
+        while self._running.is_set():
+            await self._sessions.acquire()
+            try:
+                command = await self._loop.run_in_executor(
+                    self._queue_waiter, _WORKERS_QUEUE.get, 1
+                )
+            except queue.Empty:
+                self._sessions.release()
+                if self._draining.is_set():
+                    return
+                continue
+
+            task = asyncio.ensure_future(self._session(command))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _session(self, command):
+        try:
+            if command.adapter is None:
+                await self._execute_async(command)
+            else:
+                semaphore = self._adapter_semaphore(command.adapter)
+                urgent = command.priority == PRIORITY_COMMAND
+                if urgent:
+                    self._set_urgent(command.adapter, 1)
+                try:
+                    await semaphore.acquire()
+                finally:
+                    if urgent:
+                        self._set_urgent(command.adapter, -1)
+                try:
+                    await self._execute_async(command)
+                finally:
+                    semaphore.release()
+        except Exception as e:
+            self._fatal_error = e
+            self._fatal_error_event.set()
+        finally:
+            self._sessions.release()
+
+    async def _execute_async(self, command):
+        if not command.is_async:
+            await self._loop.run_in_executor(self._pool, self._execute, command)
+            return
+
+        try:
+            self._mqtt.publish(await command.execute_async())
+        except (WorkerTimeoutError, DeviceTimeoutError) as e:
+            logger.log_exception(
+                _LOGGER,
+                str(e) if str(e) else "Timeout while executing worker command",
+                suppress=True,
+            )
+        except IsolatedWorkerError as e:
+            # Contained to the worker process, restarted if it died
+            logger.log_exception(_LOGGER, "Worker process failed executing %s: %s", command, e, suppress=True)
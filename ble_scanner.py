@@ -0,0 +1,43 @@
+import time
+
+from bluepy_helpers import _HELPER_POOL
+from const import DEFAULT_ADAPTER, SCAN_PREEMPTION_INTERVAL
+import logger
+import presence
+import workers_executor
+
+_LOGGER = logger.get(__name__)
+
+
+def scan(scanner, timeout, passive=False, adapter=DEFAULT_ADAPTER):
+    """
+    Interruptible replacement for bluepy's Scanner.scan(). Every SCAN_PREEMPTION_INTERVAL seconds the scan checks
+    for urgent commands waiting for the adapter, stops to let them run and then resumes for the rest of its window.
+    Found devices are recorded as present. The scanner's bluepy-helper keeps running between scans.
+    """
+    scanner.clear()
+    _HELPER_POOL.start_scan(scanner, passive=passive)
+    scanning = True
+    try:
+        remaining = float(timeout)
+        while remaining > 0:
+            started = time.monotonic()
+            scanner.process(min(SCAN_PREEMPTION_INTERVAL, remaining))
+            remaining -= time.monotonic() - started
+
+            if remaining > 0 and workers_executor.preemption_requested(adapter):
+                _LOGGER.debug(
+                    "Pausing scan on adapter %s, %.1f seconds left", adapter, remaining
+                )
+                _HELPER_POOL.stop_scan(scanner)
+                scanning = False
+                workers_executor.preempt(adapter)
+                _HELPER_POOL.start_scan(scanner, passive=passive)
+                scanning = True
+    finally:
+        if scanning:
+            _HELPER_POOL.stop_scan(scanner)
+
+    devices = scanner.getDevices()
+    presence.scanned(adapter, [device.addr for device in devices])
+    return devices
@@ -0,0 +1,230 @@
+import subprocess
+import threading
+import time
+
+from const import (
+    DEFAULT_HELPER_MAX_AGE,
+    DEFAULT_HELPER_MAX_USES,
+    DEFAULT_IDLE_HELPERS,
+    HELPER_PING_TIMEOUT,
+    HELPER_STOP_TIMEOUT,
+)
+from exceptions import DeviceTimeoutError
+from timeouts import blocking_timeout
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+_PERIPHERAL_CLASS = None
+
+
+def _peripheral_class():
+    """
+    bluepy Peripheral whose waits for the helper, connecting and GATT requests included, end with the current
+    deadline rather than blocking for good. A peripheral that timed out may still get the late answer, its helper
+    isn't reused.
+    """
+    global _PERIPHERAL_CLASS
+    if _PERIPHERAL_CLASS is None:
+        from bluepy import btle
+
+        class DeadlinePeripheral(btle.Peripheral):
+            timed_out = False
+
+            def _getResp(self, wantType, timeout=None):
+                if timeout is not None:
+                    return super()._getResp(wantType, timeout)
+                timeout = blocking_timeout(None, DeviceTimeoutError)
+                response = super()._getResp(wantType, timeout)
+                if response is None:
+                    self.timed_out = True
+                    raise DeviceTimeoutError("No answer from {} in time".format(self.addr))
+                return response
+
+        _PERIPHERAL_CLASS = DeadlinePeripheral
+    return _PERIPHERAL_CLASS
+
+
+class HelperPool:
+    """
+    Reuses the bluepy-helper processes bluepy otherwise starts for every scan and every connection, stopping them
+    again right after. Scanners keep their helper running between scans. Peripherals released by the connection
+    pool are disconnected but keep their helper, up to `idle` of them per adapter wait for the next connection.
+    Helpers are pinged before reuse, and stopped for good after max_uses operations or max_age seconds.
+
+    bluepy has no API for this, helpers are handled through the _helper attribute of its objects.
+    """
+
+    def __init__(self):
+        self.idle = DEFAULT_IDLE_HELPERS
+        self.max_uses = DEFAULT_HELPER_MAX_USES
+        self.max_age = DEFAULT_HELPER_MAX_AGE
+        # Disconnected peripherals with a running helper, by adapter
+        self._idle = {}
+        # Started at and number of operations of every helper in use
+        self._usage = {}
+        self._scanners = set()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.idle = config.get("idle", self.idle)
+        self.max_uses = config.get("max_uses", self.max_uses)
+        self.max_age = config.get("max_age", self.max_age)
+
+    def start_scan(self, scanner, passive=False):
+        """Scanner.start() reusing the scanner's helper if it's still fit"""
+        with self._lock:
+            self._scanners.add(scanner)
+        if scanner._helper is not None and not self._fit(scanner):
+            self._stop(scanner)
+        scanner.start(passive=passive)
+        self._used(scanner)
+
+    def stop_scan(self, scanner):
+        """Scanner.stop() leaving the helper running"""
+        try:
+            scanner._mgmtCmd(scanner._cmd() + "end")
+        except Exception as e:
+            _LOGGER.debug("Failed to stop scan on adapter %s: %s", scanner.iface, type(e).__name__)
+            self._stop(scanner)
+
+    def connect(self, mac, addr_type="public", iface=None):
+        """Connected bluepy Peripheral, started with the helper of an idle one when available"""
+        peripheral = self._take(iface)
+        if peripheral is None:
+            peripheral = _peripheral_class()()
+        try:
+            peripheral.connect(mac, addr_type, iface)
+        except DeviceTimeoutError:
+            # bluepy only stops the helper itself when the connection failed
+            self._stop(peripheral)
+            raise
+        self._used(peripheral)
+        return peripheral
+
+    def release(self, peripheral):
+        """Peripheral.disconnect() keeping the helper for the next connection, unless too many are idle"""
+        if peripheral._helper is None:
+            return
+
+        try:
+            peripheral.setDelegate(None)
+            peripheral._writeCmd("disc\n")
+            if peripheral._getResp("stat", HELPER_PING_TIMEOUT) is None:
+                raise TimeoutError
+        except Exception as e:
+            _LOGGER.debug("Failed to disconnect from %s: %s", peripheral.addr, type(e).__name__)
+            self._stop(peripheral)
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(peripheral.iface, [])
+            reason = "timed out" if getattr(peripheral, "timed_out", False) else self._worn_out(peripheral._helper)
+            if reason is None and len(idle) < self.idle:
+                # Services of the last device would be taken for the next one's
+                peripheral._serviceMap = None
+                idle.append(peripheral)
+                return
+        if reason is not None:
+            self._recycled(peripheral, reason)
+        self._stop(peripheral)
+
+    def close(self):
+        """Stops all helpers not in use, on shutdown"""
+        with self._lock:
+            helper_users = [peripheral for idle in self._idle.values() for peripheral in idle]
+            helper_users += self._scanners
+            self._idle.clear()
+            self._scanners.clear()
+        for helper_user in helper_users:
+            self._stop(helper_user)
+
+    def _take(self, iface):
+        while True:
+            with self._lock:
+                idle = self._idle.get(iface)
+                if not idle:
+                    return None
+                peripheral = idle.pop()
+            if self._fit(peripheral):
+                metrics.increment("bluepy_helpers.reused")
+                return peripheral
+            self._stop(peripheral)
+
+    def _used(self, helper_user):
+        with self._lock:
+            usage = self._usage.get(helper_user._helper)
+            if usage is None:
+                # Forget helpers bluepy stopped itself, e.g. on disconnection
+                for helper in [helper for helper in self._usage if helper.poll() is not None]:
+                    del self._usage[helper]
+                usage = self._usage[helper_user._helper] = [time.monotonic(), 0]
+                metrics.increment("bluepy_helpers.started")
+            usage[1] += 1
+
+    def _worn_out(self, helper):
+        """Why the helper has to be recycled, None while it may still be used"""
+        if helper.poll() is not None:
+            return "exited with code {}".format(helper.returncode)
+        usage = self._usage.get(helper)
+        if usage is None:
+            return None
+        if usage[1] >= self.max_uses:
+            return "used {} times".format(usage[1])
+        if time.monotonic() - usage[0] >= self.max_age:
+            return "older than {} seconds".format(self.max_age)
+        return None
+
+    def _fit(self, helper_user):
+        """Health check of the helper, pinging it unless it has to be recycled anyway"""
+        with self._lock:
+            reason = self._worn_out(helper_user._helper)
+        if reason is None:
+            try:
+                helper_user._writeCmd("stat\n")
+                if helper_user._waitResp(["stat"], HELPER_PING_TIMEOUT) is None:
+                    reason = "didn't answer"
+            except Exception as e:
+                reason = "failed ({})".format(type(e).__name__)
+
+        if reason is not None:
+            self._recycled(helper_user, reason)
+            return False
+        return True
+
+    @staticmethod
+    def _recycled(helper_user, reason):
+        _LOGGER.debug("Recycling bluepy-helper %d, %s", helper_user._helper.pid, reason)
+        metrics.increment("bluepy_helpers.recycled")
+
+    def _stop(self, helper_user):
+        """Stops the helper like bluepy's _stopHelper(), killing it when it doesn't quit so it never lingers"""
+        helper = helper_user._helper
+        if helper is None:
+            return
+        with self._lock:
+            self._usage.pop(helper, None)
+
+        try:
+            helper_user._poller.unregister(helper.stdout)
+        except (KeyError, ValueError):
+            pass
+        try:
+            helper.stdin.write("quit\n")
+            helper.stdin.flush()
+            helper.wait(HELPER_STOP_TIMEOUT)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            helper.kill()
+            helper.wait()
+        for pipe in (helper.stdin, helper.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        helper_user._helper = None
+        if helper_user._stderr is not None:
+            helper_user._stderr.close()
+            helper_user._stderr = None
+
+
+_HELPER_POOL = HelperPool()
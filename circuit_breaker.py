@@ -0,0 +1,93 @@
+import threading
+import time
+
+from const import (
+    DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+    DEFAULT_CIRCUIT_BASE_DELAY,
+    DEFAULT_CIRCUIT_MAX_DELAY,
+)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+
+
+class CircuitBreaker:
+    """
+    Stops polling a device after failure_threshold consecutive failed updates. While open, a single probe is let
+    through once the backoff passes, doubling it after every failed probe up to max_delay. A successful update
+    closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold, base_delay, max_delay):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._failures = 0
+        self._probes = 0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return STATE_OPEN if self._probe_at is not None else STATE_CLOSED
+
+    def allow(self):
+        with self._lock:
+            if self._probe_at is None:
+                return True
+            if time.monotonic() < self._probe_at:
+                return False
+            # Let a single probe through, the next one waits for its outcome
+            self._probe_at = time.monotonic() + self.max_delay
+            return True
+
+    def record_success(self):
+        """Returns True when this closed the circuit"""
+        with self._lock:
+            opened = self._probe_at is not None
+            self._failures = 0
+            self._probes = 0
+            self._probe_at = None
+            return opened
+
+    def record_failure(self):
+        """Returns True when this opened the circuit"""
+        with self._lock:
+            self._failures += 1
+            if self._probe_at is not None:
+                self._probes += 1
+            elif not self.failure_threshold or self._failures < self.failure_threshold:
+                return False
+
+            self._probe_at = time.monotonic() + self.delay(self._probes)
+            return self._probes == 0
+
+    def delay(self, probes):
+        return min(self.max_delay, self.base_delay * 2 ** probes)
+
+
+class CircuitBreakers:
+    """Circuit breakers by device MAC address, shared by all workers"""
+
+    def __init__(self):
+        self.failure_threshold = DEFAULT_CIRCUIT_FAILURE_THRESHOLD
+        self.base_delay = DEFAULT_CIRCUIT_BASE_DELAY
+        self.max_delay = DEFAULT_CIRCUIT_MAX_DELAY
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.failure_threshold = config.get("failure_threshold", self.failure_threshold)
+        self.base_delay = config.get("base_delay", self.base_delay)
+        self.max_delay = config.get("max_delay", self.max_delay)
+
+    def get(self, mac):
+        with self._lock:
+            if mac not in self._breakers:
+                self._breakers[mac] = CircuitBreaker(
+                    self.failure_threshold, self.base_delay, self.max_delay
+                )
+            return self._breakers[mac]
+
+
+_CIRCUIT_BREAKERS = CircuitBreakers()
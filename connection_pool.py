@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from bluepy_helpers import _HELPER_POOL
+from const import DEFAULT_ADAPTER, DEFAULT_CONNECTION_IDLE_TIMEOUT, DEFAULT_MAX_CONNECTIONS, HELPER_PING_TIMEOUT
+from exceptions import DeviceTimeoutError
+from timeouts import blocking_timeout, remaining
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+
+
+def _disconnect(connection):
+    _HELPER_POOL.release(connection)
+
+
+def _is_connected(connection):
+    """
+    Health check of bluepy peripherals, bound by the current deadline, failing when no time is left. Unlike
+    getState(), notifications received while the connection was idle are handed to the delegate instead of failing
+    the check.
+    """
+    timeout = blocking_timeout(HELPER_PING_TIMEOUT, DeviceTimeoutError)
+    connection._writeCmd("stat\n")
+    response = connection._getResp("stat", timeout)
+    return response is not None and response["state"][0] == "conn"
+
+
+class _Entry:
+    def __init__(self, mac, adapter):
+        self.mac = mac
+        self.adapter = adapter
+        self.connection = None
+        self.disconnect = _disconnect
+        self.is_connected = _is_connected
+        self.last_used = None
+        # Held while borrowed, a connection serves one operation at a time
+        self.lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Keeps GATT connections open between operations on a device, keyed by MAC. Workers borrow a device's connection
+    with connection(), made by their connect function unless an open one passes the health check. Errors raised
+    while borrowed drop the connection, as do idle_timeout seconds without use. At most max_connections stay open
+    per adapter, opening another one closes the least recently used idle connection.
+    """
+
+    def __init__(self):
+        self.max_connections = DEFAULT_MAX_CONNECTIONS
+        self.idle_timeout = DEFAULT_CONNECTION_IDLE_TIMEOUT
+        # Least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.max_connections = config.get("max_connections", self.max_connections)
+        self.idle_timeout = config.get("idle_timeout", self.idle_timeout)
+
+    @contextmanager
+    def connection(self, mac, connect, adapter=DEFAULT_ADAPTER, disconnect=_disconnect, is_connected=_is_connected):
+        """
+        Borrows the connection to the device, waiting within the current deadline while another operation has it.
+        connect() opens a new one on the given adapter, by default it is a bluepy Peripheral whose helper is
+        released to the helper pool once closed.
+        """
+        with self._lock:
+            entry = self._entries.get(mac)
+            if entry is None:
+                entry = self._entries[mac] = _Entry(mac, adapter)
+            self._entries.move_to_end(mac)
+
+        timeout = remaining()
+        if not entry.lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise DeviceTimeoutError("Connection to {} is busy".format(mac))
+
+        try:
+            if entry.connection is not None and not self._healthy(entry):
+                self._close(entry)
+
+            if entry.connection is None:
+                self._make_room(adapter)
+                connection = connect()
+                entry.connection = connection
+                entry.disconnect = disconnect
+                entry.is_connected = is_connected
+                metrics.increment("connections.opened")
+            else:
+                metrics.increment("connections.reused")
+
+            try:
+                yield entry.connection
+            except BaseException:
+                self._close(entry)
+                raise
+            entry.last_used = time.monotonic()
+            if self.idle_timeout <= 0:
+                self._close(entry)
+        finally:
+            entry.lock.release()
+
+    def expire(self):
+        """Closes the connections idle for longer than idle_timeout, called periodically by the manager"""
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            if entry.connection is None or not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if entry.connection is not None and self._idle(entry):
+                    _LOGGER.debug("Closing connection to %s, idle for %d seconds", entry.mac, self.idle_timeout)
+                    self._close(entry)
+            finally:
+                entry.lock.release()
+
+    def close(self):
+        """Closes all connections not borrowed"""
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            if entry.lock.acquire(blocking=False):
+                try:
+                    self._close(entry)
+                finally:
+                    entry.lock.release()
+
+    def _healthy(self, entry):
+        if self._idle(entry):
+            return False
+        try:
+            return entry.is_connected(entry.connection)
+        except Exception as e:
+            _LOGGER.debug("Connection to %s failed the health check: %s", entry.mac, type(e).__name__)
+            return False
+
+    def _idle(self, entry):
+        return time.monotonic() - entry.last_used > self.idle_timeout
+
+    def _make_room(self, adapter):
+        """Closes the least recently used idle connections of the adapter beyond max_connections - 1"""
+        with self._lock:
+            connected = [
+                entry
+                for entry in self._entries.values()
+                if entry.adapter == adapter and entry.connection is not None
+            ]
+        for entry in connected[:max(len(connected) - self.max_connections + 1, 0)]:
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                _LOGGER.debug("Closing connection to %s, least recently used", entry.mac)
+                self._close(entry)
+                metrics.increment("connections.evicted")
+            finally:
+                entry.lock.release()
+
+    @staticmethod
+    def _close(entry):
+        connection, entry.connection = entry.connection, None
+        if connection is None:
+            return
+        try:
+            entry.disconnect(connection)
+        except Exception as e:
+            _LOGGER.debug("Failed to disconnect from %s: %s", entry.mac, type(e).__name__)
+
+
+_CONNECTION_POOL = ConnectionPool()
@@ -2,3 +2,48 @@ DEFAULT_COMMAND_TIMEOUT = 35  # In seconds
 DEFAULT_PER_DEVICE_TIMEOUT = 8  # In seconds
 DEFAULT_COMMAND_RETRIES = 0
 DEFAULT_UPDATE_RETRIES = 0
+DEFAULT_EXECUTOR_WORKERS = 1
+DEFAULT_ADAPTER = 0  # hci0
+DEFAULT_ADAPTER_CONCURRENCY = 1
+DEFAULT_STARVATION_TIMEOUT = 60  # In seconds
+DEFAULT_METRICS_INTERVAL = 60  # In seconds
+SCAN_PREEMPTION_INTERVAL = 0.25  # In seconds
+DEFAULT_RETRY_BASE_DELAY = 1  # In seconds
+DEFAULT_RETRY_MAX_DELAY = 30  # In seconds
+DEFAULT_RETRY_BUDGET = 10  # Retries per device within DEFAULT_RETRY_BUDGET_WINDOW
+DEFAULT_RETRY_BUDGET_WINDOW = 600  # In seconds
+DEFAULT_ADAPTIVE_FACTOR = 2  # Interval is divided or multiplied by it after each update
+DEFAULT_ADAPTIVE_THRESHOLD = 1  # Absolute change of a reading considered significant
+DEFAULT_ADAPTIVE_RANGE = 4  # Default min/max interval is update_interval divided/multiplied by it
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 0  # Consecutive failed updates opening a device's circuit, 0 disables it
+DEFAULT_CIRCUIT_BASE_DELAY = 60  # In seconds
+DEFAULT_CIRCUIT_MAX_DELAY = 3600  # In seconds
+DEFAULT_TIMEOUT_PERCENTILE = 95  # Percentile of a device's update latencies its adaptive timeout is based on
+DEFAULT_TIMEOUT_MARGIN = 1.5  # Adaptive timeout is the percentile multiplied by it
+DEFAULT_TIMEOUT_FLOOR = 2  # In seconds
+DEFAULT_TIMEOUT_CEILING = 30  # In seconds
+DEFAULT_TIMEOUT_MIN_SAMPLES = 10  # Latencies recorded before a device gets an adaptive timeout
+DEFAULT_LATENCY_SAVE_INTERVAL = 300  # In seconds
+DEFAULT_SCHEDULE_JITTER = 0.05  # Random delay of interval jobs, as a fraction of their interval
+DEFAULT_STARTUP_RAMP = 10  # In seconds, updating all workers is spread over it
+JOB_PHASE_STEP = 0.6180339887  # Golden ratio, spreads the phases of any number of interval jobs evenly
+DEFAULT_QUEUE_MAX_SIZE = 1000  # Commands waiting in the queue before shedding status updates, 0 for unbounded
+DEFAULT_ASYNC_THREADS = 4  # Threads running sync worker commands on the asyncio runtime
+DEFAULT_SHUTDOWN_TIMEOUT = 30  # In seconds, queued and running commands get it to finish on shutdown
+DEFAULT_MQTT_FLUSH_TIMEOUT = 5  # In seconds, pending publishes get it to be sent on shutdown
+MQTT_SPOOL_MAX_SIZE = 1000  # Publishes failed while disconnected kept for the next connection, the oldest are dropped
+DEFAULT_DAEMON_RESTART_BASE_DELAY = 1  # In seconds
+DEFAULT_DAEMON_RESTART_MAX_DELAY = 300  # In seconds
+DEFAULT_DAEMON_STOP_TIMEOUT = 5  # In seconds, daemons get it to return on shutdown before their output is cut off
+DEFAULT_OUTPUT_FLUSH_INTERVAL = 0.1  # In seconds, messages of daemon workers are published in batches this often
+DEFAULT_OUTPUT_MAX_PENDING = 1000  # Messages of daemon workers waiting to be published, the oldest are dropped beyond
+DEFAULT_SCAN_INTERVAL = 60  # In seconds, how often the shared scanner scans each adapter
+DEFAULT_SCAN_WINDOW = 10  # In seconds, scan window of passive workers not asking for another one
+DEFAULT_SCAN_DEDUP_WINDOW = 10  # In seconds, identical advertisements of a device are dispatched once within
+DEFAULT_MAX_CONNECTIONS = 5  # GATT connections kept open per adapter, most controllers handle a handful at once
+DEFAULT_CONNECTION_IDLE_TIMEOUT = 30  # In seconds, GATT connections unused for longer are closed
+DEFAULT_IDLE_HELPERS = 2  # bluepy-helper processes kept running per adapter for the next connection
+DEFAULT_HELPER_MAX_USES = 500  # Scans and connections before a bluepy-helper is replaced by a new one
+DEFAULT_HELPER_MAX_AGE = 3600  # In seconds, bluepy-helpers running for longer are replaced by new ones
+HELPER_PING_TIMEOUT = 2  # In seconds, a bluepy-helper not answering within is replaced
+HELPER_STOP_TIMEOUT = 2  # In seconds, a bluepy-helper not quitting within is killed
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+
+from const import (
+    DEFAULT_DAEMON_RESTART_BASE_DELAY,
+    DEFAULT_DAEMON_RESTART_MAX_DELAY,
+    DEFAULT_DAEMON_STOP_TIMEOUT,
+    DEFAULT_OUTPUT_FLUSH_INTERVAL,
+    DEFAULT_OUTPUT_MAX_PENDING,
+)
+from timeouts import Deadline
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+
+
+class OutputChannel:
+    """
+    Thread-safe replacement of the MQTT client for daemon workers. Published messages are collected and handed to
+    the client in batches by a thread of its own, every flush_interval seconds. Beyond max_pending waiting
+    messages the oldest ones are dropped.
+    """
+
+    def __init__(self, mqtt, flush_interval=DEFAULT_OUTPUT_FLUSH_INTERVAL, max_pending=DEFAULT_OUTPUT_MAX_PENDING):
+        self._mqtt = mqtt
+        self.flush_interval = flush_interval
+        self._pending = deque(maxlen=max_pending)
+        self._changed = threading.Condition(threading.Lock())
+        self._thread = None
+        self._running = False
+
+    def publish(self, messages):
+        if not messages:
+            return
+
+        with self._changed:
+            dropped = max(len(self._pending) + len(messages) - self._pending.maxlen, 0)
+            self._pending.extend(messages)
+            self._changed.notify()
+        if dropped:
+            metrics.increment("output_dropped", dropped)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="output", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Publishes the messages still waiting"""
+        with self._changed:
+            self._running = False
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        running = True
+        while running:
+            with self._changed:
+                if self._running and not self._pending:
+                    self._changed.wait()
+                running = self._running
+            # Collect whatever else arrives meanwhile into the same batch
+            if running:
+                time.sleep(self.flush_interval)
+
+            with self._changed:
+                batch = list(self._pending)
+                self._pending.clear()
+            if batch:
+                metrics.observe("output_batch_size", len(batch))
+                try:
+                    self._mqtt.publish(batch)
+                except Exception:
+                    logger.log_exception(_LOGGER, "Failed to publish %d messages", len(batch), suppress=True)
+
+
+class _DaemonOutput:
+    """Output channel as seen by a single daemon, recording when it last published"""
+
+    def __init__(self, channel, state):
+        self._channel = channel
+        self._state = state
+        # Set for daemons still running after shutdown, the channel no longer sends anything
+        self.closed = False
+
+    def publish(self, messages):
+        if self.closed:
+            return
+        self._state.last_output = time.monotonic()
+        self._channel.publish(messages)
+
+
+class _DaemonState:
+    def __init__(self, daemon):
+        self.daemon = daemon
+        self.alive = False
+        self.restarts = 0
+        self.started_at = None
+        self.last_output = None
+        self.output = None
+        self.thread = None
+
+
+class DaemonSupervisor:
+    """
+    Runs daemon workers on threads of their own and restarts them whenever run() raises or returns, after an
+    exponential backoff between base_delay and max_delay seconds. A daemon that ran for max_delay seconds before
+    failing starts over with base_delay. On shutdown daemons defining stop() are asked to return from run(), they
+    get stop_timeout seconds to do so.
+    """
+
+    def __init__(self, channel, config):
+        self._channel = channel
+        self.base_delay = config.get("restart_base_delay", DEFAULT_DAEMON_RESTART_BASE_DELAY)
+        self.max_delay = config.get("restart_max_delay", DEFAULT_DAEMON_RESTART_MAX_DELAY)
+        self.stop_timeout = config.get("stop_timeout", DEFAULT_DAEMON_STOP_TIMEOUT)
+        self._states = []
+        self._stopped = threading.Event()
+
+    def add(self, daemon):
+        self._states.append(_DaemonState(daemon))
+
+    def start(self):
+        for state in self._states:
+            state.output = _DaemonOutput(self._channel, state)
+            state.thread = threading.Thread(
+                target=self._supervise, args=[state], name="daemon-{}".format(repr(state.daemon)), daemon=True
+            )
+            state.thread.start()
+
+    def stop(self):
+        """
+        Prevents restarts and waits for the daemons to return. Daemons still running after stop_timeout can't be
+        interrupted, they end with the process and their output is dropped from then on.
+        """
+        self._stopped.set()
+        for state in self._states:
+            if state.thread is not None and hasattr(state.daemon, "stop"):
+                try:
+                    state.daemon.stop()
+                except Exception:
+                    logger.log_exception(_LOGGER, "Failed to stop daemon %s", repr(state.daemon), suppress=True)
+
+        deadline = Deadline(self.stop_timeout)
+        for state in self._states:
+            if state.thread is None:
+                continue
+            state.thread.join(deadline.remaining())
+            if state.thread.is_alive():
+                _LOGGER.warning("Abandoning daemon %s still running after %s seconds", repr(state.daemon),
+                                self.stop_timeout)
+                state.output.closed = True
+
+    def update_metrics(self):
+        now = time.monotonic()
+        for state in self._states:
+            name = repr(state.daemon)
+            metrics.gauge("daemon_alive.{}".format(name), int(state.alive))
+            if state.last_output is not None:
+                metrics.gauge("daemon_idle.{}".format(name), round(now - state.last_output, 1))
+
+    def _supervise(self, state):
+        failures = 0
+        while not self._stopped.is_set():
+            state.alive = True
+            state.started_at = time.monotonic()
+            try:
+                state.daemon.run(state.output)
+                if self._stopped.is_set():
+                    state.alive = False
+                    return
+                _LOGGER.warning("Daemon %s returned", repr(state.daemon))
+            except Exception:
+                logger.log_exception(_LOGGER, "Daemon %s failed", repr(state.daemon), suppress=True)
+            state.alive = False
+
+            if time.monotonic() - state.started_at >= self.max_delay:
+                failures = 0
+            delay = min(self.max_delay, self.base_delay * 2 ** failures)
+            failures += 1
+            if self._stopped.wait(delay):
+                return
+
+            state.restarts += 1
+            metrics.increment("daemon_restarts.{}".format(repr(state.daemon)))
+            _LOGGER.info("Restarting daemon %s (restart %d)", repr(state.daemon), state.restarts)
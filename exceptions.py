@@ -4,3 +4,11 @@ class WorkerTimeoutError(Exception):
 
 class DeviceTimeoutError(Exception):
     pass
+
+
+class IsolatedWorkerError(Exception):
+    """Error raised in a worker process, identified by the name of its type"""
+
+    def __init__(self, type_name, message):
+        super().__init__("{}: {}".format(type_name, message))
+        self.type_name = type_name
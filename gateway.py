@@ -2,8 +2,6 @@
 
 import sys
 
-from exceptions import WorkerTimeoutError, DeviceTimeoutError
-
 if sys.version_info < (3, 5):
     print("To use this script you need python 3.5 or newer! got %s" % sys.version_info)
     sys.exit(1)
@@ -14,12 +12,13 @@ logger.setup()
 
 import logging
 import argparse
-import queue
+import signal
 
 import workers_requirements
-from workers_queue import _WORKERS_QUEUE
 from mqtt import MqttClient
 from workers_manager import WorkersManager
+from workers_executor import WorkersExecutor
+from async_executor import AsyncWorkersExecutor
 
 
 parser = argparse.ArgumentParser()
@@ -82,25 +81,30 @@ mqtt = MqttClient(settings["mqtt"])
 manager = WorkersManager(settings["manager"], mqtt)
 manager.register_workers(global_topic_prefix)
 manager.start()
+executor_config = settings["manager"].get("executor", {})
+if executor_config.get("runtime") == "asyncio":
+    executor = AsyncWorkersExecutor(executor_config, mqtt)
+else:
+    executor = WorkersExecutor(executor_config, mqtt)
+executor.start()
+
+# Stopping the service or container sends SIGTERM, it shuts down the same way as SIGINT
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
 running = True
 
 while running:
     try:
-        mqtt.publish(_WORKERS_QUEUE.get(timeout=10).execute())
-    except queue.Empty:  # Allow for SIGINT processing
-        pass
-    except (WorkerTimeoutError, DeviceTimeoutError) as e:
-        logger.log_exception(
-            _LOGGER,
-            str(e) if str(e) else "Timeout while executing worker command",
-            suppress=True,
-        )
+        executor.process(timeout=10)
     except (KeyboardInterrupt, SystemExit):
         running = False
         _LOGGER.info(
             "Finish current jobs and shut down. If you need force exit use kill"
         )
+        manager.stop()
+        executor.stop(timeout=manager.shutdown_timeout)
+        manager.close()
+        mqtt.stop()
     except Exception as e:
         logger.log_exception(
             _LOGGER, "Fatal error while executing worker command: %s", type(e).__name__
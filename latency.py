@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+from const import (
+    DEFAULT_TIMEOUT_PERCENTILE,
+    DEFAULT_TIMEOUT_MARGIN,
+    DEFAULT_TIMEOUT_FLOOR,
+    DEFAULT_TIMEOUT_CEILING,
+    DEFAULT_TIMEOUT_MIN_SAMPLES,
+)
+import logger
+
+_LOGGER = logger.get(__name__)
+
+# Upper bounds of the histogram buckets in seconds, growing by 25% from 50 ms to about 2 minutes
+BUCKETS = [round(0.05 * 1.25 ** i, 3) for i in range(36)]
+MAX_SAMPLES = 1000  # Counts are halved beyond it, so old measurements fade out
+
+
+class LatencyHistograms:
+    """
+    Histograms of successful device update latencies by device MAC address. When enabled, a device's timeout is
+    the given percentile of its latency times margin, within floor and ceiling, once min_samples were recorded.
+    After a timeout the device gets the ceiling, until an update succeeds again.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.percentile = DEFAULT_TIMEOUT_PERCENTILE
+        self.margin = DEFAULT_TIMEOUT_MARGIN
+        self.floor = DEFAULT_TIMEOUT_FLOOR
+        self.ceiling = DEFAULT_TIMEOUT_CEILING
+        self.min_samples = DEFAULT_TIMEOUT_MIN_SAMPLES
+        self.state_file = None
+        self._histograms = {}
+        self._timed_out = set()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.enabled = True
+        self.percentile = config.get("percentile", self.percentile)
+        self.margin = config.get("margin", self.margin)
+        self.floor = config.get("floor", self.floor)
+        self.ceiling = config.get("ceiling", self.ceiling)
+        self.min_samples = config.get("min_samples", self.min_samples)
+        self.state_file = config.get("state_file", self.state_file)
+        if self.state_file:
+            self.load()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._timed_out.discard(key)
+            self._add(key, seconds)
+
+    def record_timeout(self, key, seconds):
+        """The latency is at least the timeout, recording it lets too tight timeouts grow"""
+        with self._lock:
+            self._timed_out.add(key)
+            self._add(key, seconds)
+
+    def timeout(self, key, default):
+        """Timeout for updating the device, default until enough latencies were recorded"""
+        if not self.enabled:
+            return default
+
+        with self._lock:
+            if key in self._timed_out:
+                return self.ceiling
+
+            counts = self._histograms.get(key)
+            total = sum(counts) if counts else 0
+            if total < self.min_samples:
+                return default
+
+            threshold = total * self.percentile / 100
+            seen = 0
+            for bound, count in zip(BUCKETS, counts):
+                seen += count
+                if seen >= threshold:
+                    break
+
+        return min(self.ceiling, max(self.floor, bound * self.margin))
+
+    def load(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.log_exception(
+                _LOGGER, "Ignoring unreadable latency state %s", self.state_file, suppress=True
+            )
+            return
+
+        with self._lock:
+            for key, counts in state.items():
+                if len(counts) == len(BUCKETS):
+                    self._histograms[key] = counts
+        _LOGGER.debug("Loaded latencies of %d devices", len(state))
+
+    def save(self):
+        if not self.state_file:
+            return
+
+        with self._lock:
+            state = json.dumps(self._histograms)
+        # Written aside and renamed, so a crash can't leave a truncated file
+        temp_file = "{}.tmp".format(self.state_file)
+        with open(temp_file, "w") as f:
+            f.write(state)
+        os.replace(temp_file, self.state_file)
+
+    def _add(self, key, seconds):
+        counts = self._histograms.setdefault(key, [0] * len(BUCKETS))
+        counts[self._bucket(seconds)] += 1
+        if sum(counts) > MAX_SAMPLES:
+            counts[:] = [count // 2 for count in counts]
+
+    @staticmethod
+    def _bucket(seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                return i
+        return len(BUCKETS) - 1
+
+
+_LATENCY = LatencyHistograms()
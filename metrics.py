@@ -0,0 +1,37 @@
+import threading
+
+_LOCK = threading.Lock()
+_COUNTERS = {}
+_TIMINGS = {}
+_GAUGES = {}
+
+
+def increment(name, value=1):
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+def gauge(name, value):
+    with _LOCK:
+        _GAUGES[name] = value
+
+
+def observe(name, seconds):
+    with _LOCK:
+        timing = _TIMINGS.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+def snapshot():
+    with _LOCK:
+        ret = dict(_COUNTERS)
+        ret.update(_GAUGES)
+        for name, timing in _TIMINGS.items():
+            ret[name] = {
+                "count": timing["count"],
+                "avg": round(timing["total"] / timing["count"], 3),
+                "max": round(timing["max"], 3),
+            }
+        return ret
@@ -1,6 +1,11 @@
 import json
+import os
+import threading
+import time
+from collections import deque
 
 import paho.mqtt.client as mqtt
+from const import DEFAULT_MQTT_FLUSH_TIMEOUT, MQTT_SPOOL_MAX_SIZE
 import logger
 
 LWT_ONLINE = "online"
@@ -11,6 +16,11 @@ _LOGGER = logger.get(__name__)
 class MqttClient:
     def __init__(self, config):
         self._config = config
+        # Info of publishes not sent yet, in the order they were made
+        self._pending = deque()
+        self._pending_lock = threading.Lock()
+        # Publishes the client refused, e.g. while disconnected, replayed on the next connection
+        self._spool = deque(maxlen=MQTT_SPOOL_MAX_SIZE)
         self._mqttc = mqtt.Client(
             client_id=self.client_id,
             clean_session=False,
@@ -39,7 +49,86 @@ class MqttClient:
                 topic = self._format_topic(m.topic)
             else:
                 topic = m.topic
-            self.mqttc.publish(topic, m.payload, retain=m.retain)
+            self._publish(topic, m.payload, m.retain)
+
+    def _publish(self, topic, payload, retain):
+        info = self.mqttc.publish(topic, payload, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            _LOGGER.debug("Spooling message to %s, publishing failed: %s", topic, mqtt.error_string(info.rc))
+            with self._pending_lock:
+                self._spool.append((topic, payload, retain))
+            return
+        with self._pending_lock:
+            while self._pending and self._pending[0][0].is_published():
+                self._pending.popleft()
+            self._pending.append((info, (topic, payload, retain)))
+
+    def flush(self, timeout):
+        """Waits up to timeout seconds for pending publishes to be sent, returns the (topic, payload, retain) left"""
+        end = time.monotonic() + timeout
+        while True:
+            with self._pending_lock:
+                unsent = [message for info, message in self._pending if not info.is_published()]
+            if not unsent or time.monotonic() >= end:
+                return unsent
+            time.sleep(0.1)
+
+    def stop(self):
+        """
+        Flushes pending publishes and saves the ones left to the spool file, to be published after the next start.
+        Then announces going offline, as a clean disconnect doesn't trigger the LWT.
+        """
+        unsent = self.flush(self.flush_timeout)
+        with self._pending_lock:
+            unsent = list(self._spool) + unsent
+            self._spool.clear()
+        if unsent:
+            self._save_spool(unsent)
+
+        if self.availability_topic:
+            self._publish(self._format_topic(self.availability_topic), LWT_OFFLINE, True)
+            self.flush(self.flush_timeout)
+        self.mqttc.disconnect()
+        self.mqttc.loop_stop()
+
+    def _save_spool(self, messages):
+        if not self.spool_file:
+            _LOGGER.warning("Dropping %d messages not sent to the broker", len(messages))
+            return
+
+        _LOGGER.info("Saving %d messages not sent to the broker to %s", len(messages), self.spool_file)
+        temp_file = "{}.tmp".format(self.spool_file)
+        with open(temp_file, "w") as f:
+            json.dump(messages, f)
+        os.replace(temp_file, self.spool_file)
+
+    def _publish_spool(self):
+        """Publishes the messages saved at the last shutdown, then the ones that failed while disconnected"""
+        if self.spool_file:
+            self._publish_spool_file()
+
+        with self._pending_lock:
+            messages = list(self._spool)
+            self._spool.clear()
+        if messages:
+            _LOGGER.info("Publishing %d messages that failed while disconnected", len(messages))
+        for topic, payload, retain in messages:
+            self._publish(topic, payload, retain)
+
+    def _publish_spool_file(self):
+        try:
+            with open(self.spool_file) as f:
+                messages = json.load(f)
+            os.remove(self.spool_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.log_exception(_LOGGER, "Ignoring unreadable spool file %s", self.spool_file, suppress=True)
+            return
+
+        _LOGGER.info("Publishing %d messages saved at the last shutdown", len(messages))
+        for topic, payload, retain in messages:
+            self._publish(topic, payload, retain)
 
     @property
     def client_id(self):
@@ -80,6 +169,18 @@ class MqttClient:
         else:
             return True
 
+    @property
+    def spool_file(self):
+        return self._config["spool_file"] if "spool_file" in self._config else None
+
+    @property
+    def flush_timeout(self):
+        return (
+            self._config["flush_timeout"]
+            if "flush_timeout" in self._config
+            else DEFAULT_MQTT_FLUSH_TIMEOUT
+        )
+
     @property
     def topic_prefix(self):
         return self._config["topic_prefix"] if "topic_prefix" in self._config else None
@@ -106,6 +207,7 @@ class MqttClient:
                     )
                 ]
             )
+        self._publish_spool()
 
     def callbacks_subscription(self, callbacks):
         self.mqttc.on_connect = self.on_connect
@@ -120,16 +222,6 @@ class MqttClient:
 
         self.mqttc.loop_start()
 
-    def __del__(self):
-        if self.availability_topic:
-            self.publish(
-                [
-                    MqttMessage(
-                        topic=self.availability_topic, payload=LWT_OFFLINE, retain=True
-                    )
-                ]
-            )
-
     def _format_topic(self, topic):
         return "{}/{}".format(self.topic_prefix, topic) if self.topic_prefix else topic
 
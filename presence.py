@@ -0,0 +1,40 @@
+import threading
+import time
+
+_LOCK = threading.Lock()
+_LAST_SEEN = {}
+_LAST_SCAN = {}
+
+
+def seen(mac):
+    """Records an advertisement or successful connection of a device"""
+    with _LOCK:
+        _LAST_SEEN[mac.lower()] = time.monotonic()
+
+
+def scanned(adapter, macs):
+    """Records a finished scan on the adapter and the devices it found"""
+    now = time.monotonic()
+    with _LOCK:
+        _LAST_SCAN[adapter] = now
+        for mac in macs:
+            _LAST_SEEN[mac.lower()] = now
+
+
+def last_seen(mac):
+    with _LOCK:
+        return _LAST_SEEN.get(mac.lower())
+
+
+def absent(mac, adapter, window):
+    """
+    True when the adapter scanned within the last window seconds without hearing from the device. Without a
+    recent scan nothing is known about the device, so it isn't considered absent.
+    """
+    now = time.monotonic()
+    with _LOCK:
+        last_scan = _LAST_SCAN.get(adapter)
+        if last_scan is None or now - last_scan > window:
+            return False
+        last_seen = _LAST_SEEN.get(mac.lower())
+        return last_seen is None or now - last_seen > window
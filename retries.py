@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from functools import partial
+
+from const import (
+    DEFAULT_RETRY_BASE_DELAY,
+    DEFAULT_RETRY_MAX_DELAY,
+    DEFAULT_RETRY_BUDGET,
+    DEFAULT_RETRY_BUDGET_WINDOW,
+)
+from exceptions import DeviceTimeoutError
+from timeouts import call_with_timeout, current_deadline, remaining
+from workers_queue import _WORKERS_QUEUE
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+
+
+class RetryPolicy:
+    """
+    Retries failed device operations by putting them back on the queue after an exponential backoff with full
+    jitter, instead of sleeping on the executor. Each operation (function and its arguments, i.e. the device)
+    has a budget of retries per budget_window seconds.
+    """
+
+    def __init__(self):
+        self.base_delay = DEFAULT_RETRY_BASE_DELAY
+        self.max_delay = DEFAULT_RETRY_MAX_DELAY
+        self.budget = DEFAULT_RETRY_BUDGET
+        self.budget_window = DEFAULT_RETRY_BUDGET_WINDOW
+        self._retries = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.base_delay = config.get("base_delay", self.base_delay)
+        self.max_delay = config.get("max_delay", self.max_delay)
+        self.budget = config.get("budget", self.budget)
+        self.budget_window = config.get("budget_window", self.budget_window)
+
+    def call(self, func, args, kwargs, retries, exception_type, attempt=1):
+        try:
+            return func(*args, **kwargs)
+        except exception_type as e:
+            command = self._current_command()
+            if attempt > retries:
+                raise
+
+            if command is None:
+                # Not executed by a command, e.g. in a worker process, nothing to reschedule on
+                time.sleep(remaining(self.backoff(attempt)))
+                return self.call(func, args, kwargs, retries, exception_type, attempt + 1)
+
+            key = self._key(func, args)
+            if not self._take_budget(key):
+                metrics.increment("retries.budget_exceeded")
+                _LOGGER.info("Retry budget of %s exhausted", key)
+                raise
+
+            delay = self.backoff(attempt)
+            _LOGGER.info(
+                "Call to %s failed the %s time (%s). Retrying in %s seconds",
+                key,
+                attempt,
+                type(e).__name__,
+                "{:.2f}".format(delay),
+            )
+            metrics.increment("retries.scheduled")
+            # The retry gets the timeout the call failed under, e.g. a per-device one
+            deadline = current_deadline()
+            call = partial(self.call, func, args, kwargs, retries, exception_type, attempt + 1)
+            if deadline.seconds is not None:
+                call = partial(call_with_timeout, deadline.seconds, DeviceTimeoutError, call)
+            # Device updates handle the retry like the failed update, other commands just log its final failure
+            retry_command = command.derive_retry(call)
+            if retry_command is None:
+                retry_command = command.derive(self.retry, [call, func, args, exception_type, attempt + 1])
+            _WORKERS_QUEUE.put_later(retry_command, delay)
+            deadline.retry_scheduled()
+            return []
+
+    def retry(self, call, func, args, exception_type, attempt):
+        try:
+            return call()
+        except (exception_type, DeviceTimeoutError) as e:
+            # The caller that would have handled the error is long gone
+            metrics.increment("retries.failed")
+            logger.log_exception(
+                _LOGGER,
+                "Call to %s failed after %d attempts: %s",
+                self._key(func, args),
+                attempt,
+                type(e).__name__,
+                suppress=True,
+            )
+            return []
+
+    def backoff(self, attempt):
+        return random.uniform(
+            self.base_delay, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+    def _take_budget(self, key):
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._retries.get(key, []) if now - t < self.budget_window]
+            if len(recent) >= self.budget:
+                self._retries[key] = recent
+                return False
+            recent.append(now)
+            self._retries[key] = recent
+            return True
+
+    @staticmethod
+    def _current_command():
+        deadline = current_deadline()
+        return deadline.owner if deadline is not None else None
+
+    @staticmethod
+    def _key(func, args):
+        return "{}.{}({})".format(
+            func.__module__,
+            getattr(func, "__qualname__", func.__name__),
+            ", ".join(map(str, args)),
+        )
+
+
+_RETRY_POLICY = RetryPolicy()
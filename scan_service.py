@@ -0,0 +1,257 @@
+import struct
+import threading
+import time
+
+from const import DEFAULT_SCAN_DEDUP_WINDOW, DEFAULT_SCAN_INTERVAL, DEFAULT_SCAN_WINDOW
+import ble_scanner
+import logger
+
+_LOGGER = logger.get(__name__)
+
+AD_TYPE_SERVICE_DATA_16 = 0x16  # Service data with a 16-bit UUID
+AD_TYPE_MANUFACTURER_DATA = 0xFF  # Manufacturer data with a 16-bit company ID
+
+_KEY = struct.Struct("<H")
+_DECODERS = {}
+
+
+def register_decoder(ad_type, key, decoder):
+    """
+    Registers decoder(payload, advertisement) for data of the AD type starting with the key, a 16-bit service
+    UUID or company ID. The payload is a memoryview of the bytes following the key.
+    """
+    _DECODERS[(ad_type, key)] = decoder
+
+
+class Advertisement:
+    """
+    Last advertisement received from a device, raw data by AD type. Has the accessors of bluepy's ScanEntry workers
+    use, converting the data to text.
+    """
+
+    def __init__(self, mac, rssi, raw_data, adapter, entry=None):
+        self.addr = mac
+        self.rssi = rssi
+        self.adapter = adapter
+        self.raw_data = raw_data
+        self.seen_at = time.monotonic()
+        self._entry = entry
+        self._mac_bytes = None
+
+    @property
+    def mac_bytes(self):
+        if self._mac_bytes is None:
+            self._mac_bytes = bytes.fromhex(self.addr.replace(":", ""))
+        return self._mac_bytes
+
+    def key(self, ad_type):
+        """16-bit service UUID or company ID the data of the AD type starts with, None without such data"""
+        data = self.raw_data.get(ad_type)
+        if data is None or len(data) < _KEY.size:
+            return None
+        return _KEY.unpack_from(data)[0]
+
+    @property
+    def service_uuids(self):
+        """16-bit UUIDs of the services the advertisement carries data of"""
+        uuid = self.key(AD_TYPE_SERVICE_DATA_16)
+        return [] if uuid is None else [uuid]
+
+    def decode(self, ad_type, key):
+        """Values of the data with the key decoded by the registered decoder, None without such data"""
+        decoder = _DECODERS.get((ad_type, key))
+        if decoder is None or self.key(ad_type) != key:
+            return None
+        # Bytes following the key, without copying them
+        payload = memoryview(self.raw_data[ad_type])[_KEY.size:]
+        try:
+            return decoder(payload, self)
+        except (struct.error, ValueError):
+            _LOGGER.debug("%s - undecodable data %s", self.addr, payload.hex())
+            return None
+
+    def getScanData(self):
+        return self._entry.getScanData()
+
+    def getValueText(self, adtype):
+        return self._entry.getValueText(adtype)
+
+    def __repr__(self):
+        return "Advertisement({}, {} dBm)".format(self.addr, self.rssi)
+
+
+class _Subscription:
+    def __init__(self, worker, macs, window, passive, uuids, callback):
+        self.worker = worker
+        self.macs = {mac.lower() for mac in macs}
+        self.window = window
+        self.passive = passive
+        self.uuids = set(uuids)
+        self.callback = callback
+
+    def matches(self, advertisement):
+        """Whether the advertisement carries data of a subscribed service, its MAC is matched by the dispatch index"""
+        return not self.uuids or not self.uuids.isdisjoint(advertisement.service_uuids)
+
+
+class _Delegate:
+    def __init__(self, service, adapter):
+        self._service = service
+        self._adapter = adapter
+
+    def handleDiscovery(self, dev, isNewDev, isNewData):
+        if not (isNewDev or isNewData):
+            return
+        # Drop foreign devices before copying their data
+        mac = dev.addr.lower()
+        if self._service.allows(mac):
+            self._service.received(Advertisement(mac, dev.rssi, dict(dev.scanData), self._adapter, entry=dev))
+
+
+class ScanService:
+    """
+    Shares one scanner per bluetooth adapter between all passive workers. Workers subscribe to the devices they
+    listen to, the manager then queues a scan of every subscribed adapter each interval seconds, as long as the
+    longest window subscribed and active if any subscriber needs it. The last advertisement of every device is
+    kept, and dispatched right away to the callbacks of matching subscriptions.
+
+    Advertisements of devices no worker subscribed to are dropped as they arrive, unless a subscription listens
+    to any device. Data identical to what a device advertised within the last dedup_window seconds is not
+    dispatched again, the device is only marked as seen.
+
+    Without the manager scheduling scans, e.g. in isolated worker processes, refresh() scans on the spot.
+    """
+
+    def __init__(self):
+        self.interval = DEFAULT_SCAN_INTERVAL
+        self.dedup_window = DEFAULT_SCAN_DEDUP_WINDOW
+        self.scheduled = False
+        self._subscriptions = []
+        # Callback subscriptions by MAC, those listening to any device under None
+        self._dispatch = {}
+        # Subscribed MACs, None while any device is subscribed to
+        self._allowed = frozenset()
+        self._advertisements = {}
+        # Data last dispatched of every device and when
+        self._dispatched = {}
+        self._scanners = {}
+        self._lock = threading.Lock()
+        self._scan_locks = {}
+
+    def configure(self, config):
+        self.interval = config.get("interval", self.interval)
+        self.dedup_window = config.get("dedup_window", self.dedup_window)
+
+    def subscribe(self, worker, macs=(), window=DEFAULT_SCAN_WINDOW, passive=True, uuids=(), callback=None):
+        """
+        Scans the worker's adapter for at least window seconds every interval. Advertisements of the given MACs
+        carrying data of one of the given service UUIDs (any when empty) are passed to callback.
+        """
+        subscription = _Subscription(worker, macs, window, passive, uuids, callback)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            if not subscription.macs:
+                self._allowed = None
+            elif self._allowed is not None:
+                self._allowed = self._allowed | subscription.macs
+
+            if callback is not None:
+                for mac in subscription.macs or [None]:
+                    self._dispatch.setdefault(mac, []).append(subscription)
+
+    def allows(self, mac):
+        """Whether any worker subscribed to the device, mac in lower case"""
+        allowed = self._allowed
+        return allowed is None or mac in allowed
+
+    def adapters(self):
+        with self._lock:
+            return sorted({subscription.worker.adapter for subscription in self._subscriptions})
+
+    def window(self, adapter):
+        return max(subscription.window for subscription in self._adapter_subscriptions(adapter))
+
+    def scan(self, adapter):
+        """Scans the adapter for the subscribed window, returns no messages so it can be queued as a command"""
+        subscriptions = self._adapter_subscriptions(adapter)
+        window = max(subscription.window for subscription in subscriptions)
+        passive = all(subscription.passive for subscription in subscriptions)
+
+        with self._lock:
+            scan_lock = self._scan_locks.setdefault(adapter, threading.Lock())
+        with scan_lock:
+            ble_scanner.scan(self._scanner(adapter), window, passive=passive, adapter=adapter)
+        return []
+
+    def refresh(self, adapter):
+        """Called by subscribers before reading advertisements, scans unless the manager does"""
+        if not self.scheduled:
+            self.scan(adapter)
+
+    def latest(self, mac, max_age=None):
+        """
+        Last advertisement of the device, None unless received within max_age seconds. By default within the last
+        scan cycle.
+        """
+        with self._lock:
+            advertisement = self._advertisements.get(mac.lower())
+        if advertisement is None:
+            return None
+
+        if max_age is None:
+            max_age = self.interval + self.window(advertisement.adapter)
+        if time.monotonic() - advertisement.seen_at > max_age:
+            return None
+        return advertisement
+
+    def received(self, advertisement):
+        mac = advertisement.addr
+        if not self.allows(mac):
+            return
+
+        with self._lock:
+            self._advertisements[mac] = advertisement
+            dispatched = self._dispatched.get(mac)
+            if (
+                dispatched is not None
+                and dispatched[0] == advertisement.raw_data
+                and advertisement.seen_at - dispatched[1] < self.dedup_window
+            ):
+                return
+            self._dispatched[mac] = (advertisement.raw_data, advertisement.seen_at)
+
+            callbacks = [
+                subscription.callback
+                for subscription in self._dispatch.get(mac, []) + self._dispatch.get(None, [])
+                if subscription.worker.adapter == advertisement.adapter
+                and subscription.matches(advertisement)
+            ]
+
+        for callback in callbacks:
+            try:
+                callback(advertisement)
+            except Exception:
+                logger.log_exception(
+                    _LOGGER, "Failed to process %s", advertisement, suppress=True
+                )
+
+    def _adapter_subscriptions(self, adapter):
+        with self._lock:
+            return [
+                subscription
+                for subscription in self._subscriptions
+                if subscription.worker.adapter == adapter
+            ]
+
+    def _scanner(self, adapter):
+        with self._lock:
+            if adapter not in self._scanners:
+                from bluepy import btle
+
+                self._scanners[adapter] = btle.Scanner(adapter).withDelegate(
+                    _Delegate(self, adapter)
+                )
+            return self._scanners[adapter]
+
+
+_SCAN_SERVICE = ScanService()
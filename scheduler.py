@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import logger
+
+_LOGGER = logger.get(__name__)
+
+
+class Job:
+    def __init__(self, job_id, func, interval, due, jitter):
+        self.id = job_id
+        self.func = func
+        self.interval = interval
+        self.due = due
+        self.jitter = jitter
+        self.cancelled = False
+
+    def __repr__(self):
+        return "{} (every {} seconds)".format(self.id, self.interval)
+
+
+class Scheduler:
+    """
+    Runs interval jobs on a single thread, using a heap of their next run times. Jobs replaced or removed stay
+    in the heap until their turn and are skipped then. A job delayed for more than its interval runs only once
+    and continues at its next due time, instead of catching up on every missed run.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._changed = threading.Condition(threading.Lock())
+        self._thread = None
+        self._running = False
+
+    def add_job(self, func, seconds, job_id, first_run=None, jitter=0):
+        """
+        Runs func every given seconds, the first time after first_run seconds (one interval by default). Every run
+        is delayed by a random jitter of up to the given seconds. An existing job with the same id is replaced.
+        """
+        due = time.monotonic() + (seconds if first_run is None else first_run)
+        job = Job(job_id, func, seconds, due, jitter)
+        with self._changed:
+            if job_id in self._jobs:
+                self._jobs[job_id].cancelled = True
+            self._jobs[job_id] = job
+            self._push(job)
+            self._changed.notify()
+        return job
+
+    def remove_job(self, job_id):
+        with self._changed:
+            self._jobs.pop(job_id).cancelled = True
+            self._changed.notify()
+
+    def get_jobs(self):
+        with self._changed:
+            return list(self._jobs.values())
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        with self._changed:
+            self._running = False
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _push(self, job):
+        run_at = job.due + random.uniform(0, job.jitter) if job.jitter else job.due
+        heapq.heappush(self._heap, (run_at, next(self._sequence), job))
+
+    def _run(self):
+        while True:
+            with self._changed:
+                job = self._next_job()
+                if job is None:
+                    return
+
+                now = time.monotonic()
+                job.due += job.interval
+                if job.due <= now:
+                    # Coalesce missed runs into this one
+                    job.due += (now - job.due) // job.interval * job.interval + job.interval
+                self._push(job)
+
+            try:
+                job.func()
+            except Exception:
+                logger.log_exception(_LOGGER, "Job %s failed", job, suppress=True)
+
+    def _next_job(self):
+        """Waits for the next job due, None once shut down"""
+        while self._running:
+            if not self._heap:
+                self._changed.wait()
+                continue
+
+            run_at, _, job = self._heap[0]
+            if job.cancelled:
+                heapq.heappop(self._heap)
+                continue
+
+            wait = run_at - time.monotonic()
+            if wait > 0:
+                self._changed.wait(wait)
+                continue
+
+            heapq.heappop(self._heap)
+            return job
+        return None
@@ -0,0 +1,55 @@
+import json
+
+from adaptive_interval import AdaptiveInterval
+from mqtt import MqttMessage
+
+
+def readings(**values):
+    return [MqttMessage(topic="sensor/{}".format(name), payload=value) for name, value in values.items()]
+
+
+def test_first_update_keeps_interval():
+    adaptive = AdaptiveInterval(60, {})
+    assert adaptive.update(readings(temperature=20)) == 60
+
+
+def test_steady_readings_back_off_up_to_max():
+    adaptive = AdaptiveInterval(60, {"max_interval": 200})
+    adaptive.update(readings(temperature=20))
+    assert adaptive.update(readings(temperature=20.5)) == 120
+    assert adaptive.update(readings(temperature=20)) == 200
+    assert adaptive.update(readings(temperature=20)) == 200
+
+
+def test_changing_readings_speed_up_down_to_min():
+    adaptive = AdaptiveInterval(60, {"min_interval": 20})
+    adaptive.update(readings(temperature=20))
+    assert adaptive.update(readings(temperature=25)) == 30
+    assert adaptive.update(readings(temperature=30)) == 20
+
+
+def test_thresholds_per_reading():
+    adaptive = AdaptiveInterval(60, {"thresholds": {"humidity": 5}})
+    adaptive.update(readings(temperature=20, humidity=50))
+    assert adaptive.update(readings(temperature=20, humidity=54)) == 120
+    assert adaptive.update(readings(temperature=22, humidity=54)) == 60
+
+
+def test_json_payloads_and_non_numeric_readings():
+    adaptive = AdaptiveInterval(60, {})
+    message = MqttMessage(topic="sensor", payload=json.dumps({"temperature": 20, "state": "on"}))
+    adaptive.update([message])
+    message = MqttMessage(topic="sensor", payload=json.dumps({"temperature": 20, "state": "off"}))
+    assert adaptive.update([message]) == 30
+
+
+def test_updates_without_readings_keep_interval():
+    adaptive = AdaptiveInterval(60, {})
+    assert adaptive.update([]) == 60
+
+
+def test_reset_starts_from_new_interval():
+    adaptive = AdaptiveInterval(60, {})
+    adaptive.update(readings(temperature=20))
+    adaptive.reset(100)
+    assert adaptive.update(readings(temperature=20)) == 200
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+
+import async_executor
+from async_executor import AsyncWorkersExecutor
+from workers_manager import WorkersManager
+from workers_queue import WorkersQueue
+
+
+class FakeMqtt:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, messages):
+        self.published.extend(messages)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = WorkersQueue()
+    monkeypatch.setattr(async_executor, "_WORKERS_QUEUE", queue)
+    return queue
+
+
+@pytest.fixture
+def executor(queue):
+    mqtt = FakeMqtt()
+    executor = AsyncWorkersExecutor({"workers": 4}, mqtt)
+    executor.start()
+    yield executor
+    queue.close()
+    executor.stop(1)
+
+
+async def reading(value, seconds):
+    await asyncio.sleep(seconds)
+    return [value]
+
+
+def blocking_reading(value, seconds):
+    time.sleep(seconds)
+    return [value]
+
+
+def test_async_and_sync_commands_run_concurrently(queue, executor):
+    for i in range(3):
+        queue.put(WorkersManager.Command(reading, 5, ["async{}".format(i), 0.2], adapter=i))
+        queue.put(WorkersManager.Command(blocking_reading, 5, ["sync{}".format(i), 0.2], adapter=i + 10))
+
+    started = time.monotonic()
+    while len(executor._mqtt.published) < 6 and time.monotonic() - started < 2:
+        executor.process(0.05)
+    assert sorted(executor._mqtt.published) == ["async0", "async1", "async2", "sync0", "sync1", "sync2"]
+    # Four sessions at a time, two rounds of 0.2 seconds instead of six
+    assert time.monotonic() - started < 0.55
+
+
+def test_async_timeouts_are_contained(queue, executor):
+    queue.put(WorkersManager.Command(reading, 0.05, ["late", 1]))
+    queue.put(WorkersManager.Command(reading, 5, ["on time", 0]))
+    started = time.monotonic()
+    while time.monotonic() - started < 0.3:
+        executor.process(0.05)
+    assert executor._mqtt.published == ["on time"]
+
+
+def test_async_callbacks_run_outside_the_runtime():
+    assert WorkersManager.Command(reading, 5, ["value", 0]).execute() == ["value"]
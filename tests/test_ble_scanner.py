@@ -0,0 +1,57 @@
+import time
+
+import ble_scanner
+import presence
+
+
+class FakeDevice:
+    def __init__(self, addr):
+        self.addr = addr
+
+
+class FakeScanner:
+    def __init__(self, events):
+        self.events = events
+
+    def clear(self):
+        self.events.append("clear")
+
+    def process(self, timeout):
+        self.events.append("process")
+        time.sleep(timeout)
+
+    def getDevices(self):
+        return [FakeDevice("aa:bb:cc:dd:ee:ff")]
+
+
+def patch_scan(monkeypatch, events, preemptions):
+    monkeypatch.setattr(ble_scanner, "SCAN_PREEMPTION_INTERVAL", 0.05)
+    monkeypatch.setattr(ble_scanner._HELPER_POOL, "start_scan", lambda scanner, passive=False: events.append("start"))
+    monkeypatch.setattr(ble_scanner._HELPER_POOL, "stop_scan", lambda scanner: events.append("stop"))
+    monkeypatch.setattr(
+        ble_scanner.workers_executor, "preemption_requested", lambda adapter: bool(preemptions)
+    )
+    monkeypatch.setattr(
+        ble_scanner.workers_executor, "preempt", lambda adapter: events.append(preemptions.pop())
+    )
+
+
+def test_scan_pauses_for_urgent_commands(monkeypatch):
+    events = []
+    preemptions = ["urgent"]
+    patch_scan(monkeypatch, events, preemptions)
+
+    ble_scanner.scan(FakeScanner(events), 0.08, adapter=7)
+
+    assert events == ["clear", "start", "process", "stop", "urgent", "start", "process", "stop"]
+
+
+def test_scan_records_found_devices(monkeypatch):
+    events = []
+    patch_scan(monkeypatch, events, [])
+
+    devices = ble_scanner.scan(FakeScanner(events), 0.04, adapter=8)
+
+    assert [device.addr for device in devices] == ["aa:bb:cc:dd:ee:ff"]
+    assert events == ["clear", "start", "process", "stop"]
+    assert presence.last_seen("AA:BB:CC:DD:EE:FF") is not None
@@ -0,0 +1,135 @@
+import pytest
+
+import bluepy_helpers
+from bluepy_helpers import HelperPool
+
+
+class FakePipe:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeHelper:
+    pid = 1234
+
+    def __init__(self):
+        self.returncode = None
+        self.stdin = FakePipe()
+        self.stdout = FakePipe()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self.returncode = 0
+        return 0
+
+    def kill(self):
+        self.returncode = -9
+
+
+class FakePoller:
+    def unregister(self, fd):
+        pass
+
+
+class FakePeripheral:
+    def __init__(self, answers=True):
+        self._helper = FakeHelper()
+        self._poller = FakePoller()
+        self._stderr = None
+        self._serviceMap = {"services": 1}
+        self.answers = answers
+        self.iface = 0
+        self.addr = None
+        self.timeouts = []
+
+    def setDelegate(self, delegate):
+        pass
+
+    def connect(self, mac, addr_type, iface):
+        self.addr = mac
+
+    def _writeCmd(self, cmd):
+        pass
+
+    def _getResp(self, want, timeout=None):
+        self.timeouts.append(timeout)
+        return {"state": ["disc"]} if self.answers else None
+
+    def _waitResp(self, want, timeout=None):
+        return self._getResp(want, timeout)
+
+
+@pytest.fixture
+def pool():
+    pool = HelperPool()
+    pool.configure({"idle": 1, "max_uses": 3})
+    return pool
+
+
+def connected(pool, peripheral, mac="aa:bb"):
+    """Connects the peripheral through the pool, as if it was made by it"""
+    idle = pool._idle.setdefault(peripheral.iface, [])
+    if peripheral not in idle:
+        idle.append(peripheral)
+    return pool.connect(mac, iface=peripheral.iface)
+
+
+def test_released_helper_is_reused(pool):
+    peripheral = connected(pool, FakePeripheral())
+    pool.release(peripheral)
+    assert peripheral._helper is not None
+    assert peripheral._serviceMap is None
+    assert pool.connect("cc:dd", iface=0) is peripheral
+
+
+def test_idle_helpers_are_limited(pool):
+    first, second = connected(pool, FakePeripheral()), connected(pool, FakePeripheral())
+    pool.release(first)
+    pool.release(second)
+    assert first._helper is not None
+    assert second._helper is None
+
+
+def test_worn_out_helpers_are_stopped(pool):
+    peripheral = FakePeripheral()
+    for _ in range(3):
+        peripheral = connected(pool, peripheral)
+        helper = peripheral._helper
+        pool.release(peripheral)
+    assert peripheral._helper is None
+    assert helper.stdin.written == ["quit\n"]
+
+
+def test_helper_not_answering_disconnect_is_stopped(pool):
+    peripheral = connected(pool, FakePeripheral())
+    peripheral.answers = False
+    pool.release(peripheral)
+    assert peripheral._helper is None
+    assert peripheral.timeouts[-1] is not None
+
+
+def test_timed_out_peripheral_is_not_reused(pool):
+    peripheral = connected(pool, FakePeripheral())
+    peripheral.timed_out = True
+    pool.release(peripheral)
+    assert peripheral._helper is None
+
+
+def test_helpers_are_pinged_before_reuse(pool, monkeypatch):
+    monkeypatch.setattr(bluepy_helpers, "_peripheral_class", lambda: FakePeripheral)
+    peripheral = connected(pool, FakePeripheral())
+    pool.release(peripheral)
+    peripheral.answers = False
+    assert pool.connect("cc:dd", iface=0) is not peripheral
+    assert peripheral._helper is None
@@ -0,0 +1,57 @@
+import time
+
+from circuit_breaker import STATE_CLOSED, STATE_OPEN, CircuitBreaker, CircuitBreakers
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(3, 60, 600)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(2, 60, 600)
+    breaker.record_failure()
+    assert not breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_zero_threshold_never_opens():
+    breaker = CircuitBreaker(0, 60, 600)
+    for _ in range(10):
+        assert not breaker.record_failure()
+    assert breaker.allow()
+
+
+def test_single_probe_after_delay_closes_circuit():
+    breaker = CircuitBreaker(1, 0.05, 600)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    # One probe at a time
+    assert not breaker.allow()
+    assert breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probes_back_off():
+    breaker = CircuitBreaker(1, 1, 5)
+    assert [breaker.delay(probes) for probes in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_breakers_are_shared_by_mac():
+    breakers = CircuitBreakers()
+    breakers.configure({"failure_threshold": 5})
+    assert breakers.get("aa:bb") is breakers.get("aa:bb")
+    assert breakers.get("aa:bb") is not breakers.get("aa:cc")
+    assert breakers.get("aa:bb").failure_threshold == 5
+
+
+def test_disabled_by_default():
+    assert CircuitBreakers().get("aa:bb").failure_threshold == 0
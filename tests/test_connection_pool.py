@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from connection_pool import ConnectionPool, _is_connected
+from const import HELPER_PING_TIMEOUT
+from exceptions import DeviceTimeoutError
+from timeouts import Deadline
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+        self.connected = True
+        self.timeouts = []
+
+    def _writeCmd(self, cmd):
+        pass
+
+    def _getResp(self, want, timeout):
+        self.timeouts.append(timeout)
+        return {"state": ["conn" if self.connected else "disc"]}
+
+
+class Devices:
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+
+    def connect(self, mac):
+        def connect():
+            connection = FakeConnection("{}#{}".format(mac, len(self.opened)))
+            self.opened.append(connection.name)
+            return connection
+
+        return connect
+
+    def disconnect(self, connection):
+        self.closed.append(connection.name)
+
+    def borrow(self, pool, mac, adapter=0):
+        return pool.connection(
+            mac, self.connect(mac), adapter=adapter, disconnect=self.disconnect, is_connected=lambda c: c.connected
+        )
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool()
+    pool.configure({"max_connections": 2, "idle_timeout": 30})
+    return pool
+
+
+def test_connections_are_reused(pool):
+    devices = Devices()
+    with devices.borrow(pool, "aa") as first:
+        pass
+    with devices.borrow(pool, "aa") as second:
+        pass
+    assert first is second
+    assert devices.opened == ["aa#0"]
+
+
+def test_unhealthy_connections_are_replaced(pool):
+    devices = Devices()
+    with devices.borrow(pool, "aa") as connection:
+        connection.connected = False
+    with devices.borrow(pool, "aa"):
+        pass
+    assert devices.opened == ["aa#0", "aa#1"]
+    assert devices.closed == ["aa#0"]
+
+
+def test_errors_drop_the_connection(pool):
+    devices = Devices()
+    with pytest.raises(IOError):
+        with devices.borrow(pool, "aa"):
+            raise IOError
+    assert devices.closed == ["aa#0"]
+
+
+def test_least_recently_used_is_evicted(pool):
+    devices = Devices()
+    for mac in ("aa", "bb", "aa", "cc"):
+        with devices.borrow(pool, mac):
+            pass
+    assert devices.closed == ["bb#1"]
+
+    with devices.borrow(pool, "dd", adapter=1):
+        pass
+    assert devices.closed == ["bb#1"]
+
+
+def test_idle_connections_expire(pool):
+    devices = Devices()
+    pool.configure({"idle_timeout": 0.05})
+    with devices.borrow(pool, "aa"):
+        pass
+    pool.expire()
+    assert devices.closed == []
+    time.sleep(0.06)
+    pool.expire()
+    assert devices.closed == ["aa#0"]
+
+
+def test_health_check_is_bound_by_the_deadline():
+    connection = FakeConnection("aa")
+    assert _is_connected(connection)
+    assert Deadline(0.5).run(DeviceTimeoutError, _is_connected, connection)
+    assert connection.timeouts[0] == HELPER_PING_TIMEOUT
+    assert 0 < connection.timeouts[1] <= 0.5
+
+    def late_check():
+        time.sleep(0.06)
+        return _is_connected(connection)
+
+    with pytest.raises(DeviceTimeoutError):
+        Deadline(0.05).run(DeviceTimeoutError, late_check)
+    assert len(connection.timeouts) == 2
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from daemons import DaemonSupervisor, OutputChannel
+
+
+class FakeMqtt:
+    def __init__(self):
+        self.batches = []
+
+    def publish(self, messages):
+        self.batches.append(list(messages))
+
+
+class CrashingDaemon:
+    def __init__(self, crashes):
+        self.crashes = crashes
+        self.runs = 0
+        self._stop = threading.Event()
+
+    def run(self, mqtt):
+        self.runs += 1
+        mqtt.publish(["run{}".format(self.runs)])
+        if self.runs <= self.crashes:
+            raise IOError("adapter gone")
+        self._stop.wait()
+
+    def stop(self):
+        self._stop.set()
+
+
+class StubbornDaemon:
+    def run(self, mqtt):
+        time.sleep(0.5)
+        mqtt.publish(["late"])
+
+
+def test_output_is_published_in_batches():
+    mqtt = FakeMqtt()
+    channel = OutputChannel(mqtt, flush_interval=0.05)
+    channel.start()
+    channel.publish(["a"])
+    channel.publish(["b", "c"])
+    time.sleep(0.1)
+    channel.stop()
+    assert mqtt.batches == [["a", "b", "c"]]
+
+
+def test_output_drops_oldest_beyond_max_pending():
+    mqtt = FakeMqtt()
+    channel = OutputChannel(mqtt, flush_interval=0.05, max_pending=2)
+    channel.publish(["a", "b", "c"])
+    channel.start()
+    channel.stop()
+    assert mqtt.batches == [["b", "c"]]
+
+
+def test_failed_daemons_are_restarted_with_backoff():
+    mqtt = FakeMqtt()
+    channel = OutputChannel(mqtt, flush_interval=0.01)
+    supervisor = DaemonSupervisor(channel, {"restart_base_delay": 0.05, "restart_max_delay": 1})
+    daemon = CrashingDaemon(2)
+    supervisor.add(daemon)
+    channel.start()
+    started = time.monotonic()
+    supervisor.start()
+    while daemon.runs < 3 and time.monotonic() - started < 2:
+        time.sleep(0.01)
+    # 0.05 then 0.1 seconds between the restarts
+    assert time.monotonic() - started >= 0.15
+    supervisor.stop()
+    channel.stop()
+
+    assert daemon.runs == 3
+    assert [message for batch in mqtt.batches for message in batch] == ["run1", "run2", "run3"]
+
+
+def test_output_of_abandoned_daemons_is_dropped():
+    mqtt = FakeMqtt()
+    channel = OutputChannel(mqtt, flush_interval=0.01)
+    supervisor = DaemonSupervisor(channel, {"stop_timeout": 0.05})
+    supervisor.add(StubbornDaemon())
+    channel.start()
+    supervisor.start()
+    supervisor.stop()
+    channel.stop()
+    time.sleep(0.6)
+    assert mqtt.batches == []
@@ -0,0 +1,69 @@
+from latency import BUCKETS, LatencyHistograms
+
+
+def histograms(**config):
+    latency = LatencyHistograms()
+    latency.configure(dict({"min_samples": 10, "floor": 1, "ceiling": 30, "margin": 2}, **config))
+    return latency
+
+
+def test_default_until_enough_samples():
+    latency = histograms()
+    for _ in range(9):
+        latency.record("aa:bb", 1)
+    assert latency.timeout("aa:bb", 8) == 8
+    latency.record("aa:bb", 1)
+    assert latency.timeout("aa:bb", 8) != 8
+
+
+def test_disabled_returns_default():
+    latency = LatencyHistograms()
+    for _ in range(20):
+        latency.record("aa:bb", 1)
+    assert latency.timeout("aa:bb", 8) == 8
+
+
+def test_timeout_is_percentile_times_margin():
+    latency = histograms(percentile=90)
+    for _ in range(90):
+        latency.record("aa:bb", 2)
+    for _ in range(10):
+        latency.record("aa:bb", 20)
+    bound = next(bound for bound in BUCKETS if bound >= 2)
+    assert latency.timeout("aa:bb", 8) == bound * 2
+
+
+def test_timeout_within_floor_and_ceiling():
+    latency = histograms()
+    for _ in range(10):
+        latency.record("fast", 0.01)
+        latency.record("slow", 100)
+    assert latency.timeout("fast", 8) == 1
+    assert latency.timeout("slow", 8) == 30
+
+
+def test_ceiling_after_timeout_until_success():
+    latency = histograms()
+    for _ in range(10):
+        latency.record("aa:bb", 1)
+    latency.record_timeout("aa:bb", 2)
+    assert latency.timeout("aa:bb", 8) == 30
+    latency.record("aa:bb", 1)
+    assert latency.timeout("aa:bb", 8) < 30
+
+
+def test_state_survives_restart(tmp_path):
+    state_file = str(tmp_path / "latency.json")
+    latency = histograms(state_file=state_file)
+    for _ in range(10):
+        latency.record("aa:bb", 1)
+    latency.save()
+
+    restarted = histograms(state_file=state_file)
+    assert restarted.timeout("aa:bb", 8) == latency.timeout("aa:bb", 8)
+
+
+def test_unreadable_state_is_ignored(tmp_path):
+    state_file = tmp_path / "latency.json"
+    state_file.write_text("{")
+    assert histograms(state_file=str(state_file)).timeout("aa:bb", 8) == 8
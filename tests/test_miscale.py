@@ -0,0 +1,39 @@
+import pytest
+
+from exceptions import DeviceTimeoutError
+from scan_service import AD_TYPE_SERVICE_DATA_16, Advertisement, ScanService
+from workers import miscale
+
+MAC = "00:00:00:00:21:01"
+
+
+@pytest.fixture
+def scan_service(monkeypatch):
+    service = ScanService()
+    service.scheduled = True
+    monkeypatch.setattr(miscale, "_SCAN_SERVICE", service)
+    return service
+
+
+@pytest.fixture
+def scale(scan_service):
+    return miscale.MiscaleWorker(35, 0, 0, None, mac=MAC, topic_prefix="scale")
+
+
+def weighing(scan_service, weight):
+    data = b"\x1d\x18\x22" + weight.to_bytes(2, "little")
+    scan_service.received(Advertisement(MAC.lower(), -60, {AD_TYPE_SERVICE_DATA_16: data}, 0))
+
+
+def test_no_measurement_advertised(scale):
+    with pytest.raises(DeviceTimeoutError):
+        scale.status_update()
+
+
+def test_measurement_is_published_once(scan_service, scale):
+    weighing(scan_service, 14000)
+    assert [(message.topic, message.raw_payload) for message in scale.status_update()] == [("scale/weight/kg", 70.0)]
+    assert scale.status_update() == []
+
+    weighing(scan_service, 14200)
+    assert [message.raw_payload for message in scale.status_update()] == [71.0]
@@ -0,0 +1,86 @@
+import json
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from mqtt import MqttClient, MqttMessage
+
+
+class FakeInfo:
+    def __init__(self, rc, published):
+        self.rc = rc
+        self.published = published
+
+    def is_published(self):
+        return self.published
+
+
+class FakeClient:
+    def __init__(self):
+        self.connected = False
+        self.acknowledged = True
+        self.sent = []
+
+    def publish(self, topic, payload, retain=False):
+        if not self.connected:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN, False)
+        self.sent.append((topic, payload, retain))
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS, self.acknowledged)
+
+    def disconnect(self):
+        self.connected = False
+
+    def loop_stop(self):
+        pass
+
+
+@pytest.fixture
+def client():
+    def create(**config):
+        client = MqttClient(dict({"host": "localhost", "topic_prefix": "gw", "flush_timeout": 0.1}, **config))
+        client._mqttc = FakeClient()
+        return client
+
+    return create
+
+
+def test_publishes_failed_while_disconnected_are_replayed(client):
+    mqtt_client = client()
+    mqtt_client.publish([MqttMessage("a", "1"), MqttMessage("b", "2", retain=True)])
+    assert mqtt_client.mqttc.sent == []
+
+    mqtt_client.mqttc.connected = True
+    mqtt_client.on_connect(None, None, None, 0)
+    assert mqtt_client.mqttc.sent == [("gw/a", "1", False), ("gw/b", "2", True)]
+
+    mqtt_client.on_connect(None, None, None, 0)
+    assert len(mqtt_client.mqttc.sent) == 2
+
+
+def test_unsent_messages_are_saved_and_published_after_restart(client, tmp_path):
+    spool_file = str(tmp_path / "unsent.json")
+    mqtt_client = client(spool_file=spool_file)
+    mqtt_client.publish([MqttMessage("offline", "1")])
+    mqtt_client.mqttc.connected = True
+    mqtt_client.mqttc.acknowledged = False
+    mqtt_client.publish([MqttMessage("pending", "2")])
+    mqtt_client.stop()
+
+    with open(spool_file) as f:
+        assert json.load(f) == [["gw/offline", "1", False], ["gw/pending", "2", False]]
+
+    restarted = client(spool_file=spool_file)
+    restarted.mqttc.connected = True
+    restarted.on_connect(None, None, None, 0)
+    assert restarted.mqttc.sent == [("gw/offline", "1", False), ("gw/pending", "2", False)]
+
+
+def test_flush_returns_unacknowledged_messages(client):
+    mqtt_client = client()
+    mqtt_client.mqttc.connected = True
+    mqtt_client.publish([MqttMessage("a", "1")])
+    assert mqtt_client.flush(0.1) == []
+
+    mqtt_client.mqttc.acknowledged = False
+    mqtt_client.publish([MqttMessage("b", "2")])
+    assert mqtt_client.flush(0.1) == [("gw/b", "2", False)]
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+import presence
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(presence, "_LAST_SEEN", {})
+    monkeypatch.setattr(presence, "_LAST_SCAN", {})
+
+
+def test_unknown_without_recent_scan():
+    assert not presence.absent("AA:BB", 0, 60)
+
+
+def test_absent_when_scan_missed_the_device():
+    presence.scanned(0, ["cc:dd"])
+    assert presence.absent("AA:BB", 0, 60)
+    assert not presence.absent("CC:DD", 0, 60)
+
+
+def test_scans_of_other_adapters_dont_count():
+    presence.scanned(1, [])
+    assert not presence.absent("AA:BB", 0, 60)
+
+
+def test_seen_devices_are_present():
+    presence.scanned(0, [])
+    presence.seen("AA:BB")
+    assert not presence.absent("aa:bb", 0, 60)
+    assert presence.last_seen("aa:bb") is not None
+
+
+def test_devices_not_seen_within_window_are_absent():
+    presence.seen("AA:BB")
+    time.sleep(0.06)
+    presence.scanned(0, [])
+    assert presence.absent("AA:BB", 0, 0.05)
@@ -0,0 +1,83 @@
+import pytest
+
+import retries
+from timeouts import Deadline
+from workers_manager import WorkersManager
+from workers_queue import WorkersQueue
+
+
+def flaky(failures):
+    def read(value):
+        read.calls += 1
+        if read.calls <= failures:
+            raise IOError("unreachable")
+        return [value]
+
+    read.calls = 0
+    return read
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    queue = WorkersQueue()
+    monkeypatch.setattr(retries, "_WORKERS_QUEUE", queue)
+    policy = retries.RetryPolicy()
+    policy.configure({"base_delay": 0.01, "max_delay": 0.02, "budget": 2})
+    policy.queue = queue
+    return policy
+
+
+def test_retries_inline_without_command(policy):
+    func = flaky(1)
+    assert policy.call(func, ["value"], {}, 1, IOError) == ["value"]
+    assert func.calls == 2
+
+
+def test_raises_once_retries_are_exhausted(policy):
+    func = flaky(2)
+    with pytest.raises(IOError):
+        policy.call(func, ["value"], {}, 1, IOError)
+    assert func.calls == 2
+
+
+def test_retry_is_queued_under_a_command(policy):
+    func = flaky(1)
+    command = WorkersManager.Command(policy.call, 5, [func, ["value"], {}, 1, IOError])
+    deadline = Deadline(5, owner=command)
+
+    assert deadline.run(IOError, policy.call, func, ["value"], {}, 1, IOError) == []
+    assert deadline.retries_scheduled == 1
+    assert func.calls == 1
+
+    retry = policy.queue.get(timeout=1)
+    assert retry.execute() == ["value"]
+    assert func.calls == 2
+
+
+def test_failed_retry_is_logged_not_raised(policy):
+    func = flaky(2)
+    command = WorkersManager.Command(policy.call, 5, [func, ["value"], {}, 1, IOError])
+    Deadline(5, owner=command).run(IOError, policy.call, func, ["value"], {}, 1, IOError)
+
+    assert policy.queue.get(timeout=1).execute() == []
+    assert func.calls == 2
+
+
+def test_budget_limits_retries_per_device(policy):
+    command = WorkersManager.Command(policy.call, 5)
+    deadline = Deadline(5, owner=command)
+    func = flaky(10)
+    for _ in range(2):
+        deadline.run(IOError, policy.call, func, ["value"], {}, 5, IOError)
+
+    with pytest.raises(IOError):
+        deadline.run(IOError, policy.call, func, ["value"], {}, 5, IOError)
+    # Other devices have budgets of their own
+    assert deadline.run(IOError, policy.call, func, ["other"], {}, 5, IOError) == []
+
+
+def test_backoff_is_bounded():
+    policy = retries.RetryPolicy()
+    policy.configure({"base_delay": 1, "max_delay": 5})
+    for attempt in range(1, 10):
+        assert 1 <= policy.backoff(attempt) <= 5
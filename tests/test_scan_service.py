@@ -0,0 +1,158 @@
+import struct
+import time
+
+from scan_service import (
+    AD_TYPE_MANUFACTURER_DATA,
+    AD_TYPE_SERVICE_DATA_16,
+    Advertisement,
+    ScanService,
+    _Delegate,
+    register_decoder,
+)
+from workers import lywsd03mmc, miscale, toothbrush
+
+
+class FakeWorker:
+    def __init__(self, adapter=0):
+        self.adapter = adapter
+
+
+def advertisement(mac, data=b"\x1a\x18\x01", adapter=0, ad_type=AD_TYPE_SERVICE_DATA_16):
+    return Advertisement(mac, -60, {ad_type: data}, adapter)
+
+
+def test_subscriptions_define_scanned_adapters_and_windows():
+    service = ScanService()
+    service.subscribe(FakeWorker(0), ["AA:BB"], window=5)
+    service.subscribe(FakeWorker(0), ["CC:DD"], window=10)
+    service.subscribe(FakeWorker(1), ["EE:FF"], window=3)
+    assert service.adapters() == [0, 1]
+    assert service.window(0) == 10
+    assert service.window(1) == 3
+
+
+def test_latest_advertisement_within_scan_cycle():
+    service = ScanService()
+    service.configure({"interval": 60})
+    service.subscribe(FakeWorker(), ["AA:BB"], window=5)
+    assert service.latest("AA:BB") is None
+
+    received = advertisement("aa:bb")
+    service.received(received)
+    assert service.latest("AA:BB") is received
+    assert service.latest("aa:bb", max_age=0) is None
+
+
+def test_callbacks_get_matching_advertisements():
+    service = ScanService()
+    received = []
+    service.subscribe(FakeWorker(), ["AA:BB"], uuids=[0x181A], callback=received.append)
+    service.subscribe(FakeWorker(1), ["AA:BB"], callback=lambda adv: received.append("other adapter"))
+
+    matching = advertisement("aa:bb")
+    service.received(matching)
+    service.received(advertisement("aa:bb", b"\x1b\x18\x01"))
+    assert received == [matching]
+
+
+def test_failing_callbacks_are_contained():
+    service = ScanService()
+    received = []
+
+    def fail(adv):
+        raise ValueError
+
+    service.subscribe(FakeWorker(), ["AA:BB"], callback=fail)
+    service.subscribe(FakeWorker(), ["AA:BB"], callback=received.append)
+    service.received(advertisement("aa:bb"))
+    assert len(received) == 1
+
+
+def test_refresh_scans_unless_scheduled(monkeypatch):
+    service = ScanService()
+    scans = []
+    monkeypatch.setattr(service, "scan", scans.append)
+    service.refresh(0)
+    service.scheduled = True
+    service.refresh(0)
+    assert scans == [0]
+
+
+def test_decoders_get_data_following_the_key():
+    register_decoder(AD_TYPE_MANUFACTURER_DATA, 0xFFF0, lambda payload, adv: bytes(payload))
+    received = advertisement("aa:bb", b"\xf0\xff\x01\x02", ad_type=AD_TYPE_MANUFACTURER_DATA)
+    assert received.key(AD_TYPE_MANUFACTURER_DATA) == 0xFFF0
+    assert received.decode(AD_TYPE_MANUFACTURER_DATA, 0xFFF0) == b"\x01\x02"
+    assert received.decode(AD_TYPE_MANUFACTURER_DATA, 0xFFF1) is None
+    assert received.decode(AD_TYPE_SERVICE_DATA_16, 0xFFF0) is None
+
+
+def test_undecodable_data_is_ignored():
+    register_decoder(AD_TYPE_SERVICE_DATA_16, 0xFFF2, lambda payload, adv: struct.unpack_from("<I", payload))
+    assert advertisement("aa:bb", b"\xf2\xff\x01").decode(AD_TYPE_SERVICE_DATA_16, 0xFFF2) is None
+    assert advertisement("aa:bb", b"\xf2").key(AD_TYPE_SERVICE_DATA_16) is None
+
+
+def test_miscale_decoders():
+    v1 = advertisement("aa:bb", b"\x1d\x18\x22" + (14000).to_bytes(2, "little"))
+    assert v1.decode(AD_TYPE_SERVICE_DATA_16, miscale.WEIGHT_SCALE_UUID) == (70.0, "kg")
+
+    v2 = advertisement("aa:bb", b"\x1b\x18\x02\x00" + struct.pack("<H5BHH", 2020, 5, 17, 8, 30, 15, 480, 14000))
+    assert v2.decode(AD_TYPE_SERVICE_DATA_16, miscale.BODY_COMPOSITION_UUID) == (70.0, "kg", 480, "2020-05-17 08:30:15")
+
+
+def test_lywsd03mmc_decoder_formats():
+    mac = "a4:c1:38:01:02:03"
+    uuid = lywsd03mmc.ENVIRONMENTAL_SENSING_UUID
+    custom = struct.pack("<6shHHB", bytes.fromhex("030201" + "38c1a4"), 2150, 4520, 2950, 80)
+    decoded = advertisement(mac, b"\x1a\x18" + custom).decode(AD_TYPE_SERVICE_DATA_16, uuid)
+    assert decoded == (21.5, 45.2, 80, 2950)
+
+    atc = struct.pack(">6shBHH", bytes.fromhex("a4c138010203"), 215, 45, 80, 2950)
+    decoded = advertisement(mac, b"\x1a\x18" + atc).decode(AD_TYPE_SERVICE_DATA_16, uuid)
+    assert decoded == (21.5, 45, 2950, 80)
+
+
+def test_toothbrush_decoder():
+    data = b"\xdc\x00" + bytes([2, 1, 3, 3, 0, 2, 16, 1, 4])
+    received = advertisement("aa:bb", data, ad_type=AD_TYPE_MANUFACTURER_DATA)
+    assert received.decode(AD_TYPE_MANUFACTURER_DATA, toothbrush.ORAL_B_COMPANY_ID) == (3, 0, 136, 1, 4)
+
+
+class FakeEntry:
+    def __init__(self, addr):
+        self.addr = addr
+        self.rssi = -70
+        self.scanData = {AD_TYPE_SERVICE_DATA_16: b"\x1a\x18\x01"}
+
+
+def test_foreign_devices_are_dropped():
+    service = ScanService()
+    service.subscribe(FakeWorker(), ["AA:BB"])
+    delegate = _Delegate(service, 0)
+    delegate.handleDiscovery(FakeEntry("CC:DD"), True, False)
+    delegate.handleDiscovery(FakeEntry("AA:BB"), True, False)
+    assert service.latest("cc:dd") is None
+    assert service.latest("aa:bb") is not None
+
+    service.subscribe(FakeWorker(), [])
+    delegate.handleDiscovery(FakeEntry("CC:DD"), True, False)
+    assert service.latest("cc:dd") is not None
+
+
+def test_repeated_data_is_dispatched_once_within_window():
+    service = ScanService()
+    service.configure({"dedup_window": 0.05})
+    received = []
+    service.subscribe(FakeWorker(), ["AA:BB"], callback=received.append)
+
+    service.received(advertisement("aa:bb"))
+    service.received(advertisement("aa:bb"))
+    service.received(advertisement("aa:bb", b"\x1a\x18\x02"))
+    assert len(received) == 2
+    # Still kept as the latest advertisement
+    assert service.latest("aa:bb").raw_data[AD_TYPE_SERVICE_DATA_16] == b"\x1a\x18\x02"
+
+    time.sleep(0.06)
+    service.received(advertisement("aa:bb", b"\x1a\x18\x02"))
+    assert len(received) == 3
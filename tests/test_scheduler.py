@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import Scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler()
+    scheduler.start()
+    yield scheduler
+    scheduler.shutdown()
+
+
+def recorder():
+    runs = []
+
+    def run():
+        runs.append(time.monotonic())
+
+    run.runs = runs
+    return run
+
+
+def test_jobs_run_every_interval(scheduler):
+    job = recorder()
+    started = time.monotonic()
+    scheduler.add_job(job, 0.05, "job")
+    time.sleep(0.28)
+    assert 4 <= len(job.runs) <= 6
+    assert job.runs[0] - started >= 0.05
+
+
+def test_first_run(scheduler):
+    job = recorder()
+    scheduler.add_job(job, 10, "job", first_run=0)
+    time.sleep(0.05)
+    assert len(job.runs) == 1
+
+
+def test_replaced_job_runs_once(scheduler):
+    old, new = recorder(), recorder()
+    scheduler.add_job(old, 0.05, "job")
+    scheduler.add_job(new, 0.05, "job")
+    time.sleep(0.08)
+    assert old.runs == []
+    assert len(new.runs) == 1
+    assert [job.func for job in scheduler.get_jobs()] == [new]
+
+
+def test_removed_job_stops(scheduler):
+    job = recorder()
+    scheduler.add_job(job, 0.03, "job", first_run=0)
+    time.sleep(0.01)
+    scheduler.remove_job("job")
+    time.sleep(0.1)
+    assert len(job.runs) == 1
+    assert scheduler.get_jobs() == []
+
+
+def test_delayed_job_doesnt_catch_up(scheduler):
+    job = recorder()
+    busy = threading.Event()
+
+    def blocking():
+        if not busy.is_set():
+            busy.set()
+            time.sleep(0.2)
+
+    scheduler.add_job(blocking, 10, "blocking", first_run=0)
+    busy.wait(1)
+    scheduler.add_job(job, 0.02, "job", first_run=0)
+    time.sleep(0.25)
+    # Ran once when the blocking job returned, then every interval again
+    assert len(job.runs) < 5
+
+
+def test_failing_job_keeps_running(scheduler):
+    runs = []
+
+    def fail():
+        runs.append(1)
+        raise ValueError
+
+    scheduler.add_job(fail, 0.03, "job", first_run=0)
+    time.sleep(0.08)
+    assert len(runs) >= 2
+
+
+def test_jitter_delays_runs(scheduler):
+    job = recorder()
+    started = time.monotonic()
+    scheduler.add_job(job, 10, "job", first_run=0, jitter=0.05)
+    time.sleep(0.1)
+    assert len(job.runs) == 1
+    assert job.runs[0] - started <= 0.1
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from timeouts import Deadline, blocking_timeout, call_with_timeout, current_deadline, remaining
+
+
+class Expired(Exception):
+    pass
+
+
+def test_child_never_outlives_parent():
+    parent = Deadline(1)
+    assert parent.child(10).expires_at == parent.expires_at
+    assert parent.child(0.5).expires_at < parent.expires_at
+    assert parent.child().expires_at == parent.expires_at
+
+
+def test_cancelling_parent_cancels_children():
+    parent = Deadline()
+    child = parent.child(10)
+    parent.cancel()
+    assert child.cancelled
+    with pytest.raises(Expired):
+        child.check(Expired)
+
+
+def test_run_sets_current_deadline():
+    deadline = Deadline(5)
+    assert current_deadline() is None
+    assert deadline.run(Expired, current_deadline) is deadline
+    assert current_deadline() is None
+
+
+def test_run_raises_when_call_ends_late():
+    with pytest.raises(Expired):
+        call_with_timeout(0.05, Expired, time.sleep, 0.1)
+
+
+def test_run_converts_failures_after_expiry():
+    def fail():
+        time.sleep(0.1)
+        raise ValueError
+
+    with pytest.raises(Expired):
+        call_with_timeout(0.05, Expired, fail)
+    with pytest.raises(ValueError):
+        call_with_timeout(5, Expired, fail)
+
+
+def test_nothing_starts_after_expiry():
+    calls = []
+    deadline = Deadline(0)
+    with pytest.raises(Expired):
+        deadline.run(Expired, calls.append, 1)
+    assert calls == []
+
+
+def test_remaining_is_capped_by_nested_deadlines():
+    assert remaining(3) == 3
+    assert remaining() is None
+    assert call_with_timeout(1, Expired, remaining, 3) <= 1
+    assert call_with_timeout(5, Expired, call_with_timeout, 1, Expired, remaining) <= 1
+
+
+def test_blocking_timeout_never_returns_zero():
+    def wait():
+        time.sleep(0.1)
+        return blocking_timeout(5, Expired)
+
+    with pytest.raises(Expired):
+        Deadline(0.05).run(Expired, wait)
+
+    cancelled = Deadline(5)
+    cancelled.cancel()
+    with pytest.raises(Expired):
+        Deadline(5).run(Expired, cancelled.run, Expired, blocking_timeout, 5, Expired)
+
+
+def test_cooperative_loop_is_bound():
+    def hang():
+        while True:
+            time.sleep(blocking_timeout(0.01, Expired))
+
+    started = time.monotonic()
+    with pytest.raises(Expired):
+        call_with_timeout(0.1, Expired, hang)
+    assert time.monotonic() - started < 1
+
+
+def test_iterate_runs_each_step_under_the_deadline():
+    deadline = Deadline(5)
+
+    def steps():
+        yield current_deadline()
+        yield current_deadline()
+
+    assert list(deadline.iterate(Expired, steps())) == [deadline, deadline]
+
+
+def test_retries_are_counted_on_parents():
+    parent = Deadline()
+    child = parent.child(1)
+    child.retry_scheduled()
+    assert child.retries_scheduled == 1
+    assert parent.retries_scheduled == 1
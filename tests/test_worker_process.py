@@ -0,0 +1,86 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from exceptions import DeviceTimeoutError, IsolatedWorkerError
+from mqtt import MqttMessage
+from timeouts import Deadline
+from worker_process import isolated_worker
+from workers.base import BaseWorker
+
+
+class ChildWorker(BaseWorker):
+    def status_update(self):
+        return [MqttMessage(topic=self.format_topic("pid"), payload=os.getpid())]
+
+    def update_device(self, name):
+        if name == "crash":
+            os._exit(3)
+        if name == "hang":
+            time.sleep(10)
+        if name == "fail":
+            raise KeyError(name)
+        yield [MqttMessage(topic=self.format_topic(name), payload=1)]
+        yield [MqttMessage(topic=self.format_topic(name), payload=2)]
+
+    async def on_command(self, topic, value):
+        await asyncio.sleep(0)
+        return [MqttMessage(topic=self.format_topic("loop"), payload=id(asyncio.get_event_loop()))]
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    # The child process imports this module to create the worker
+    monkeypatch.setenv("PYTHONPATH", os.path.dirname(os.path.abspath(__file__)))
+    worker = isolated_worker(ChildWorker, "child", 5, 0, 0, None, topic_prefix="child", devices={})
+    yield worker
+    worker.stop()
+
+
+def payloads(messages):
+    return [message.raw_payload for message in messages]
+
+
+def test_worker_runs_in_child_process(worker):
+    assert payloads(worker.status_update()) != [os.getpid()]
+    assert payloads(worker.status_update()) == payloads(worker.status_update())
+
+
+def test_generator_results_are_streamed(worker):
+    assert [payloads(messages) for messages in worker.update_device("a") if messages] == [[1], [2]]
+
+
+def test_errors_are_raised_in_the_gateway(worker):
+    with pytest.raises(IsolatedWorkerError, match="KeyError"):
+        list(worker.update_device("fail"))
+
+
+def test_died_process_is_restarted(worker):
+    pid = payloads(worker.status_update())
+    with pytest.raises(IsolatedWorkerError, match="ProcessDied"):
+        list(worker.update_device("crash"))
+    assert payloads(worker.status_update()) != pid
+
+
+def test_hanging_process_is_restarted_after_deadline(worker):
+    pid = payloads(worker.status_update())
+    started = time.monotonic()
+    with pytest.raises(DeviceTimeoutError):
+        Deadline(0.3).run(DeviceTimeoutError, lambda: list(worker.update_device("hang")))
+    assert time.monotonic() - started < 3
+    assert payloads(worker.status_update()) != pid
+
+
+def test_coroutines_share_one_event_loop(worker):
+    assert payloads(worker.on_command("topic", "value")) == payloads(worker.on_command("topic", "value"))
+
+
+def test_update_timeout_stays_in_the_gateway():
+    class TimedWorker(ChildWorker):
+        update_timeout = 7
+
+    worker = isolated_worker(TimedWorker, "timed", 5, 0, 0, None, topic_prefix="timed", devices={})
+    assert worker.update_timeout == 7
+    assert worker._process is None
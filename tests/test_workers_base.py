@@ -0,0 +1,53 @@
+import time
+
+from workers.base import (
+    ORDER_CONFIG,
+    ORDER_FASTEST_FIRST,
+    ORDER_MOST_STALE_FIRST,
+    ORDER_ROUND_ROBIN,
+    BaseWorker,
+)
+
+
+def worker(order):
+    worker = BaseWorker(35, 0, 0, None, topic_prefix="test", devices={"a": {}, "b": {}, "c": {}})
+    worker.device_order = order
+    return worker
+
+
+def update(worker, name, seconds=0):
+    with worker.device_update(name):
+        time.sleep(seconds)
+
+
+def test_config_order():
+    assert worker(ORDER_CONFIG).ordered_devices() == ["a", "b", "c"]
+
+
+def test_round_robin_starts_one_device_further():
+    ordered = worker(ORDER_ROUND_ROBIN)
+    assert ordered.ordered_devices() == ["a", "b", "c"]
+    assert ordered.ordered_devices() == ["b", "c", "a"]
+    assert ordered.ordered_devices() == ["c", "a", "b"]
+    assert ordered.ordered_devices() == ["a", "b", "c"]
+
+
+def test_fastest_first_measures_new_devices_first():
+    ordered = worker(ORDER_FASTEST_FIRST)
+    update(ordered, "a", 0.03)
+    update(ordered, "b", 0.01)
+    assert ordered.ordered_devices() == ["c", "b", "a"]
+
+
+def test_most_stale_first():
+    ordered = worker(ORDER_MOST_STALE_FIRST)
+    update(ordered, "b")
+    update(ordered, "a")
+    assert ordered.ordered_devices() == ["c", "b", "a"]
+
+
+def test_device_key_is_the_mac():
+    devices = BaseWorker(35, 0, 0, None, topic_prefix="test", devices={"a": "AA:BB", "b": {"mac": "CC:DD"}, "c": {}})
+    assert devices.device_key("a") == "aa:bb"
+    assert devices.device_key("b") == "cc:dd"
+    assert devices.device_key("c") == "{}/c".format(repr(devices))
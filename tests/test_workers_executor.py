@@ -0,0 +1,93 @@
+import threading
+import time
+
+from exceptions import DeviceTimeoutError
+from workers_executor import AdapterSlot, WorkersExecutor
+from workers_queue import PRIORITY_COMMAND, PRIORITY_UPDATE
+
+
+class FakeMqtt:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, messages):
+        self.published.extend(messages)
+
+
+class FakeCommand:
+    def __init__(self, results, adapter=None, priority=PRIORITY_UPDATE):
+        self.results = results
+        self.adapter = adapter
+        self.priority = priority
+
+    def stream(self):
+        for result in self.results:
+            if isinstance(result, Exception):
+                raise result
+            yield result
+
+
+def test_adapter_slot_limits_concurrency():
+    slot = AdapterSlot(2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def use():
+        with slot.acquire():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=use) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+
+
+def test_adapter_slot_tracks_urgent_waiters():
+    slot = AdapterSlot(1)
+    acquired = threading.Event()
+
+    def urgent():
+        with slot.acquire(urgent=True):
+            acquired.set()
+
+    with slot.acquire():
+        thread = threading.Thread(target=urgent)
+        thread.start()
+        for _ in range(100):
+            if slot.urgent_waiting:
+                break
+            time.sleep(0.01)
+        assert slot.urgent_waiting
+        assert not acquired.is_set()
+
+    thread.join(1)
+    assert acquired.is_set()
+    assert not slot.urgent_waiting
+
+
+def test_execute_publishes_every_batch():
+    mqtt = FakeMqtt()
+    executor = WorkersExecutor({}, mqtt)
+    executor.execute(FakeCommand([["a"], ["b", "c"]], adapter="hci0", priority=PRIORITY_COMMAND))
+    assert mqtt.published == ["a", "b", "c"]
+
+
+def test_execute_contains_timeouts():
+    mqtt = FakeMqtt()
+    executor = WorkersExecutor({}, mqtt)
+    executor.execute(FakeCommand([["a"], DeviceTimeoutError()]))
+    assert mqtt.published == ["a"]
+
+
+def test_threaded_when_configured_with_several_workers():
+    assert not WorkersExecutor({}, FakeMqtt()).threaded
+    assert WorkersExecutor({"workers": 3}, FakeMqtt()).threaded
@@ -0,0 +1,176 @@
+import sys
+import time
+import types
+
+import pytest
+
+import circuit_breaker
+import presence
+import workers_manager
+from exceptions import DeviceTimeoutError, WorkerTimeoutError
+from mqtt import MqttMessage
+from timeouts import Deadline, blocking_timeout, current_deadline
+from workers.base import BaseWorker
+from workers_manager import WorkersManager
+from workers_queue import WorkersQueue
+
+
+class FakeMqtt:
+    availability_topic = "lwt"
+
+    def publish(self, messages):
+        pass
+
+    def callbacks_subscription(self, callbacks):
+        pass
+
+
+def register(monkeypatch, klass, worker_config, config=None):
+    """Manager with the worker class registered as the 'fake' worker"""
+    module = types.ModuleType("workers.fake")
+    module.FakeWorker = klass
+    monkeypatch.setitem(sys.modules, "workers.fake", module)
+    config = dict(config or {}, workers={"fake": dict({"args": {"topic_prefix": "fake"}}, **worker_config)})
+    manager = WorkersManager(config, FakeMqtt())
+    manager.register_workers(None)
+    return manager
+
+
+def device_worker(manager):
+    return manager._device_commands[0][0]
+
+
+def updates():
+    yield ["first"]
+    yield ["second"]
+
+
+def slow_updates():
+    yield ["first"]
+    while True:
+        time.sleep(blocking_timeout(0.01, DeviceTimeoutError))
+
+
+def test_generator_results_are_streamed_per_chunk():
+    stream = WorkersManager.Command(updates, 5).stream()
+    assert next(stream) == ["first"]
+    assert next(stream) == ["second"]
+    assert WorkersManager.Command(updates, 5).execute() == ["first", "second"]
+
+
+def test_partial_results_are_kept_on_timeout():
+    assert WorkersManager.Command(slow_updates, 0.1).execute() == ["first"]
+
+
+def test_timeout_without_results_is_raised():
+    def hang():
+        while True:
+            time.sleep(blocking_timeout(0.01, DeviceTimeoutError))
+
+    with pytest.raises(WorkerTimeoutError):
+        WorkersManager.Command(hang, 0.1).execute()
+
+
+class TimedWorker(BaseWorker):
+    update_timeout = 3
+
+    def update_device(self, name):
+        self.deadlines = getattr(self, "deadlines", []) + [current_deadline().seconds]
+        return [MqttMessage(topic=self.format_topic(name), payload=1)]
+
+
+def test_devices_get_a_command_each(monkeypatch):
+    worker_config = {"args": {"topic_prefix": "fake", "devices": {"a": {}, "b": {}}}, "update_interval": 60}
+    manager = register(monkeypatch, TimedWorker, worker_config)
+    worker, commands = manager._device_commands[0]
+    assert sorted(commands) == ["a", "b"]
+    assert commands["a"].key != commands["b"].key
+
+
+def test_update_timeout_is_applied_once_by_the_manager(monkeypatch):
+    manager = register(monkeypatch, TimedWorker, {"args": {"topic_prefix": "fake", "devices": {"a": {}}}})
+    worker = device_worker(manager)
+    messages = manager._update_device(worker, "a")
+    assert [message.topic for message in messages] == ["fake/a"]
+    assert worker.deadlines == [3]
+
+
+class FlakyWorker(BaseWorker):
+    def update_device(self, name):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        if result == "retry":
+            current_deadline().retry_scheduled()
+            return []
+        return result
+
+
+def flaky_manager(monkeypatch, mac, results):
+    monkeypatch.setattr(circuit_breaker._CIRCUIT_BREAKERS, "failure_threshold", 2)
+    manager = register(monkeypatch, FlakyWorker, {"args": {"topic_prefix": "fake", "devices": {"a": mac}}})
+    worker = device_worker(manager)
+    worker.results = results
+
+    def update():
+        return Deadline(5).run(WorkerTimeoutError, manager._update_device, worker, "a")
+
+    return update
+
+
+def test_empty_updates_close_the_circuit(monkeypatch):
+    update = flaky_manager(monkeypatch, "00:00:00:00:10:01", [IOError(), [], IOError(), []])
+    for _ in range(4):
+        assert update() == []
+    assert circuit_breaker._CIRCUIT_BREAKERS.get("00:00:00:00:10:01").state == circuit_breaker.STATE_CLOSED
+
+
+def test_updates_queueing_a_retry_are_no_success(monkeypatch):
+    update = flaky_manager(monkeypatch, "00:00:00:00:10:02", [IOError(), "retry", IOError()])
+    update()
+    update()
+    messages = update()
+    assert [(message.topic, message.payload) for message in messages] == [("fake/a/circuit", "open")]
+
+
+def test_absent_devices_are_skipped(monkeypatch):
+    monkeypatch.setattr(presence, "_LAST_SCAN", {})
+    monkeypatch.setattr(presence, "_LAST_SEEN", {})
+    config = {"args": {"topic_prefix": "fake", "devices": {"a": "00:00:00:00:11:01"}}, "presence_window": 60}
+    manager = register(monkeypatch, TimedWorker, config)
+    worker = device_worker(manager)
+
+    presence.scanned(worker.adapter, [])
+    assert manager._update_device(worker, "a") == []
+    assert not hasattr(worker, "deadlines")
+
+    presence.scanned(worker.adapter, ["00:00:00:00:11:01"])
+    assert len(manager._update_device(worker, "a")) == 1
+
+
+def test_device_jobs_are_staggered_and_jittered(monkeypatch):
+    devices = {"a": {}, "b": {}, "c": {}, "d": {}}
+    started = time.monotonic()
+    manager = register(
+        monkeypatch, TimedWorker, {"args": {"topic_prefix": "fake", "devices": devices}, "update_interval": 60}
+    )
+    jobs = manager._scheduler.get_jobs()
+    first_runs = sorted(job.due - started for job in jobs)
+    assert len(first_runs) == 4
+    assert 30 <= first_runs[0] and first_runs[-1] <= 91
+    assert min(b - a for a, b in zip(first_runs, first_runs[1:])) > 5
+    assert all(job.jitter == 60 * 0.05 for job in jobs)
+
+
+def test_update_all_ramps_up(monkeypatch):
+    queue = WorkersQueue()
+    monkeypatch.setattr(workers_manager, "_WORKERS_QUEUE", queue)
+    devices = {"a": {}, "b": {}, "c": {}}
+    config = {"scheduler": {"startup_ramp": 0.1}}
+    manager = register(monkeypatch, TimedWorker, {"args": {"topic_prefix": "fake", "devices": devices}}, config)
+    commands = manager._device_commands[0][1]
+
+    manager.update_all()
+    assert queue.qsize() == 1
+    time.sleep(0.1)
+    assert [queue.get(timeout=0) for _ in range(3)] == [commands[name] for name in "abc"]
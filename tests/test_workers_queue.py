@@ -0,0 +1,140 @@
+import time
+from queue import Empty
+
+import pytest
+
+from workers_queue import (
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_MERGE,
+    OVERFLOW_REJECT,
+    PRIORITY_COMMAND,
+    PRIORITY_CONFIG,
+    PRIORITY_UPDATE,
+    WorkersQueue,
+)
+
+
+class FakeCommand:
+    def __init__(self, key, priority=PRIORITY_UPDATE, adapter=None, group=None):
+        self.key = key
+        self.priority = priority
+        self.adapter = adapter
+        self.group = group
+
+    def __repr__(self):
+        return self.key
+
+
+def drain(queue):
+    commands = []
+    while queue.qsize():
+        commands.append(queue.get(timeout=0).key)
+    return commands
+
+
+def test_higher_priorities_are_served_first():
+    queue = WorkersQueue()
+    queue.put(FakeCommand("update"))
+    queue.put(FakeCommand("config", PRIORITY_CONFIG))
+    queue.put(FakeCommand("command", PRIORITY_COMMAND))
+    queue.put(FakeCommand("update2"))
+    assert drain(queue) == ["command", "config", "update", "update2"]
+
+
+def test_starving_commands_are_served_first():
+    queue = WorkersQueue(starvation_timeout=0.05)
+    queue.put(FakeCommand("update"))
+    time.sleep(0.1)
+    queue.put(FakeCommand("command", PRIORITY_COMMAND))
+    assert drain(queue) == ["update", "command"]
+
+
+def test_get_times_out_on_empty_queue():
+    queue = WorkersQueue()
+    started = time.monotonic()
+    with pytest.raises(Empty):
+        queue.get(timeout=0.05)
+    assert time.monotonic() - started >= 0.05
+
+
+def test_take_removes_command_of_adapter():
+    queue = WorkersQueue()
+    queue.put(FakeCommand("hci0", PRIORITY_COMMAND, adapter=0))
+    queue.put(FakeCommand("hci1", PRIORITY_COMMAND, adapter=1))
+    assert queue.has_pending(PRIORITY_COMMAND, 1)
+    assert queue.take(PRIORITY_COMMAND, 1).key == "hci1"
+    assert not queue.has_pending(PRIORITY_COMMAND, 1)
+    assert queue.take(PRIORITY_COMMAND, 1) is None
+    assert drain(queue) == ["hci0"]
+
+
+def test_identical_waiting_updates_are_merged():
+    queue = WorkersQueue()
+    assert queue.put(FakeCommand("update"))
+    assert queue.put(FakeCommand("update"))
+    assert queue.put(FakeCommand("other"))
+    assert drain(queue) == ["update", "other"]
+
+    queue.put(FakeCommand("update"))
+    assert drain(queue) == ["update"]
+
+
+def test_commands_are_never_merged():
+    queue = WorkersQueue()
+    queue.put(FakeCommand("switch", PRIORITY_COMMAND))
+    queue.put(FakeCommand("switch", PRIORITY_COMMAND))
+    assert drain(queue) == ["switch", "switch"]
+
+
+def test_delayed_commands_become_available():
+    queue = WorkersQueue()
+    queue.put_later(FakeCommand("later"), 0.05)
+    assert queue.qsize() == 0
+    assert queue.get(timeout=1).key == "later"
+
+
+def full_queue(overflow):
+    queue = WorkersQueue(max_size=2, overflow=overflow)
+    queue.put(FakeCommand("a1", group="a"))
+    queue.put(FakeCommand("b1", group="b"))
+    return queue
+
+
+def test_drop_oldest_sheds_oldest_update():
+    queue = full_queue(OVERFLOW_DROP_OLDEST)
+    assert queue.put(FakeCommand("c1", group="c"))
+    assert drain(queue) == ["b1", "c1"]
+
+
+def test_reject_sheds_new_command():
+    queue = full_queue(OVERFLOW_REJECT)
+    assert not queue.put(FakeCommand("c1", group="c"))
+    assert drain(queue) == ["a1", "b1"]
+
+
+def test_merge_replaces_update_of_same_worker():
+    queue = full_queue(OVERFLOW_MERGE)
+    assert queue.put(FakeCommand("b2", group="b"))
+    assert not queue.put(FakeCommand("c1", group="c"))
+    assert drain(queue) == ["a1", "b2"]
+
+
+def test_commands_are_never_shed():
+    queue = full_queue(OVERFLOW_REJECT)
+    assert queue.put(FakeCommand("switch", PRIORITY_COMMAND))
+    assert drain(queue) == ["switch", "a1", "b1"]
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        WorkersQueue().configure({"overflow": "spill"})
+
+
+def test_closed_queue_drops_delayed_commands():
+    queue = WorkersQueue()
+    queue.put_later(FakeCommand("later"), 10)
+    queue.put(FakeCommand("now"))
+    assert queue.close() == 1
+    assert queue.get().key == "now"
+    with pytest.raises(Empty):
+        queue.get()
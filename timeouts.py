@@ -0,0 +1,133 @@
+import threading
+import time
+
+_LOCAL = threading.local()
+
+
+class Deadline:
+    """
+    Signal free timeout and cancellation token. Works from any thread, nested deadlines never outlive
+    their parent and cancelling a deadline cancels all of its children. Code running under a deadline is
+    expected to honour it cooperatively, see run().
+    """
+
+    def __init__(self, seconds=None, parent=None, owner=None):
+        self._parent = parent
+        self._cancelled = threading.Event()
+        # The command this deadline belongs to, inherited by nested deadlines
+        self.owner = owner if owner is not None or parent is None else parent.owner
+        # As given, the parent may make the deadline expire earlier
+        self.seconds = seconds
+        # Retries queued by calls under this deadline or its children, whose result is still to come
+        self.retries_scheduled = 0
+
+        expires_at = time.monotonic() + seconds if seconds is not None else None
+        if parent is not None and parent.expires_at is not None:
+            expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+
+    def child(self, seconds=None):
+        return Deadline(seconds, parent=self)
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0)
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and self.remaining() <= 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (
+            self._parent is not None and self._parent.cancelled
+        )
+
+    def retry_scheduled(self):
+        """Counts a retry queued by a call under this deadline, on it and its parents"""
+        deadline = self
+        while deadline is not None:
+            deadline.retries_scheduled += 1
+            deadline = deadline._parent
+
+    def check(self, exception=TimeoutError):
+        """Cooperative cancellation point for long running loops"""
+        if self.expired or self.cancelled:
+            raise exception
+
+    def run(self, exception, func, *args, **kwargs):
+        """
+        Calls func on the calling thread with this deadline as the current one. Nothing interrupts the call, it
+        is bound by blocking calls taking their timeout from remaining() or blocking_timeout() and by check() in
+        loops. A call ending after the deadline passed, returning or failing, raises exception all the same, and
+        nothing is started once the deadline expired or was cancelled.
+        """
+        self.check(exception)
+        _push(self)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.check(exception)
+            raise
+        finally:
+            _pop()
+        self.check(exception)
+        return result
+
+    def iterate(self, exception, generator):
+        """Advances generator, each step run under this deadline"""
+        while True:
+            try:
+                yield self.run(exception, next, generator)
+            except StopIteration:
+                return
+
+
+def current_deadline():
+    stack = getattr(_LOCAL, "stack", None)
+    return stack[-1] if stack else None
+
+
+def remaining(default=None):
+    """Remaining budget of the current deadline, capped by default"""
+    deadline = current_deadline()
+    budget = deadline.remaining() if deadline is not None else None
+    if budget is None:
+        return default
+    if default is None:
+        return budget
+    return min(budget, default)
+
+
+def blocking_timeout(default, exception=TimeoutError):
+    """
+    remaining(default) for blocking calls taking 0 for no timeout, e.g. bluepy's. Raises exception instead once
+    the current deadline expired or was cancelled.
+    """
+    deadline = current_deadline()
+    if deadline is not None and deadline.cancelled:
+        raise exception
+    budget = remaining(default)
+    if budget == 0:
+        raise exception
+    return budget
+
+
+def call_with_timeout(seconds, exception, func, *args, **kwargs):
+    parent = current_deadline()
+    deadline = parent.child(seconds) if parent is not None else Deadline(seconds)
+    return deadline.run(exception, func, *args, **kwargs)
+
+
+def _push(deadline):
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    _LOCAL.stack.append(deadline)
+
+
+def _pop():
+    _LOCAL.stack.pop()
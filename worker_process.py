@@ -0,0 +1,240 @@
+import asyncio
+import importlib
+import inspect
+import os
+import subprocess
+import sys
+import threading
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+
+from exceptions import WorkerTimeoutError, DeviceTimeoutError, IsolatedWorkerError
+from mqtt import MqttMessage
+from timeouts import current_deadline
+from workers.base import BaseWorker
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_FORWARDED = ("config", "status_update", "update_device", "on_command")
+_EXCEPTIONS = {
+    "DeviceTimeoutError": DeviceTimeoutError,
+    "WorkerTimeoutError": WorkerTimeoutError,
+}
+POLL_INTERVAL = 0.25  # In seconds, how often a waiting call checks its deadline and the child
+
+
+def isolated_worker(klass, worker_name, *args, **kwargs):
+    """Creates a stand-in for the worker class, running the actual worker in a child process"""
+    if hasattr(klass, "run") and not hasattr(klass, "status_update"):
+        raise ValueError("Daemon worker {} can't be isolated".format(worker_name))
+
+    methods = {}
+    for name in _FORWARDED:
+        method = getattr(klass, name, None)
+        if method is None:
+            continue
+        if inspect.isgeneratorfunction(method):
+            methods[name] = _forward_stream(name)
+        else:
+            methods[name] = _forward(name)
+
+    # Read by the manager, which bounds update_device calls in this process
+    for name in ("update_timeout", "per_device_timeout"):
+        if hasattr(klass, name):
+            methods[name] = getattr(klass, name)
+    proxy_class = type(klass.__name__, (WorkerProcess,), methods)
+    return proxy_class(klass, worker_name, *args, **kwargs)
+
+
+def _forward(name):
+    def forward(self, *args):
+        return list(self._call(name, args))[-1][1]
+
+    forward.__name__ = name
+    return forward
+
+
+def _forward_stream(name):
+    def forward(self, *args):
+        for _, messages in self._call(name, args):
+            yield messages
+
+    forward.__name__ = name
+    return forward
+
+
+class WorkerProcess(BaseWorker):
+    """
+    Runs a worker in a child process, restarted whenever it dies or doesn't answer within the deadline of a call.
+    Calls are sent over a pipe one at a time, messages come back as plain tuples. Config, topics and device
+    bookkeeping stay in the gateway process.
+    """
+
+    def __init__(self, klass, worker_name, command_timeout, command_retries, update_retries, global_topic_prefix,
+                 **kwargs):
+        self._worker_name = worker_name
+        self._target = (klass.__module__, klass.__name__)
+        self._init_args = (command_timeout, command_retries, update_retries, global_topic_prefix)
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        super().__init__(command_timeout, command_retries, update_retries, global_topic_prefix, **kwargs)
+
+    def stop(self):
+        with self._lock:
+            self._terminate()
+
+    def _call(self, method, args):
+        """Yields (kind, messages) replies of the child until the last one"""
+        deadline = current_deadline()
+        timeout = deadline.remaining() if deadline is not None else None
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise WorkerTimeoutError("Worker process {} is busy".format(self._worker_name))
+
+        try:
+            if self._process is None:
+                self._start()
+            self._conn.send((method, args))
+            while True:
+                reply = self._receive(deadline)
+                if reply[0] == "error":
+                    raise self._exception(reply[1], reply[2])
+                yield reply[0], [self._unpack(message) for message in reply[1]]
+                if reply[0] == "done":
+                    return
+        finally:
+            self._lock.release()
+
+    def _receive(self, deadline):
+        while True:
+            try:
+                if self._conn.poll(POLL_INTERVAL):
+                    return self._conn.recv()
+            except (EOFError, OSError):
+                pass
+            else:
+                if self._process.poll() is None:
+                    if deadline is not None and (deadline.expired or deadline.cancelled):
+                        self._restart("didn't answer in time")
+                        raise DeviceTimeoutError()
+                    continue
+
+            try:
+                exitcode = self._process.wait(POLL_INTERVAL)
+            except subprocess.TimeoutExpired:
+                exitcode = None
+            self._restart("died with exit code {}".format(exitcode))
+            raise IsolatedWorkerError("ProcessDied", "exit code {}".format(exitcode))
+
+    def _start(self):
+        # A fresh interpreter rather than multiprocessing: forking would copy the locks of the scheduler, executor
+        # and MQTT threads in whatever state they are, spawning would run gateway.py again in the child
+        self._conn, child_conn = Pipe()
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import worker_process; worker_process.serve({})".format(child_conn.fileno()),
+            ],
+            cwd=_ROOT,
+            pass_fds=[child_conn.fileno()],
+        )
+        child_conn.close()
+        self._conn.send(
+            (
+                self._target,
+                self._init_args,
+                self._kwargs,
+                {"adapter": self.adapter},
+                logger.get().getEffectiveLevel(),
+                logger.SUPPRESSION_ENABLED,
+            )
+        )
+        _LOGGER.debug("Started %s worker process %d", self._worker_name, self._process.pid)
+
+    def _restart(self, reason):
+        _LOGGER.warning("Worker process of %s %s, restarting it", self._worker_name, reason)
+        metrics.increment("worker_process.restarts")
+        self._terminate()
+
+    def _terminate(self):
+        """The next call starts a new process"""
+        if self._process is None:
+            return
+        self._process.terminate()
+        try:
+            self._process.wait(1)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    @staticmethod
+    def _exception(type_name, text):
+        if type_name in _EXCEPTIONS:
+            return _EXCEPTIONS[type_name](text)
+        return IsolatedWorkerError(type_name, text)
+
+    @staticmethod
+    def _unpack(message):
+        topic, payload, retain, use_global_prefix = message
+        ret = MqttMessage(topic=topic, payload=payload, retain=retain)
+        if not use_global_prefix:
+            ret.use_global_prefix = False
+        return ret
+
+    def __repr__(self):
+        return self._worker_name
+
+
+def _pack(messages):
+    return [
+        (message.topic, message.raw_payload, message.retain, message.use_global_prefix)
+        for message in messages or []
+    ]
+
+
+def serve(fd):
+    """Main of the worker process, executes calls until the gateway closes the pipe"""
+    conn = Connection(fd)
+    target, init_args, kwargs, attributes, log_level, suppress = conn.recv()
+    logger.setup()
+    logger.get().setLevel(log_level)
+    logger.suppress_update_failures(suppress)
+
+    module_name, class_name = target
+    worker = getattr(importlib.import_module(module_name), class_name)(*init_args, **kwargs)
+    for name, value in attributes.items():
+        setattr(worker, name, value)
+
+    # Coroutine methods share one event loop for the life of the process
+    loop = None
+    try:
+        while True:
+            try:
+                method, args = conn.recv()
+            except EOFError:
+                return
+
+            try:
+                result = getattr(worker, method)(*args)
+                if inspect.iscoroutine(result):
+                    if loop is None:
+                        loop = asyncio.new_event_loop()
+                        asyncio.set_event_loop(loop)
+                    result = loop.run_until_complete(result)
+                if inspect.isgenerator(result):
+                    for messages in result:
+                        conn.send(("partial", _pack(messages)))
+                    result = []
+                conn.send(("done", _pack(result)))
+            except Exception as e:
+                conn.send(("error", type(e).__name__, str(e)))
+    finally:
+        if loop is not None:
+            loop.close()
@@ -1,9 +1,13 @@
 import json
 import time
+from functools import partial
 
 import logger
-from const import DEFAULT_PER_DEVICE_TIMEOUT
+from connection_pool import _CONNECTION_POOL
+from const import DEFAULT_ADAPTER, DEFAULT_PER_DEVICE_TIMEOUT
+from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage, MqttConfigMessage
+from timeouts import blocking_timeout
 from workers.base import BaseWorker, retry
 
 _LOGGER = logger.get(__name__)
@@ -14,6 +18,10 @@ REQUIREMENTS = [
 ]
 
 
+def _disconnect_shade(shade):
+    shade.__exit__(None, None, None)
+
+
 class Am43Worker(BaseWorker):
     per_device_timeout = DEFAULT_PER_DEVICE_TIMEOUT  # type: int
     target_range_scale = 3  # type: int
@@ -127,6 +135,28 @@ class Am43Worker(BaseWorker):
             retain=settings['manager']["sensor_config"].get("retain", True)
         )
 
+    def connected_shade(self, device_name):
+        """Borrows the shade from the connection pool, so commands in a row skip connecting and logging in"""
+        data = self.devices[device_name]
+        return _CONNECTION_POOL.connection(
+            data["mac"],
+            partial(self._connect_shade, device_name),
+            adapter=data.get('iface') or DEFAULT_ADAPTER,
+            disconnect=_disconnect_shade,
+        )
+
+    def _connect_shade(self, device_name):
+        from Zemismart import Zemismart
+
+        data = self.devices[device_name]
+        # The pool lends a shade to one operation at a time, holding the library's mutex while it is kept open
+        # would block other shades
+        connect_time = blocking_timeout(self.device_timeout(device_name, self.per_device_timeout), DeviceTimeoutError)
+        shade = Zemismart(data["mac"], data["pin"], max_connect_time=connect_time, withMutex=False,
+                          iface=data.get('iface'))
+        shade.__enter__()
+        return shade
+
     # Based on the accessory configuration, this will either
     # return the supplied value right back, or will invert
     # it so 100 is considered open instead of closed
@@ -256,10 +286,7 @@ class Am43Worker(BaseWorker):
     def single_device_status_update(self, device_name, data):
         _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), device_name, data["mac"])
 
-        from Zemismart import Zemismart
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self.connected_shade(device_name) as shade:
             ret = []
             device_state = self.get_device_state(device_name, data, shade)
             ret += self.create_mqtt_messages(device_name, device_state)
@@ -287,17 +314,18 @@ class Am43Worker(BaseWorker):
     def status_update(self):
         _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
 
-        for device_name, data in self.devices.items():
-            yield retry(self.single_device_status_update, retries=self.update_retries)(device_name, data)
+        for device_name in self.devices:
+            yield self.update_device(device_name)
 
-    def set_state(self, state, device_name):
-        from Zemismart import Zemismart
+    def update_device(self, device_name):
+        return retry(self.single_device_status_update, retries=self.update_retries)(
+            device_name, self.devices[device_name]
+        )
 
+    def set_state(self, state, device_name):
         ret = []
         data = self.devices[device_name]
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self.connected_shade(device_name) as shade:
             device_state = self.get_device_state(device_name, data, shade)
             device_position = self.correct_value(data, device_state["currentPosition"])
 
@@ -375,8 +403,6 @@ class Am43Worker(BaseWorker):
         return ret
 
     def set_position(self, position, device_name):
-        from Zemismart import Zemismart
-
         ret = []
 
         # internal state of the target position should align with the scale used by the
@@ -388,9 +414,7 @@ class Am43Worker(BaseWorker):
         target_position = self.correct_value(data, int(position))
         self.last_target_position = target_position
 
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self.connected_shade(device_name) as shade:
             # get the current state so we can work out direction for update messages
             # after getting this, convert so we are using the device scale for
             # values
@@ -435,16 +459,12 @@ class Am43Worker(BaseWorker):
         return ret
 
     def set_timer_state(self, timer_id, state, device_name):
-        from Zemismart import Zemismart
-
         ret = []
 
         data = self.devices[device_name]
         target_state = True if state == 'ON' else False
 
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self.connected_shade(device_name) as shade:
             shade.update()
             shade.timer_toggle(timer_id, target_state)
             device_state = self.get_device_state(device_name, data, shade)
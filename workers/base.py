@@ -1,19 +1,45 @@
 import logger
 
+import asyncio
 import functools
 import logging
+import threading
+import time
+from contextlib import contextmanager
 
-import tenacity
+from const import DEFAULT_ADAPTER
+from exceptions import DeviceTimeoutError
+from latency import _LATENCY
+from retries import _RETRY_POLICY
+from timeouts import current_deadline
+import presence
 
 _LOGGER = logger.get(__name__)
 
+ORDER_CONFIG = "config"  # As listed in the config
+ORDER_ROUND_ROBIN = "round_robin"  # Starting one device further every update
+ORDER_FASTEST_FIRST = "fastest_first"  # By measured update latency
+ORDER_MOST_STALE_FIRST = "most_stale_first"  # By time of the last successful update
+DEVICE_ORDERS = (ORDER_CONFIG, ORDER_ROUND_ROBIN, ORDER_FASTEST_FIRST, ORDER_MOST_STALE_FIRST)
+
+LATENCY_SMOOTHING = 0.3  # Weight of the latest measurement in the latency average
+
 
 class BaseWorker:
+    adapter = DEFAULT_ADAPTER  # type: int
+    presence_window = None  # type: int
+    device_order = ORDER_CONFIG  # type: str
+    update_timeout = None  # type: int
+
     def __init__(self, command_timeout, command_retries, update_retries, global_topic_prefix, **kwargs):
         self.command_timeout = command_timeout
         self.command_retries = command_retries
         self.update_retries = update_retries
         self.global_topic_prefix = global_topic_prefix
+        self._device_latencies = {}
+        self._device_updates = {}
+        self._device_offset = 0
+        self._device_stats_lock = threading.Lock()
         for arg, value in kwargs.items():
             setattr(self, arg, value)
         self._setup()
@@ -43,6 +69,75 @@ class BaseWorker:
             return "{}/{}".format(self.global_topic_prefix, topic)
         return topic
 
+    def device_key(self, name):
+        """Identifies a device across workers, its MAC address when the worker keeps it in a known form"""
+        device = getattr(self, "devices", {}).get(name)
+        if isinstance(device, dict):
+            mac = device.get("mac")
+        elif isinstance(device, str):
+            mac = device
+        else:
+            mac = getattr(device, "mac", None)
+        return mac.lower() if mac else "{}/{}".format(repr(self), name)
+
+    def ordered_devices(self):
+        """Names of the devices in the order update_all queues their updates, according to device_order"""
+        names = list(self.devices)
+        with self._device_stats_lock:
+            if self.device_order == ORDER_ROUND_ROBIN and names:
+                offset = self._device_offset % len(names)
+                self._device_offset = offset + 1
+                return names[offset:] + names[:offset]
+            if self.device_order == ORDER_FASTEST_FIRST:
+                # Devices without measurements go first to get one
+                return sorted(names, key=lambda name: self._device_latencies.get(name, 0))
+            if self.device_order == ORDER_MOST_STALE_FIRST:
+                return sorted(names, key=lambda name: self._device_updates.get(name, 0))
+        return names
+
+    @contextmanager
+    def device_update(self, name):
+        """
+        Measures a device update, successful ones are used for ordering devices. Updates that failed and
+        queued a retry aren't measured, the retry is.
+        """
+        deadline = current_deadline()
+        retries_scheduled = deadline.retries_scheduled if deadline is not None else 0
+        started = time.monotonic()
+        try:
+            yield
+        except DeviceTimeoutError:
+            _LATENCY.record_timeout(self.device_key(name), time.monotonic() - started)
+            raise
+        if deadline is not None and deadline.retries_scheduled != retries_scheduled:
+            return
+        finished = time.monotonic()
+        with self._device_stats_lock:
+            latency = finished - started
+            if name in self._device_latencies:
+                latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self._device_latencies[name]
+            self._device_latencies[name] = latency
+            self._device_updates[name] = finished
+        _LATENCY.record(self.device_key(name), finished - started)
+
+    def device_timeout(self, name, default):
+        """
+        Timeout for updating the device, adapted to its recorded latencies when adaptive timeouts are enabled. The
+        manager applies it to update_device() calls, with the worker's update_timeout as default.
+        """
+        return _LATENCY.timeout(self.device_key(name), default)
+
+    @staticmethod
+    async def run_blocking(func, *args):
+        """For async hooks: runs a blocking call, e.g. into a bluetooth library, on a thread"""
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args))
+
+    def device_absent(self, name):
+        """True when presence gating is enabled and recent scans didn't hear from the device"""
+        return self.presence_window is not None and presence.absent(
+            self.device_key(name), self.adapter, self.presence_window
+        )
+
     def __repr__(self):
         return self.__module__.split(".")[-1]
 
@@ -93,24 +188,14 @@ class BaseWorker:
         )
 
 def retry(_func=None, *, retries=0, exception_type=Exception):
-    def log_retry(retry_state):
-        _LOGGER.info(
-                'Call to %s failed the %s time (%s). Retrying in %s seconds',
-                '.'.join((retry_state.fn.__module__, retry_state.fn.__name__)),
-                retry_state.attempt_number,
-                type(retry_state.outcome.exception()).__name__,
-                '{:.2f}'.format(getattr(retry_state.next_action, 'sleep')))
-
+    """
+    Retries failed calls without blocking the executor: the first attempt runs right away, following ones are
+    queued again with backoff and return an empty list meanwhile. Their results are published on their own.
+    """
     def decorator_retry(func):
         @functools.wraps(func)
         def wrapped_retry(*args, **kwargs):
-            retryer = tenacity.Retrying(
-                    wait=tenacity.wait_random(1, 3),
-                    retry=tenacity.retry_if_exception_type(exception_type),
-                    stop=tenacity.stop_after_attempt(retries+1),
-                    reraise=True,
-                    before_sleep=log_retry)
-            return retryer(func, *args, **kwargs)
+            return _RETRY_POLICY.call(func, args, kwargs, retries, exception_type)
         return wrapped_retry
 
     if _func:
@@ -2,6 +2,7 @@ import time
 
 from mqtt import MqttMessage
 
+from scan_service import _SCAN_SERVICE
 from workers.base import BaseWorker
 from utils import booleanize
 import logger
@@ -89,18 +90,13 @@ class BlescanmultiWorker(BaseWorker):
     scan_passive = True  # type: str or bool
 
     def __init__(self, *args, **kwargs):
-        from bluepy.btle import Scanner, DefaultDelegate
-
-        class ScanDelegate(DefaultDelegate):
-            def __init__(self):
-                DefaultDelegate.__init__(self)
-
-            def handleDiscovery(self, dev, isNewDev, isNewData):
-                if isNewDev:
-                    _LOGGER.debug("Discovered new device: %s" % dev.addr)
-
         super(BlescanmultiWorker, self).__init__(*args, **kwargs)
-        self.scanner = Scanner().withDelegate(ScanDelegate())
+        _SCAN_SERVICE.subscribe(
+            self,
+            self.devices.values(),
+            window=float(self.scan_timeout),
+            passive=booleanize(self.scan_passive),
+        )
         self.last_status = [
             BleDeviceStatus(self, mac, name) for name, mac in self.devices.items()
         ]
@@ -114,13 +110,10 @@ class BlescanmultiWorker(BaseWorker):
         ret = []
 
         try:
-            devices = self.scanner.scan(
-                float(self.scan_timeout), passive=booleanize(self.scan_passive)
-            )
-            mac_addresses = {device.addr: device for device in devices}
+            _SCAN_SERVICE.refresh(self.adapter)
 
             for status in self.last_status:
-                device = mac_addresses.get(status.mac, None)
+                device = _SCAN_SERVICE.latest(status.mac)
                 status.set_status(device is not None)
                 ret += status.generate_messages(device)
 
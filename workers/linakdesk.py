@@ -1,8 +1,7 @@
-from interruptingcow import timeout
-
 import logger
 from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage
+from timeouts import call_with_timeout
 from workers.base import BaseWorker
 
 _LOGGER = logger.get(__name__)
@@ -29,26 +28,29 @@ class LinakdeskWorker(BaseWorker):
         ]
 
     def _get_height(self):
-        from bluepy import btle
-
-        with timeout(
+        return call_with_timeout(
             self.SCAN_TIMEOUT,
-            exception=DeviceTimeoutError(
+            DeviceTimeoutError(
                 "Retrieving the height from {} device {} timed out after {} seconds".format(
                     repr(self), self.mac, self.SCAN_TIMEOUT
                 )
             ),
-        ):
-            try:
-                self.desk.read_dpg_data()
-                return self.desk.current_height_with_offset.cm
-            except btle.BTLEException as e:
-                logger.log_exception(
-                    _LOGGER,
-                    "Error during update of linak desk '%s' (%s): %s",
-                    repr(self),
-                    self.mac,
-                    type(e).__name__,
-                    suppress=True,
-                )
-                raise DeviceTimeoutError
+            self._read_height,
+        )
+
+    def _read_height(self):
+        from bluepy import btle
+
+        try:
+            self.desk.read_dpg_data()
+            return self.desk.current_height_with_offset.cm
+        except btle.BTLEException as e:
+            logger.log_exception(
+                _LOGGER,
+                "Error during update of linak desk '%s' (%s): %s",
+                repr(self),
+                self.mac,
+                type(e).__name__,
+                suppress=True,
+            )
+            raise DeviceTimeoutError
@@ -4,7 +4,11 @@ import logger
 from contextlib import contextmanager
 from struct import unpack
 
+from bluepy_helpers import _HELPER_POOL
+from connection_pool import _CONNECTION_POOL
+from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage
+from timeouts import blocking_timeout
 from workers.base import BaseWorker
 
 _LOGGER = logger.get(__name__)
@@ -22,15 +26,17 @@ class Lywsd02Worker(BaseWorker):
     def status_update(self):
         from bluepy import btle
 
-        for name, lywsd02 in self.devices.items():
+        for name in self.devices:
             try:
-                ret = lywsd02.readAll()
+                yield self.update_device(name)
             except btle.BTLEDisconnectError as e:
                 self.log_connect_exception(_LOGGER, name, e)
             except btle.BTLEException as e:
                 self.log_unspecified_exception(_LOGGER, name, e)
-            else:
-                yield [MqttMessage(topic=self.format_topic(name), payload=json.dumps(ret))]
+
+    def update_device(self, name):
+        ret = self.devices[name].readAll()
+        return [MqttMessage(topic=self.format_topic(name), payload=json.dumps(ret))]
 
 
 class Lywsd02:
@@ -47,13 +53,13 @@ class Lywsd02:
 
     @contextmanager
     def connected(self):
-        from bluepy import btle
+        with _CONNECTION_POOL.connection(self.mac, self.connect) as device:
+            yield device
 
+    def connect(self):
         _LOGGER.debug("%s connected ", self.mac)
-        device = btle.Peripheral()
-        device.connect(self.mac)
-        yield device
-        device.disconnect()
+        device = _HELPER_POOL.connect(self.mac)
+        return device
 
     def readAll(self):
         with self.connected() as device:
@@ -71,7 +77,7 @@ class Lywsd02:
     def getData(self, device):
         self.subscribe(device, self.UUID_DATA)
         while True:
-            if device.waitForNotifications(self.timeout):
+            if device.waitForNotifications(blocking_timeout(self.timeout, DeviceTimeoutError)):
                 break
         return self._temperature, self._humidity
 
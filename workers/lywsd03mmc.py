@@ -1,14 +1,39 @@
 import json
 import logger
+import struct
 
 from contextlib import contextmanager
 
+from bluepy_helpers import _HELPER_POOL
+from connection_pool import _CONNECTION_POOL
+from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage
+from scan_service import _SCAN_SERVICE, AD_TYPE_SERVICE_DATA_16, register_decoder
+from timeouts import blocking_timeout
 from workers.base import BaseWorker
 
 _LOGGER = logger.get(__name__)
 
 REQUIREMENTS = ["bluepy"]
+ENVIRONMENTAL_SENSING_UUID = 0x181A  # Service the scan values are advertised as data of
+
+# Custom format, mac is reversed: temperature in 0.01 °C, humidity in 0.01 %, battery in mV and %
+CUSTOM_FORMAT = struct.Struct("<6shHHB")
+# ATC format, mac is not reversed: temperature in 0.1 °C, humidity in %, battery fields
+ATC_FORMAT = struct.Struct(">6shBHH")
+
+
+def decode_scan_values(payload, advertisement):
+    """Decodes the environmental sensing service data to temperature, humidity, battery and battery voltage"""
+    if payload[5] == advertisement.mac_bytes[0]:
+        _, temperature, humidity, battery_v, battery = CUSTOM_FORMAT.unpack_from(payload)
+        return temperature / 100, humidity / 100, battery, battery_v
+
+    _, temperature, humidity, battery_v, battery = ATC_FORMAT.unpack_from(payload)
+    return temperature / 10, humidity, battery, battery_v
+
+
+register_decoder(AD_TYPE_SERVICE_DATA_16, ENVIRONMENTAL_SENSING_UUID, decode_scan_values)
 
 class Lywsd03MmcWorker(BaseWorker):
     def _setup(self):
@@ -18,35 +43,36 @@ class Lywsd03MmcWorker(BaseWorker):
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = lywsd03mmc(mac, command_timeout=self.command_timeout, passive=self.passive)
+        self._devices_by_mac = {device.mac.lower(): device for device in self.devices.values()}
+
+        if self.passive:
+            _SCAN_SERVICE.subscribe(
+                self,
+                [device.mac for device in self.devices.values()],
+                window=self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0,
+                uuids=[ENVIRONMENTAL_SENSING_UUID],
+                callback=self.process_advertisement,
+            )
 
     def find_device(self, mac):
-        for name, device in self.devices.items():
-            if device.mac == mac:
-                return device
-        return
+        return self._devices_by_mac.get(mac)
 
-    def status_update(self):
-        from bluepy import btle
+    def process_advertisement(self, res):
+        device = self.find_device(res.addr)
+        values = res.decode(AD_TYPE_SERVICE_DATA_16, ENVIRONMENTAL_SENSING_UUID)
+        _LOGGER.debug("device with addr %s (%s). values: %s", res.addr, device, values)
+        if values is not None:
+            device.processScanValues(values)
 
+    def status_update(self):
         if self.passive:
-            _LOGGER.debug("status_update. Scanning...")
-            scanner = btle.Scanner()
-            results = scanner.scan(self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0, passive=True)
-
-            _LOGGER.debug("scan results for device %s", results)
-            for res in results:
-                device = self.find_device(res.addr)
-                scanData = res.getScanData()
-                _LOGGER.debug("device with addr %s (%s). data: %s", res.addr, device, scanData)
-                if device:
-                    for (adtype, desc, value) in scanData:
-                        if ("1a18" in value):
-                            device.processScanValue(value)
-                        else:
-                            # seems like original Mi format is totally different (or encrypted)
-                            _LOGGER.debug("%s - unknown scan data %s", res.addr, value)                            
+            # Scan values are processed as the shared scanner receives them
+            _SCAN_SERVICE.refresh(self.adapter)
 
         for name, lywsd03mmc in self.devices.items():
+            if not self.passive and self.device_absent(name):
+                _LOGGER.debug("Skipping %s device '%s', not seen recently", repr(self), name)
+                continue
             #try:
             ret = lywsd03mmc.readAll()
             #except btle.BTLEDisconnectError as e:
@@ -69,14 +95,16 @@ class lywsd03mmc:
 
     @contextmanager
     def connected(self):
-        from bluepy import btle
+        with _CONNECTION_POOL.connection(self.mac, self.connect) as device:
+            yield device
 
+    def connect(self):
         _LOGGER.debug("%s - connected (passive: %s)", self.mac, self.passive)
-        device = btle.Peripheral()
-        device.connect(self.mac)
+        device = _HELPER_POOL.connect(self.mac)
+        # Notifications stay enabled for as long as the pool keeps the connection
         device.writeCharacteristic(0x0038, b'\x01\x00', True)
         device.writeCharacteristic(0x0046, b'\xf4\x01\x00', True)
-        yield device
+        return device
 
     def readAll(self):
         if self.passive:
@@ -104,7 +132,7 @@ class lywsd03mmc:
     def getData(self, device):
         self.subscribe(device)
         while True:
-            if device.waitForNotifications(self.command_timeout):
+            if device.waitForNotifications(blocking_timeout(self.command_timeout, DeviceTimeoutError)):
                 break
         return self._temperature, self._humidity, self._battery
 
@@ -120,67 +148,11 @@ class lywsd03mmc:
     def subscribe(self, device):
         device.setDelegate(self)
 
-    def processScanValue(self, data):
-        # mac: a4:c1:38:d6:1e:75
-        # mac is reversed - custom format
-        # 1a18 751ed638c1a4 1c09e111da0a40eb04
-        # 1a18751ed638c1a41a09ae11da0a404604
-        # int.from_bytes(bindata[8:10], byteorder='little', signed=True) / 100
-        # mac is not reversed - ATC format
-        # 1a18a4c138d61e7500e92d400adc44
-        # int.from_bytes(bindata[8:10], byteorder='big', signed=True) / 10
-        packetMac = data[4:16]
-        isMacReversed = packetMac[-2:] == self.mac[0:2]
-
-        _LOGGER.debug('packet length: %d isMacReversed: %s packetMac: %s data: %s', len(data), isMacReversed, packetMac, data)
-
-        if isMacReversed:
-            return self.processCustomScanValue(data)
-        else:
-            return self.processATCScanValue(data)
-
-        _LOGGER.warn('unrecognized scan value format. length: %d', len(data))
-    
-    def processLegacyScanValue(self, data):
-        _LOGGER.debug("handle legacy format %s", data)
-        
-        temperature = int(data[16:20], 16) / 10
-        humidity = int(data[20:22], 16)
-        battery = int(data[22:24], 16)
-        battery_v = 0
+    def processScanValues(self, values):
+        temperature, humidity, battery, battery_v = values
 
         self._temperature = round(temperature, 1)
         self._humidity = round(humidity)
         self._battery = round(battery, 4)
 
         _LOGGER.debug("[%s temp: %f, hum: %d, bat: %d bat_v: %d]", self.mac, temperature, humidity, battery, battery_v)
-
-    def processCustomScanValue(self, data):
-        _LOGGER.debug("handle custom format %s", data)
-        
-        bindata = bytearray.fromhex(data)
-        temperature = int.from_bytes(bindata[8:10], byteorder='little', signed=True) / 100
-        humidity = int.from_bytes(bindata[10:12], byteorder='little', signed=False) / 100
-        battery_v = int.from_bytes(bindata[12:14], byteorder='little', signed=False)
-        battery = int.from_bytes(bindata[14:15], byteorder='little', signed=False)
-
-        self._temperature = round(temperature, 1)
-        self._humidity = round(humidity)
-        self._battery = round(battery, 4)
-
-        _LOGGER.debug("[%s temp: %f, hum: %d, bat: %d bat_v: %d]", self.mac, temperature, humidity, battery, battery_v)
-    
-    def processATCScanValue(self, data):
-        _LOGGER.debug("handle ATC format %s", data)
-        
-        bindata = bytearray.fromhex(data)
-        temperature = int.from_bytes(bindata[8:10], byteorder='big', signed=True) / 10
-        humidity = int.from_bytes(bindata[10:11], byteorder='big')
-        battery_v = int.from_bytes(bindata[11:13], byteorder='big') 
-        battery = int.from_bytes(bindata[13:15], byteorder='big')
-
-        self._temperature = round(temperature, 1)
-        self._humidity = round(humidity)
-        self._battery = round(battery, 4)
-
-        _LOGGER.debug("[%s temp: %f, hum: %d, bat: %d bat_v: %d]", self.mac, temperature, humidity, battery, battery_v)
\ No newline at end of file
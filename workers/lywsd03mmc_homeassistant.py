@@ -1,11 +1,13 @@
 from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage, MqttConfigMessage, MqttClient
+from scan_service import _SCAN_SERVICE, AD_TYPE_SERVICE_DATA_16
+from timeouts import call_with_timeout
 
-from interruptingcow import timeout
 from workers.base import BaseWorker
-from workers.lywsd03mmc import lywsd03mmc
+from workers.lywsd03mmc import lywsd03mmc, ENVIRONMENTAL_SENSING_UUID
 import logger
 import json
+import threading
 import time
 from contextlib import contextmanager
 
@@ -29,6 +31,19 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
         for name, mac in self.devices.items():
             _LOGGER.debug("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = lywsd03mmc(mac, command_timeout=self.command_timeout, passive=self.passive)
+        self._devices_by_mac = {device.mac.lower(): (name, device) for name, device in self.devices.items()}
+
+        # Names of devices with scan values received since the last update
+        self._received = []
+        self._received_lock = threading.Lock()
+        if self.passive:
+            _SCAN_SERVICE.subscribe(
+                self,
+                [device.mac for device in self.devices.values()],
+                window=self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0,
+                uuids=[ENVIRONMENTAL_SENSING_UUID],
+                callback=self.process_advertisement,
+            )
 
     def config(self, availability_topic):
         ret = []
@@ -37,10 +52,19 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
         return ret
 
     def find_device(self, mac):
-        for name, device in self.devices.items():
-            if device.mac == mac:
-                return name, device
-        return None, None
+        return self._devices_by_mac.get(mac, (None, None))
+
+    def process_advertisement(self, res):
+        name, device = self.find_device(res.addr)
+        values = res.decode(AD_TYPE_SERVICE_DATA_16, ENVIRONMENTAL_SENSING_UUID)
+        _LOGGER.debug("device with addr %s (%s). values: %s", res.addr, device, values)
+        if values is None:
+            return
+
+        device.processScanValues(values)
+        with self._received_lock:
+            if name not in self._received:
+                self._received.append(name)
 
     def format_discovery_topic(self, mac, *sensor_args):
         node_id = mac.replace(":", "-")
@@ -108,56 +132,45 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
         # _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
 
         if self.passive:
-            scan_timeout = self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0
-            _LOGGER.debug("scanning... (timeout: %d)", scan_timeout)
-            scanner = btle.Scanner()
-            results = scanner.scan(self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0, passive=True)
-
-            for res in results:
-                name, device = self.find_device(res.addr)
-                if device:
-                    try:
-                        scanData = res.getScanData()
-                        _LOGGER.debug("device with addr %s (%s). data: %s", res.addr, device, scanData)
-                        
-                        for (adtype, desc, value) in scanData:
-                            if ("1a18" in value):
-                                _LOGGER.debug("%s - received scan data %s", res.addr, value)
-                                device.processScanValue(value)
-                                # only send state update if the state was actually read - prevent sending stale values to MQTT
-                                with timeout(self.command_timeout, exception=DeviceTimeoutError):
-                                    yield self.update_device_state(name, device)
-                            else:
-                                _LOGGER.debug("%s - unknown scan data %s", res.addr, value) 
-                    except btle.BTLEException as e:
-                                logger.log_exception(
-                                    _LOGGER,
-                                    "Error during update of %s device '%s' (%s): %s",
-                                    repr(self),
-                                    name,
-                                    device.mac,
-                                    type(e).__name__,
-                                    suppress=True,
-                                )
-                    except DeviceTimeoutError:
-                        logger.log_exception(
-                            _LOGGER,
-                            "Time out during update of %s device '%s' (%s)",
-                            repr(self),
-                            name,
-                            device.mac,
-                            suppress=True,
-                        )     
-                else:
-                    _LOGGER.debug("device %s not found", res.addr)
+            _SCAN_SERVICE.refresh(self.adapter)
+            with self._received_lock:
+                received, self._received = self._received, []
+
+            # only devices whose state was actually read - prevent sending stale values to MQTT
+            for name in received:
+                device = self.devices[name]
+                try:
+                    yield call_with_timeout(
+                        self.command_timeout, DeviceTimeoutError, self.update_device_state, name, device
+                    )
+                except btle.BTLEException as e:
+                    logger.log_exception(
+                        _LOGGER,
+                        "Error during update of %s device '%s' (%s): %s",
+                        repr(self),
+                        name,
+                        device.mac,
+                        type(e).__name__,
+                        suppress=True,
+                    )
+                except DeviceTimeoutError:
+                    logger.log_exception(
+                        _LOGGER,
+                        "Time out during update of %s device '%s' (%s)",
+                        repr(self),
+                        name,
+                        device.mac,
+                        suppress=True,
+                    )
         else:
             for name, device in self.devices.items():
                 # _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, device.mac)
                 # from btlewrap import BluetoothBackendException
 
                 try:
-                    with timeout(self.command_timeout, exception=DeviceTimeoutError):
-                        yield self.update_device_state(name, device)
+                    yield call_with_timeout(
+                        self.command_timeout, DeviceTimeoutError, self.update_device_state, name, device
+                    )
                 except btle.BTLEException as e:
                     logger.log_exception(
                         _LOGGER,
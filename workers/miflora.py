@@ -2,7 +2,6 @@ from const import DEFAULT_PER_DEVICE_TIMEOUT
 from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage, MqttConfigMessage
 
-from interruptingcow import timeout
 from workers.base import BaseWorker, retry
 import logger
 
@@ -106,12 +105,10 @@ class MifloraWorker(BaseWorker):
         _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
 
         for name, data in self.devices.items():
-            _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, data["mac"])
             from btlewrap import BluetoothBackendException
 
             try:
-                with timeout(self.per_device_timeout, exception=DeviceTimeoutError):
-                    yield retry(self.update_device_state, retries=self.update_retries, exception_type=BluetoothBackendException)(name, data["poller"])
+                yield self.update_device(name)
             except BluetoothBackendException as e:
                 logger.log_exception(
                     _LOGGER,
@@ -132,6 +129,19 @@ class MifloraWorker(BaseWorker):
                     suppress=True,
                 )
 
+    @property
+    def update_timeout(self):
+        return self.per_device_timeout
+
+    def update_device(self, name):
+        from btlewrap import BluetoothBackendException
+
+        data = self.devices[name]
+        _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, data["mac"])
+        return retry(self.update_device_state, retries=self.update_retries, exception_type=BluetoothBackendException)(
+            name, data["poller"]
+        )
+
     def update_device_state(self, name, poller):
         ret = []
         poller.clear_cache()
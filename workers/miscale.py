@@ -1,15 +1,50 @@
 from math import floor
 
 from datetime import datetime
-import time
-from interruptingcow import timeout
+import struct
 
 from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage
+from scan_service import _SCAN_SERVICE, AD_TYPE_SERVICE_DATA_16, register_decoder
 from workers.base import BaseWorker
 
 REQUIREMENTS = ["bluepy"]
 
+WEIGHT_SCALE_UUID = 0x181D  # Xiaomi Scale V1
+BODY_COMPOSITION_UUID = 0x181B  # Xiaomi Scale V2
+
+# Unit, weight in 0.01 units
+V1_FORMAT = struct.Struct("<BH")
+# Unit, control byte, year, month, day, hour, minute, second, impedance, weight in 0.01 units
+V2_FORMAT = struct.Struct("<BxH5BHH")
+V1_UNITS = {0x03: "lbs", 0xB3: "lbs", 0x12: "jin", 0xB2: "jin", 0x22: "kg", 0xA2: "kg"}
+V2_UNITS = {0x03: "lbs", 0x02: "kg"}
+
+
+def decode_v1(payload, advertisement):
+    """Weight and unit from weight scale service data"""
+    unit_code, weight = V1_FORMAT.unpack_from(payload)
+    unit = V1_UNITS.get(unit_code, "")
+    measured = weight * 0.01
+    if unit == "kg":
+        measured = measured / 2
+    return round(measured, 2), unit
+
+
+def decode_v2(payload, advertisement):
+    """Weight, unit, impedance and the time of the measurement from body composition service data"""
+    unit_code, year, month, day, hour, minute, second, impedance, weight = V2_FORMAT.unpack_from(payload)
+    unit = V2_UNITS.get(unit_code, "")
+    measured = weight * 0.01
+    if unit == "kg":
+        measured = measured / 2
+    midatetime = datetime(year, month, day, hour, minute, second)
+    return round(measured, 2), unit, impedance, str(midatetime)
+
+
+register_decoder(AD_TYPE_SERVICE_DATA_16, WEIGHT_SCALE_UUID, decode_v1)
+register_decoder(AD_TYPE_SERVICE_DATA_16, BODY_COMPOSITION_UUID, decode_v2)
+
 
 # Bluepy might need special settings
 # sudo setcap 'cap_net_raw,cap_net_admin+eip' /usr/local/lib/python3.6/dist-packages/bluepy/bluepy-helper
@@ -19,6 +54,11 @@ class MiscaleWorker(BaseWorker):
 
     SCAN_TIMEOUT = 5
 
+    def _setup(self):
+        # Service data of the last measurement published, the scale keeps advertising it for a while
+        self._published = None
+        _SCAN_SERVICE.subscribe(self, [self.mac], window=self.SCAN_TIMEOUT, passive=True)
+
     def getAge(self, d1):
         d1 = datetime.strptime(str(d1), "%Y-%m-%d")
         d2 = datetime.strptime(datetime.today().strftime("%Y-%m-%d"), "%Y-%m-%d")
@@ -26,6 +66,8 @@ class MiscaleWorker(BaseWorker):
 
     def status_update(self):
         results = self._get_data()
+        if results is None:
+            return []
 
         messages = [
             MqttMessage(
@@ -98,24 +140,22 @@ class MiscaleWorker(BaseWorker):
         return messages
 
     def _get_data(self):
-        from bluepy import btle
+        """Results of the measurement advertised recently, None if it was already published"""
+        _SCAN_SERVICE.refresh(self.adapter)
 
         scan_processor = ScanProcessor(self.mac)
-        scanner = btle.Scanner().withDelegate(scan_processor)
-        scanner.scan(self.SCAN_TIMEOUT, passive=True)
-
-        with timeout(
-            self.SCAN_TIMEOUT,
-            exception=DeviceTimeoutError(
-                "Retrieving data from {} device {} timed out after {} seconds".format(
-                    repr(self), self.mac, self.SCAN_TIMEOUT
-                )
-            ),
-        ):
-            while not scan_processor.ready:
-                time.sleep(1)
-            return scan_processor.results
+        advertisement = _SCAN_SERVICE.latest(self.mac)
+        if advertisement is not None:
+            scan_processor.handleDiscovery(advertisement, True, False)
+        if not scan_processor.ready:
+            raise DeviceTimeoutError(
+                "No measurement advertised by {} device {} recently".format(repr(self), self.mac)
+            )
 
+        measurement = advertisement.raw_data.get(AD_TYPE_SERVICE_DATA_16)
+        if measurement == self._published:
+            return None
+        self._published = measurement
         return scan_processor.results
 
 
@@ -123,64 +163,20 @@ class ScanProcessor:
     def __init__(self, mac):
         self._ready = False
         self._mac = mac
+        self._addr = mac.lower()
         self._results = MiWeightScaleData()
 
     def handleDiscovery(self, dev, isNewDev, _):
-        if dev.addr == self.mac.lower() and isNewDev:
-            for (sdid, desc, data) in dev.getScanData():
-
-                # Xiaomi Scale V1
-                if data.startswith("1d18") and sdid == 22:
-                    measunit = data[4:6]
-                    measured = int((data[8:10] + data[6:8]), 16) * 0.01
-                    unit = ""
-
-                    if measunit.startswith(("03", "b3")):
-                        unit = "lbs"
-                    elif measunit.startswith(("12", "b2")):
-                        unit = "jin"
-                    elif measunit.startswith(("22", "a2")):
-                        unit = "kg"
-                        measured = measured / 2
-
-                    self.results.weight = round(measured, 2)
-                    self.results.unit = unit
-
-                    self.ready = True
-
-                # Xiaomi Scale V2
-                if data.startswith("1b18") and sdid == 22:
-                    measunit = data[4:6]
-                    measured = int((data[28:30] + data[26:28]), 16) * 0.01
-                    unit = ""
-
-                    if measunit == "03":
-                        unit = "lbs"
-                    elif measunit == "02":
-                        unit = "kg"
-                        measured = measured / 2
-
-                    midatetime = datetime.strptime(
-                        str(int((data[10:12] + data[8:10]), 16))
-                        + " "
-                        + str(int((data[12:14]), 16))
-                        + " "
-                        + str(int((data[14:16]), 16))
-                        + " "
-                        + str(int((data[16:18]), 16))
-                        + " "
-                        + str(int((data[18:20]), 16))
-                        + " "
-                        + str(int((data[20:22]), 16)),
-                        "%Y %m %d %H %M %S",
-                    )
-
-                    self.results.weight = round(measured, 2)
-                    self.results.unit = unit
-                    self.results.impedance = int((data[24:26] + data[22:24]), 16)
-                    self.results.midatetime = str(midatetime)
-
-                    self.ready = True
+        if dev.addr == self._addr and isNewDev:
+            values = dev.decode(AD_TYPE_SERVICE_DATA_16, WEIGHT_SCALE_UUID)
+            if values is not None:
+                self.results.weight, self.results.unit = values
+                self.ready = True
+
+            values = dev.decode(AD_TYPE_SERVICE_DATA_16, BODY_COMPOSITION_UUID)
+            if values is not None:
+                self.results.weight, self.results.unit, self.results.impedance, self.results.midatetime = values
+                self.ready = True
 
     @property
     def mac(self):
@@ -1,3 +1,5 @@
+import threading
+
 from mqtt import MqttMessage
 
 from workers.base import BaseWorker
@@ -8,12 +10,16 @@ _LOGGER = logger.get(__name__)
 
 
 class MysensorsWorker(BaseWorker):
+    def _setup(self):
+        self._stopped = threading.Event()
+
     def run(self, mqtt):
         import serial
 
-        with serial.Serial(self.port, self.baudrate, timeout=10) as ser:
+        # Short reads, so stop() is noticed quickly
+        with serial.Serial(self.port, self.baudrate, timeout=1) as ser:
             _LOGGER.debug("Starting mysensors at: %s" % ser.name)
-            while True:
+            while not self._stopped.is_set():
                 line = ser.readline()
                 if not line:
                     continue
@@ -23,3 +29,6 @@ class MysensorsWorker(BaseWorker):
                 topic = "/".join(splited_line[0:-1])
                 payload = "".join(splited_line[-1])
                 mqtt.publish([MqttMessage(topic=topic, payload=payload)])
+
+    def stop(self):
+        self._stopped.set()
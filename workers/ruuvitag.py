@@ -1,4 +1,5 @@
 from mqtt import MqttMessage, MqttConfigMessage
+from scan_service import _SCAN_SERVICE, AD_TYPE_MANUFACTURER_DATA
 from workers.base import BaseWorker
 
 import logger
@@ -60,6 +61,7 @@ class RuuvitagWorker(BaseWorker):
         for name, mac in self.devices.items():
             _LOGGER.debug("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = RuuviTag(mac)
+        _SCAN_SERVICE.subscribe(self, [device.mac for device in self.devices.values()])
 
     def config(self, availability_topic):
         ret = []
@@ -116,9 +118,8 @@ class RuuvitagWorker(BaseWorker):
         ret = []
         _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
         for name, device in self.devices.items():
-            _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, device.mac)
             try:
-                ret.extend(self.update_device_state(name, device))
+                ret.extend(self.update_device(name))
             except btle.BTLEException as e:
                 logger.log_exception(
                     _LOGGER,
@@ -131,8 +132,35 @@ class RuuvitagWorker(BaseWorker):
                 )
         return ret
 
+    def update_device(self, name):
+        device = self.devices[name]
+        _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, device.mac)
+        _SCAN_SERVICE.refresh(self.adapter)
+        return self.update_device_state(name, device)
+
+    @staticmethod
+    def read(device):
+        """
+        Decodes the tag's last advertisement received by the shared scanner. Data formats 3 and 5 are sent as
+        manufacturer data, tags using the URL based formats 2 and 4 are still scanned for on their own.
+        """
+        from ruuvitag_sensor.data_formats import DataFormats
+        from ruuvitag_sensor.decoder import get_decoder
+
+        advertisement = _SCAN_SERVICE.latest(device.mac)
+        if advertisement is None:
+            return {}
+
+        manufacturer_data = advertisement.getValueText(AD_TYPE_MANUFACTURER_DATA)
+        if manufacturer_data is None:
+            return device.update()
+        data_format, data = DataFormats.convert_data("FF" + manufacturer_data.upper())
+        if data is None:
+            return device.update()
+        return get_decoder(data_format).decode_data(data)
+
     def update_device_state(self, name, device):
-        values = device.update()
+        values = self.read(device)
 
         ret = []
         for attr, device_class, _ in ATTR_CONFIG:
@@ -62,9 +62,8 @@ class SmartgadgetWorker(BaseWorker):
 
         _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
         for name, device in self.devices.items():
-            _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, device.mac)
             try:
-                yield self.update_device_state(name, device)
+                yield self.update_device(name)
             except btle.BTLEException as e:
                 logger.log_exception(
                     _LOGGER,
@@ -76,6 +75,11 @@ class SmartgadgetWorker(BaseWorker):
                     suppress=True,
                 )
 
+    def update_device(self, name):
+        device = self.devices[name]
+        _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, device.mac)
+        return self.update_device_state(name, device)
+
     def update_device_state(self, name, device):
         values = device.get_values()
 
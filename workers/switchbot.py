@@ -1,6 +1,9 @@
 from builtins import staticmethod
+from functools import partial
 import logging
 
+from bluepy_helpers import _HELPER_POOL
+from connection_pool import _CONNECTION_POOL
 from mqtt import MqttMessage
 
 from workers.base import BaseWorker
@@ -48,7 +51,6 @@ class SwitchbotWorker(BaseWorker):
     def on_command(self, topic, value):
         from bluepy import btle
         import binascii
-        from bluepy.btle import Peripheral
 
         _, _, device_name, _ = topic.split("/")
 
@@ -66,20 +68,21 @@ class SwitchbotWorker(BaseWorker):
             bot["mac"],
         )
         try:
-            bot["bot"] = Peripheral(bot["mac"], "random")
-            hand_service = bot["bot"].getServiceByUUID(
-                "cba20d00-224d-11e6-9fb8-0002a5d5c51b"
-            )
-            hand = hand_service.getCharacteristics(
-                "cba20002-224d-11e6-9fb8-0002a5d5c51b"
-            )[0]
-            if value == STATE_ON:
-                hand.write(binascii.a2b_hex("570101"))
-            elif value == STATE_OFF:
-                hand.write(binascii.a2b_hex("570102"))
-            elif value == "PRESS":
-                hand.write(binascii.a2b_hex("570100"))
-            bot["bot"].disconnect()
+            # Kept open, so presses in a row skip connecting
+            connect = partial(_HELPER_POOL.connect, bot["mac"], "random")
+            with _CONNECTION_POOL.connection(bot["mac"], connect) as bot["bot"]:
+                hand_service = bot["bot"].getServiceByUUID(
+                    "cba20d00-224d-11e6-9fb8-0002a5d5c51b"
+                )
+                hand = hand_service.getCharacteristics(
+                    "cba20002-224d-11e6-9fb8-0002a5d5c51b"
+                )[0]
+                if value == STATE_ON:
+                    hand.write(binascii.a2b_hex("570101"))
+                elif value == STATE_OFF:
+                    hand.write(binascii.a2b_hex("570102"))
+                elif value == "PRESS":
+                    hand.write(binascii.a2b_hex("570100"))
         except btle.BTLEException as e:
             logger.log_exception(
                 _LOGGER,
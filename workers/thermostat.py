@@ -1,3 +1,5 @@
+from bluepy_helpers import _HELPER_POOL
+from connection_pool import _CONNECTION_POOL
 from mqtt import MqttMessage, MqttConfigMessage
 
 from workers.base import BaseWorker, retry
@@ -32,18 +34,46 @@ monitoredAttrs = [
 ]
 
 
+def pooled_connection_class():
+    """eq3bt connection borrowing the peripheral from the connection pool, instead of connecting for every request"""
+    from bluepy import btle
+    from eq3bt.connection import BTLEConnection
+
+    class PooledConnection(BTLEConnection):
+        def __enter__(self):
+            self._borrowed = _CONNECTION_POOL.connection(self._mac, self._connect)
+            self._conn = self._borrowed.__enter__()
+            self._conn.withDelegate(self)
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self._conn = None
+            return self._borrowed.__exit__(exc_type, exc_val, exc_tb)
+
+        def _connect(self):
+            try:
+                return _HELPER_POOL.connect(self._mac)
+            except btle.BTLEException as ex:
+                # Like eq3bt, connecting is tried twice
+                _LOGGER.debug("Unable to connect to the device %s, retrying: %s", self._mac, ex)
+                return _HELPER_POOL.connect(self._mac)
+
+    return PooledConnection
+
+
 class ThermostatWorker(BaseWorker):
     def _setup(self):
         from eq3bt import Thermostat
 
+        connection_cls = pooled_connection_class()
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
         for name, obj in self.devices.items():
             if isinstance(obj, str):
-                self.devices[name] = {"mac": obj, "thermostat": Thermostat(obj)}
+                self.devices[name] = {"mac": obj, "thermostat": Thermostat(obj, connection_cls=connection_cls)}
             elif isinstance(obj, dict):
                 self.devices[name] = {
                     "mac": obj["mac"],
-                    "thermostat": Thermostat(obj["mac"]),
+                    "thermostat": Thermostat(obj["mac"], connection_cls=connection_cls),
                     "discovery_temperature_topic": obj.get(
                         "discovery_temperature_topic"
                     ),
@@ -194,10 +224,8 @@ class ThermostatWorker(BaseWorker):
 
         _LOGGER.info("Updating %d %s devices", len(self.devices), repr(self))
         for name, data in self.devices.items():
-            _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, data["mac"])
-            thermostat = data["thermostat"]
             try:
-                retry(thermostat.update, retries=self.update_retries, exception_type=btle.BTLEException)()
+                yield self.update_device(name)
             except btle.BTLEException as e:
                 logger.log_exception(
                     _LOGGER,
@@ -208,8 +236,19 @@ class ThermostatWorker(BaseWorker):
                     type(e).__name__,
                     suppress=True,
                 )
-            else:
-                yield retry(self.present_device_state, retries=self.update_retries, exception_type=btle.BTLEException)(name, thermostat)
+
+    def update_device(self, name):
+        from bluepy import btle
+
+        data = self.devices[name]
+        _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), name, data["mac"])
+        return retry(self.update_device_state, retries=self.update_retries, exception_type=btle.BTLEException)(
+            name, data["thermostat"]
+        )
+
+    def update_device_state(self, name, thermostat):
+        thermostat.update()
+        return self.present_device_state(name, thermostat)
 
     def on_command(self, topic, value):
         from bluepy import btle
@@ -271,13 +310,9 @@ class ThermostatWorker(BaseWorker):
             data["mac"],
         )
         try:
-            if method == "preset":
-                if value == HOLD_COMFORT:
-                    retry(thermostat.activate_comfort, retries=self.command_retries, exception_type=btle.BTLEException)()
-                else:
-                    retry(thermostat.activate_eco, retries=self.command_retries, exception_type=btle.BTLEException)()
-            else:
-                retry(setattr, retries=self.command_retries, exception_type=btle.BTLEException)(thermostat, method, value)
+            return retry(self.set_device_state, retries=self.command_retries, exception_type=btle.BTLEException)(
+                device_name, thermostat, method, value
+            )
         except btle.BTLEException as e:
             logger.log_exception(
                 _LOGGER,
@@ -291,7 +326,16 @@ class ThermostatWorker(BaseWorker):
             )
             return []
 
-        return retry(self.present_device_state, retries=self.command_retries, exception_type=btle.BTLEException)(device_name, thermostat)
+    def set_device_state(self, name, thermostat, method, value):
+        if method == "preset":
+            if value == HOLD_COMFORT:
+                thermostat.activate_comfort()
+            else:
+                thermostat.activate_eco()
+        else:
+            setattr(thermostat, method, value)
+
+        return self.present_device_state(name, thermostat)
 
     def present_device_state(self, name, thermostat):
         from eq3bt import Mode
@@ -1,39 +1,39 @@
+import struct
 import time
 
 from mqtt import MqttMessage
 
+from scan_service import _SCAN_SERVICE, AD_TYPE_MANUFACTURER_DATA, register_decoder
 from workers.base import BaseWorker
 import logger
 
 REQUIREMENTS = ["bluepy"]
 _LOGGER = logger.get(__name__)
 
+ORAL_B_COMPANY_ID = 0x00DC
+# Protocol version and type, state, pressure, brushing minutes and seconds, mode, sector
+BRUSH_FORMAT = struct.Struct("<3x6B")
 
-class ToothbrushWorker(BaseWorker):
-    def searchmac(self, devices, mac):
-        for dev in devices:
-            if dev.addr == mac.lower():
-                return dev
 
-        return None
+def decode_brush(payload, advertisement):
+    """State, pressure, brushing time in seconds, mode and sector from the manufacturer data"""
+    state, pressure, minutes, seconds, mode, sector = BRUSH_FORMAT.unpack_from(payload)
+    return state, pressure, minutes * 60 + seconds, mode, sector
 
-    def status_update(self):
-        from bluepy.btle import Scanner, DefaultDelegate
 
-        class ScanDelegate(DefaultDelegate):
-            def __init__(self):
-                DefaultDelegate.__init__(self)
+register_decoder(AD_TYPE_MANUFACTURER_DATA, ORAL_B_COMPANY_ID, decode_brush)
+
 
-            def handleDiscovery(self, dev, isNewDev, isNewData):
-                if isNewDev:
-                    _LOGGER.debug("Discovered new device: %s" % dev.addr)
+class ToothbrushWorker(BaseWorker):
+    def _setup(self):
+        _SCAN_SERVICE.subscribe(self, self.devices.values(), window=5.0, passive=False)
 
-        scanner = Scanner().withDelegate(ScanDelegate())
-        devices = scanner.scan(5.0)
+    def status_update(self):
+        _SCAN_SERVICE.refresh(self.adapter)
         ret = []
 
         for name, mac in self.devices.items():
-            device = self.searchmac(devices, mac)
+            device = _SCAN_SERVICE.latest(mac)
             if device is None:
                 ret.append(
                     MqttMessage(
@@ -52,32 +52,37 @@ class ToothbrushWorker(BaseWorker):
                         topic=self.format_topic(name + "/presence"), payload="1"
                     )
                 )
-                _LOGGER.debug("text: %s" % device.getValueText(255))
-                bytes_ = bytearray(bytes.fromhex(device.getValueText(255)))
+                values = device.decode(AD_TYPE_MANUFACTURER_DATA, ORAL_B_COMPANY_ID)
+                _LOGGER.debug("values: %s", values)
+                if values is None:
+                    yield ret
+                    continue
+
+                state, pressure, brush_time, mode, sector = values
                 ret.append(
                     MqttMessage(
-                        topic=self.format_topic(name + "/running"), payload=bytes_[5]
+                        topic=self.format_topic(name + "/running"), payload=state
                     )
                 )
                 ret.append(
                     MqttMessage(
-                        topic=self.format_topic(name + "/pressure"), payload=bytes_[6]
+                        topic=self.format_topic(name + "/pressure"), payload=pressure
                     )
                 )
                 ret.append(
                     MqttMessage(
                         topic=self.format_topic(name + "/time"),
-                        payload=bytes_[7] * 60 + bytes_[8],
+                        payload=brush_time,
                     )
                 )
                 ret.append(
                     MqttMessage(
-                        topic=self.format_topic(name + "/mode"), payload=bytes_[9]
+                        topic=self.format_topic(name + "/mode"), payload=mode
                     )
                 )
                 ret.append(
                     MqttMessage(
-                        topic=self.format_topic(name + "/quadrant"), payload=bytes_[10]
+                        topic=self.format_topic(name + "/quadrant"), payload=sector
                     )
                 )
 
@@ -2,7 +2,9 @@ import json
 
 from mqtt import MqttMessage
 
+from scan_service import _SCAN_SERVICE, AD_TYPE_MANUFACTURER_DATA
 from workers.base import BaseWorker
+from workers.toothbrush import ORAL_B_COMPANY_ID
 import logger
 
 REQUIREMENTS = ["bluepy"]
@@ -51,12 +53,9 @@ BRUSHSECTORS = {
 class Toothbrush_HomeassistantWorker(BaseWorker):
     def _setup(self):
         self.autoconfCache = {}
-
-    def searchmac(self, devices, mac):
-        for dev in devices:
-            if dev.addr == mac.lower():
-                return dev
-        return None
+        _SCAN_SERVICE.subscribe(
+            self, [item["mac"] for item in self.devices.values()], window=5.0, passive=False
+        )
 
     def get_autoconf_data(self, key, name):
         if key in self.autoconfCache:
@@ -91,22 +90,11 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
             return BRUSHSECTORS[255]
 
     def status_update(self):
-        from bluepy.btle import Scanner, DefaultDelegate
-
-        class ScanDelegate(DefaultDelegate):
-            def __init__(self):
-                DefaultDelegate.__init__(self)
-
-            def handleDiscovery(self, dev, isNewDev, isNewData):
-                if isNewDev:
-                    _LOGGER.debug("Discovered new device: %s" % dev.addr)
-
-        scanner = Scanner().withDelegate(ScanDelegate())
-        devices = scanner.scan(5.0)
+        _SCAN_SERVICE.refresh(self.adapter)
         ret = []
 
         for key, item in self.devices.items():
-            device = self.searchmac(devices, item["mac"])
+            device = _SCAN_SERVICE.latest(item["mac"])
 
             rssi = 0
             presence = 0
@@ -116,18 +104,12 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
             mode = 255
             sector = 255
 
-            if device is not None:
-                bytes_ = bytearray.fromhex(device.getValueText(255))
-                _LOGGER.debug("text: %s" % device.getValueText(255))
-
-                if bytes_[5] > 0:
-                    rssi = device.rssi
-                    presence = 1
-                    state = bytes_[5]
-                    pressure = bytes_[6]
-                    time = bytes_[7] * 60 + bytes_[8]
-                    mode = bytes_[9]
-                    sector = bytes_[10]
+            values = device.decode(AD_TYPE_MANUFACTURER_DATA, ORAL_B_COMPANY_ID) if device is not None else None
+            _LOGGER.debug("values: %s", values)
+            if values is not None and values[0] > 0:
+                rssi = device.rssi
+                presence = 1
+                state, pressure, time, mode, sector = values
 
             attributes = {
                 "rssi": rssi,
@@ -0,0 +1,211 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+from const import DEFAULT_EXECUTOR_WORKERS, DEFAULT_ADAPTER_CONCURRENCY
+from exceptions import WorkerTimeoutError, DeviceTimeoutError, IsolatedWorkerError
+from timeouts import Deadline
+from workers_queue import _WORKERS_QUEUE, PRIORITY_COMMAND
+import logger
+
+_LOGGER = logger.get(__name__)
+_EXECUTOR = None
+
+
+class AdapterSlot:
+    """Limits the number of commands using a bluetooth adapter and tracks urgent commands waiting for it"""
+
+    def __init__(self, concurrency):
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._urgent_changed = threading.Condition(threading.Lock())
+        self._urgent_waiting = 0
+
+    @contextmanager
+    def acquire(self, urgent=False):
+        if urgent:
+            self._set_urgent(1)
+        try:
+            self._semaphore.acquire()
+        finally:
+            if urgent:
+                self._set_urgent(-1)
+
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    @property
+    def urgent_waiting(self):
+        return self._urgent_waiting > 0
+
+    def hand_over(self):
+        """Temporarily releases the held slot to urgent commands waiting for it"""
+        self._semaphore.release()
+        try:
+            with self._urgent_changed:
+                self._urgent_changed.wait_for(lambda: self._urgent_waiting == 0)
+        finally:
+            self._semaphore.acquire()
+
+    def _set_urgent(self, delta):
+        with self._urgent_changed:
+            self._urgent_waiting += delta
+            self._urgent_changed.notify_all()
+
+
+class WorkersExecutor:
+    """
+    Executes queued commands. With a single worker commands are executed on the thread calling process(),
+    otherwise a pool of threads picks them up, limiting the number of commands running on a single
+    bluetooth adapter at the same time.
+    """
+
+    def __init__(self, config, mqtt):
+        self._mqtt = mqtt
+        self._workers = config.get("workers", DEFAULT_EXECUTOR_WORKERS)
+        self._adapter_concurrency = config.get(
+            "adapter_concurrency", DEFAULT_ADAPTER_CONCURRENCY
+        )
+        self._adapters = {}
+        self._adapters_lock = threading.Lock()
+        self._threads = []
+        self._running = threading.Event()
+        self._draining = threading.Event()
+        self._fatal_error = None
+        self._fatal_error_event = threading.Event()
+
+    @property
+    def threaded(self):
+        return self._workers > 1
+
+    def start(self):
+        global _EXECUTOR
+        _EXECUTOR = self
+
+        self._running.set()
+        if not self.threaded:
+            return
+
+        _LOGGER.debug("Starting %d executor threads", self._workers)
+        self._start_threads(self._workers)
+
+    def stop(self, timeout=None):
+        """
+        Stops executing commands. Commands already queued and running get up to timeout seconds to finish, when
+        not running threaded on a thread of its own. Commands still running then are abandoned.
+        """
+        deadline = Deadline(timeout)
+        self._draining.set()
+        if timeout != 0 and not self._threads:
+            self._start_threads(1)
+
+        for thread in self._threads:
+            thread.join(deadline.remaining())
+        self._running.clear()
+
+        running = sum(thread.is_alive() for thread in self._threads)
+        if running:
+            _LOGGER.warning("Abandoning %d commands still running after %s seconds", running, timeout)
+        self._threads = []
+
+    def _start_threads(self, count):
+        for i in range(count):
+            thread = threading.Thread(
+                target=self._run, name="executor-{}".format(i), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def process(self, timeout):
+        """
+        Has to be called periodically from the main thread. Executes a single queued command when not running
+        threaded, and re-raises fatal errors from the executor threads otherwise.
+        """
+        if self.threaded:
+            if self._fatal_error_event.wait(timeout):
+                raise self._fatal_error
+            return
+
+        try:
+            command = _WORKERS_QUEUE.get(timeout=timeout)
+        except queue.Empty:  # Allow for SIGINT processing
+            return
+        self.execute(command)
+
+    def execute(self, command):
+        if command.adapter is None:
+            self._execute(command)
+            return
+
+        with self.adapter_slot(command.adapter).acquire(
+            urgent=command.priority == PRIORITY_COMMAND
+        ):
+            self._execute(command)
+
+    def preemption_requested(self, adapter):
+        return self.adapter_slot(adapter).urgent_waiting or _WORKERS_QUEUE.has_pending(
+            PRIORITY_COMMAND, adapter
+        )
+
+    def preempt(self, adapter):
+        """
+        Lets urgent commands use the adapter held by the calling command. Queued ones are executed right away on
+        the calling thread, ones already picked up by other executor threads get the adapter handed over.
+        """
+        command = _WORKERS_QUEUE.take(PRIORITY_COMMAND, adapter)
+        while command is not None:
+            _LOGGER.debug("Preempting adapter %s for %s", adapter, command)
+            self._execute(command)
+            command = _WORKERS_QUEUE.take(PRIORITY_COMMAND, adapter)
+        self._hand_over(adapter)
+
+    def _hand_over(self, adapter):
+        slot = self.adapter_slot(adapter)
+        if slot.urgent_waiting:
+            slot.hand_over()
+
+    def adapter_slot(self, adapter):
+        with self._adapters_lock:
+            if adapter not in self._adapters:
+                self._adapters[adapter] = AdapterSlot(self._adapter_concurrency)
+            return self._adapters[adapter]
+
+    def _execute(self, command):
+        try:
+            for messages in command.stream():
+                self._mqtt.publish(messages)
+        except (WorkerTimeoutError, DeviceTimeoutError) as e:
+            logger.log_exception(
+                _LOGGER,
+                str(e) if str(e) else "Timeout while executing worker command",
+                suppress=True,
+            )
+        except IsolatedWorkerError as e:
+            # Contained to the worker process, restarted if it died
+            logger.log_exception(_LOGGER, "Worker process failed executing %s: %s", command, e, suppress=True)
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                command = _WORKERS_QUEUE.get(timeout=1)
+            except queue.Empty:
+                if self._draining.is_set():
+                    return
+                continue
+
+            try:
+                self.execute(command)
+            except Exception as e:
+                self._fatal_error = e
+                self._fatal_error_event.set()
+                return
+
+
+def preemption_requested(adapter):
+    return _EXECUTOR is not None and _EXECUTOR.preemption_requested(adapter)
+
+
+def preempt(adapter):
+    if _EXECUTOR is not None:
+        _EXECUTOR.preempt(adapter)
@@ -1,73 +1,186 @@
+import asyncio
 import importlib
 import inspect
-import threading
+import itertools
 from functools import partial
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from interruptingcow import timeout
-from pytz import utc
-
-from const import DEFAULT_COMMAND_TIMEOUT, DEFAULT_COMMAND_RETRIES, DEFAULT_UPDATE_RETRIES
-from exceptions import WorkerTimeoutError
-from workers_queue import _WORKERS_QUEUE
+from adaptive_interval import AdaptiveInterval
+from bluepy_helpers import _HELPER_POOL
+from circuit_breaker import _CIRCUIT_BREAKERS, STATE_OPEN
+from connection_pool import _CONNECTION_POOL
+from const import (
+    DEFAULT_COMMAND_TIMEOUT,
+    DEFAULT_COMMAND_RETRIES,
+    DEFAULT_UPDATE_RETRIES,
+    DEFAULT_ADAPTER,
+    DEFAULT_METRICS_INTERVAL,
+    DEFAULT_LATENCY_SAVE_INTERVAL,
+    DEFAULT_SCHEDULE_JITTER,
+    DEFAULT_STARTUP_RAMP,
+    DEFAULT_SHUTDOWN_TIMEOUT,
+    DEFAULT_OUTPUT_FLUSH_INTERVAL,
+    JOB_PHASE_STEP,
+)
+from daemons import DaemonSupervisor, OutputChannel
+from exceptions import WorkerTimeoutError, DeviceTimeoutError
+from mqtt import MqttMessage
+from retries import _RETRY_POLICY
+from scan_service import _SCAN_SERVICE
+from scheduler import Scheduler
+from latency import _LATENCY
+from timeouts import Deadline, call_with_timeout, current_deadline, remaining
+from worker_process import isolated_worker
+from workers.base import DEVICE_ORDERS
+from workers_queue import _WORKERS_QUEUE, PRIORITY_COMMAND, PRIORITY_CONFIG, PRIORITY_UPDATE
 import logger
+import metrics
+import presence
 
 _LOGGER = logger.get(__name__)
 
 
 class WorkersManager:
     class Command:
-        def __init__(self, callback, timeout, args=(), options=dict()):
+        def __init__(
+            self, callback, timeout, args=(), options=dict(), adapter=None, priority=PRIORITY_UPDATE, group=None
+        ):
             self._callback = callback
             self._timeout = timeout
             self._args = args
             self._options = options
+            self.adapter = adapter
+            self.priority = priority
             self._source = "{}.{}".format(
                 callback.__self__.__class__.__name__
                 if hasattr(callback, "__self__")
                 else callback.__module__,
                 callback.__name__,
             )
+            # Commands updating the same worker, merged when the queue is full
+            self.group = group if group is not None else self._source
+            # Retried calls go back through the callback, appended to these arguments, see derive_retry()
+            self.retry_args = None
 
         def execute(self):
             messages = []
+            for batch in self.stream():
+                messages += batch
+            return messages
+
+        @property
+        def is_async(self):
+            return inspect.iscoroutinefunction(self._callback)
+
+        def stream(self):
+            """Yields batches of messages as soon as the callback produces them, generator callbacks per chunk"""
+            streamed = False
+            deadline = Deadline(self._timeout, owner=self)
+            exception = self._timeout_error()
 
             try:
-                with timeout(
-                        self._timeout,
-                        exception=WorkerTimeoutError(
-                            "Execution of command {} timed out after {} seconds".format(
-                                self._source, self._timeout
-                            )
-                        ),
-                ):
-                    if inspect.isgeneratorfunction(self._callback):
-                        for message in self._callback(*self._args):
-                            messages += message
-                    else:
-                        messages = self._callback(*self._args)
+                if self.is_async:
+                    # Not running on the asyncio runtime, the coroutine gets an event loop of its own
+                    messages = deadline.run(exception, self._run_coroutine)
+                    _LOGGER.debug("Execution result of command %s: %s", self._source, messages)
+                    yield messages
+                elif inspect.isgeneratorfunction(self._callback):
+                    for messages in deadline.iterate(exception, self._callback(*self._args)):
+                        _LOGGER.debug("Partial result of command %s: %s", self._source, messages)
+                        streamed = streamed or bool(messages)
+                        yield messages
+                else:
+                    messages = deadline.run(exception, self._callback, *self._args)
+                    _LOGGER.debug("Execution result of command %s: %s", self._source, messages)
+                    yield messages
             except WorkerTimeoutError as e:
-                if messages:
+                if streamed:
                     logger.log_exception(
                         _LOGGER, "%s, sending only partial update", e, suppress=True
                     )
                 else:
                     raise e
 
+        async def execute_async(self):
+            """Awaits a coroutine callback on the running event loop"""
+            try:
+                messages = await asyncio.wait_for(self._callback(*self._args), self._timeout)
+            except asyncio.TimeoutError:
+                raise self._timeout_error()
             _LOGGER.debug("Execution result of command %s: %s", self._source, messages)
             return messages
 
+        def _run_coroutine(self):
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(asyncio.wait_for(self._callback(*self._args), remaining()))
+            except asyncio.TimeoutError:
+                raise self._timeout_error()
+            finally:
+                loop.close()
+
+        def _timeout_error(self):
+            return WorkerTimeoutError(
+                "Execution of command {} timed out after {} seconds".format(
+                    self._source, self._timeout
+                )
+            )
+
+        def derive(self, callback, args=()):
+            """Follow-up command with the same timeout, adapter, priority and group"""
+            return WorkersManager.Command(
+                callback, self._timeout, args, adapter=self.adapter, priority=self.priority, group=self.group
+            )
+
+        def derive_retry(self, call):
+            """
+            Follow-up command retrying a call that failed during this one. With retry_args set the callback handles
+            the retry like its own call, getting the retried call as last argument, otherwise None is returned.
+            """
+            if self.retry_args is None:
+                return None
+            command = self.derive(self._callback, list(self.retry_args) + [call])
+            command.retry_args = self.retry_args
+            return command
+
+        @property
+        def key(self):
+            """Identifies commands doing the same work, used to merge duplicates waiting in the queue"""
+            return "{}({})".format(self._source, ", ".join(map(repr, self._args)))
+
+        def __repr__(self):
+            return self._source
+
     def __init__(self, config, mqtt_config):
         self._mqtt_callbacks = []
         self._config_commands = []
         self._update_commands = []
-        self._scheduler = BackgroundScheduler(timezone=utc)
-        self._daemons = []
+        self._device_commands = []
+        self._adaptive_intervals = {}
+        self._job_phases = {}
+        self._job_sequence = itertools.count()
+        self._scheduler = Scheduler()
+        self._isolated_workers = []
         self._config = config
         self._command_timeout = config.get("command_timeout", DEFAULT_COMMAND_TIMEOUT)
         self._command_retries = config.get("command_retries", DEFAULT_COMMAND_RETRIES)
         self._update_retries = config.get("update_retries", DEFAULT_UPDATE_RETRIES)
+        self._jitter = config.get("scheduler", {}).get("jitter", DEFAULT_SCHEDULE_JITTER)
+        self._startup_ramp = config.get("scheduler", {}).get("startup_ramp", DEFAULT_STARTUP_RAMP)
+        self.shutdown_timeout = config.get("shutdown_timeout", DEFAULT_SHUTDOWN_TIMEOUT)
         self._mqtt = mqtt_config
+        daemons_config = config.get("daemons", {})
+        self._output = OutputChannel(
+            mqtt_config, daemons_config.get("flush_interval", DEFAULT_OUTPUT_FLUSH_INTERVAL)
+        )
+        self._daemons = DaemonSupervisor(self._output, daemons_config)
+        _WORKERS_QUEUE.configure(config.get("queue", {}))
+        _RETRY_POLICY.configure(config.get("retry", {}))
+        _CIRCUIT_BREAKERS.configure(config.get("circuit_breaker", {}))
+        _SCAN_SERVICE.configure(config.get("scanner", {}))
+        _CONNECTION_POOL.configure(config.get("connections", {}))
+        _HELPER_POOL.configure(config.get("helpers", {}))
+        if "adaptive_timeout" in config:
+            _LATENCY.configure(config["adaptive_timeout"])
 
     def register_workers(self, global_topic_prefix):
         for (worker_name, worker_config) in self._config["workers"].items():
@@ -83,18 +196,46 @@ class WorkersManager:
             update_retries = worker_config.get(
                 "update_retries", self._update_retries
             )
-            worker_obj = klass(
-                command_timeout, command_retries, update_retries, global_topic_prefix, **worker_config["args"]
+            if worker_config.get("isolated", False):
+                worker_obj = isolated_worker(
+                    klass,
+                    worker_name,
+                    command_timeout,
+                    command_retries,
+                    update_retries,
+                    global_topic_prefix,
+                    **worker_config["args"]
+                )
+                self._isolated_workers.append(worker_obj)
+            else:
+                worker_obj = klass(
+                    command_timeout, command_retries, update_retries, global_topic_prefix, **worker_config["args"]
+                )
+            worker_obj.adapter = worker_config.get("adapter", DEFAULT_ADAPTER)
+            worker_obj.device_order = worker_config.get("device_order", worker_obj.device_order)
+            if worker_obj.device_order not in DEVICE_ORDERS:
+                raise ValueError(
+                    "Unknown device_order '{}' of {}, expected one of: {}".format(
+                        worker_obj.device_order, worker_name, ", ".join(DEVICE_ORDERS)
+                    )
+                )
+            worker_obj.presence_window = worker_config.get(
+                "presence_window", self._config.get("presence", {}).get("window")
             )
 
             if "sensor_config" in self._config and hasattr(worker_obj, "config"):
                 _LOGGER.debug(
                     "Added %s config with a %d seconds timeout", repr(worker_obj), 2
                 )
-                command = self.Command(worker_obj.config, 2, [self._mqtt.availability_topic])
+                command = self.Command(
+                    worker_obj.config, 2, [self._mqtt.availability_topic], priority=PRIORITY_CONFIG
+                )
                 self._config_commands.append(command)
 
-            if hasattr(worker_obj, "status_update"):
+            # Workers updating devices one by one get a job per device, their status_update isn't scheduled
+            if hasattr(worker_obj, "update_device"):
+                self._register_device_jobs(worker_name, worker_obj, worker_config)
+            elif hasattr(worker_obj, "status_update"):
                 _LOGGER.debug(
                     "Added %s worker with %d seconds interval and a %d seconds timeout",
                     repr(worker_obj),
@@ -102,27 +243,22 @@ class WorkersManager:
                     worker_obj.command_timeout,
                 )
                 command = self.Command(
-                    worker_obj.status_update, worker_obj.command_timeout, []
+                    worker_obj.status_update, worker_obj.command_timeout, [], adapter=worker_obj.adapter
                 )
                 self._update_commands.append(command)
 
                 if "update_interval" in worker_config:
                     job_id = "{}_interval_job".format(worker_name)
-                    self._scheduler.add_job(
-                        partial(self._queue_command, command),
-                        "interval",
-                        seconds=worker_config["update_interval"],
-                        id=job_id,
-                    )
+                    self._schedule_command(command, job_id, worker_config["update_interval"])
                     self._mqtt_callbacks.append(
                         (
                             worker_obj.format_topic("update_interval"),
-                            partial(self._update_interval_wrapper, command, job_id),
+                            partial(self._update_interval_wrapper, [(command, job_id)]),
                         )
                     )
             elif hasattr(worker_obj, "run"):
                 _LOGGER.debug("Registered %s as daemon", repr(worker_obj))
-                self._daemons.append(worker_obj)
+                self._daemons.add(worker_obj)
             else:
                 raise "%s cannot be initialized, it has to define run or status_update method" % worker_name
 
@@ -134,6 +270,8 @@ class WorkersManager:
                     )
                 )
 
+        self._register_scan_jobs()
+
         if "topic_subscription" in self._config:
             for (callback_name, options) in self._config["topic_subscription"].items():
                 self._mqtt_callbacks.append(
@@ -141,7 +279,7 @@ class WorkersManager:
                         options["topic"],
                         lambda client, _, c: self._queue_if_matching_payload(
                             self.Command(
-                                getattr(self, callback_name), self._command_timeout
+                                getattr(self, callback_name), self._command_timeout, priority=PRIORITY_CONFIG
                             ),
                             c.payload,
                             options["payload"],
@@ -149,46 +287,262 @@ class WorkersManager:
                     )
                 )
 
+    def _register_scan_jobs(self):
+        """Scans of the shared scanner, queued before other updates so passive workers find advertisements"""
+        for adapter in _SCAN_SERVICE.adapters():
+            window = _SCAN_SERVICE.window(adapter)
+            _LOGGER.debug(
+                "Added scan of adapter %s every %d seconds for %d seconds", adapter, _SCAN_SERVICE.interval, window
+            )
+            command = self.Command(
+                _SCAN_SERVICE.scan, window + self._command_timeout, [adapter], adapter=adapter
+            )
+            self._update_commands.insert(0, command)
+            self._schedule_command(command, "scan_{}_job".format(adapter), _SCAN_SERVICE.interval)
+            _SCAN_SERVICE.scheduled = True
+
+    def _register_device_jobs(self, worker_name, worker_obj, worker_config):
+        worker_jobs = []
+        device_commands = {}
+        for device_name in worker_obj.devices:
+            device_config = worker_config.get("devices", {}).get(device_name, {})
+            command_timeout = device_config.get("command_timeout", worker_obj.command_timeout)
+            update_interval = device_config.get("update_interval", worker_config.get("update_interval"))
+            adaptive_config = device_config.get("adaptive_interval", worker_config.get("adaptive_interval"))
+            _LOGGER.debug(
+                "Added %s device '%s' with %s seconds interval and a %d seconds timeout",
+                repr(worker_obj),
+                device_name,
+                update_interval,
+                command_timeout,
+            )
+            command = self.Command(
+                self._update_device,
+                command_timeout,
+                [worker_obj, device_name],
+                adapter=worker_obj.adapter,
+                group=repr(worker_obj),
+            )
+            command.retry_args = [worker_obj, device_name]
+            device_commands[device_name] = command
+
+            if update_interval:
+                job_id = self._device_job_id(worker_obj, device_name)
+                self._schedule_command(command, job_id, update_interval)
+                if adaptive_config is not None:
+                    self._adaptive_intervals[job_id] = (
+                        command,
+                        AdaptiveInterval(update_interval, adaptive_config),
+                    )
+                if "update_interval" not in device_config:
+                    worker_jobs.append((command, job_id))
+
+        self._device_commands.append((worker_obj, device_commands))
+        if worker_jobs:
+            self._mqtt_callbacks.append(
+                (
+                    worker_obj.format_topic("update_interval"),
+                    partial(self._update_interval_wrapper, worker_jobs),
+                )
+            )
+
+    def _update_device(self, worker_obj, device_name, call=None):
+        """Updates the device, or retries a failed update with call, counting the outcome for its circuit breaker"""
+        if call is None:
+            call = partial(worker_obj.update_device, device_name)
+        if worker_obj.device_absent(device_name):
+            _LOGGER.debug("Skipping %s device '%s', not seen recently", repr(worker_obj), device_name)
+            metrics.increment("presence.skipped")
+            return []
+
+        breaker = _CIRCUIT_BREAKERS.get(worker_obj.device_key(device_name))
+        if not breaker.allow():
+            metrics.increment("circuit_breaker.skipped")
+            return []
+
+        timeout = worker_obj.device_timeout(device_name, worker_obj.update_timeout)
+        deadline = current_deadline()
+        retries_scheduled = deadline.retries_scheduled if deadline is not None else 0
+        try:
+            with worker_obj.device_update(device_name):
+                if timeout is None:
+                    messages = call()
+                else:
+                    messages = call_with_timeout(timeout, DeviceTimeoutError, call)
+        except Exception as e:
+            if breaker.state == STATE_OPEN:
+                _LOGGER.debug("Probe of %s device '%s' failed: %s", repr(worker_obj), device_name, type(e).__name__)
+            elif isinstance(e, DeviceTimeoutError):
+                worker_obj.log_timeout_exception(_LOGGER, device_name)
+            else:
+                worker_obj.log_update_exception(_LOGGER, device_name, e)
+
+            if not breaker.record_failure():
+                return []
+            _LOGGER.warning(
+                "Stopped polling %s device '%s' after %d failures, probing it again in %d seconds",
+                repr(worker_obj),
+                device_name,
+                breaker.failure_threshold,
+                breaker.base_delay,
+            )
+            metrics.increment("circuit_breaker.opened")
+            return [self._circuit_message(worker_obj, device_name, breaker)]
+
+        messages = list(messages or [])
+        if messages:
+            presence.seen(worker_obj.device_key(device_name))
+            job_id = self._device_job_id(worker_obj, device_name)
+            if job_id in self._adaptive_intervals:
+                messages += self._adapt_interval(worker_obj, device_name, job_id, messages)
+
+        # A failed update queued again by the retry policy returns nothing, its retry reports the outcome
+        retried = deadline is not None and deadline.retries_scheduled != retries_scheduled
+        if not retried and breaker.record_success():
+            _LOGGER.info("%s device '%s' is reachable again", repr(worker_obj), device_name)
+            metrics.increment("circuit_breaker.closed")
+            messages.append(self._circuit_message(worker_obj, device_name, breaker))
+        return messages
+
+    @staticmethod
+    def _circuit_message(worker_obj, device_name, breaker):
+        return MqttMessage(
+            topic=worker_obj.format_topic(device_name, "circuit"),
+            payload=breaker.state,
+            retain=True,
+        )
+
+    def _adapt_interval(self, worker_obj, device_name, job_id, messages):
+        command, adaptive = self._adaptive_intervals[job_id]
+        previous_interval = adaptive.interval
+        new_interval = adaptive.update(messages)
+        if new_interval != previous_interval:
+            _LOGGER.debug(
+                "Changing update interval of %s device '%s' from %d to %d seconds",
+                repr(worker_obj),
+                device_name,
+                previous_interval,
+                new_interval,
+            )
+            self._schedule_command(command, job_id, new_interval, first_run=new_interval)
+
+        return [
+            MqttMessage(
+                topic=worker_obj.format_topic(device_name, "update_interval"),
+                payload=new_interval,
+                retain=True,
+            )
+        ]
+
+    @staticmethod
+    def _device_job_id(worker_obj, device_name):
+        return "{}_{}_interval_job".format(repr(worker_obj), device_name)
+
     def start(self):
         self._mqtt.callbacks_subscription(self._mqtt_callbacks)
 
         if "sensor_config" in self._config:
             self._publish_config()
 
+        if "metrics" in self._config:
+            self._scheduler.add_job(
+                self._publish_metrics,
+                self._config["metrics"].get("interval", DEFAULT_METRICS_INTERVAL),
+                "metrics_job",
+            )
+
+        if _LATENCY.state_file:
+            self._scheduler.add_job(
+                _LATENCY.save,
+                self._config["adaptive_timeout"].get(
+                    "save_interval", DEFAULT_LATENCY_SAVE_INTERVAL
+                ),
+                "latency_job",
+            )
+
+        if _CONNECTION_POOL.idle_timeout > 0:
+            self._scheduler.add_job(_CONNECTION_POOL.expire, _CONNECTION_POOL.idle_timeout / 2, "connections_job")
+
         self._scheduler.start()
         self.update_all()
-        for daemon in self._daemons:
-            threading.Thread(target=daemon.run, args=[self._mqtt], daemon=True).start()
+        self._output.start()
+        self._daemons.start()
+
+    def stop(self):
+        """Stops scheduling commands, the ones already queued are left for the executor to drain"""
+        self._scheduler.shutdown()
+        dropped = _WORKERS_QUEUE.close()
+        _LOGGER.debug("Stopped scheduling, dropped %d delayed commands", dropped)
+
+    def close(self):
+        """Saves state and stops worker processes, once the executor is stopped"""
+        # Daemons publish through the output channel up to their last message, it is stopped after them
+        self._daemons.stop()
+        self._output.stop()
+        left = _WORKERS_QUEUE.qsize()
+        if left:
+            _LOGGER.warning("Dropping %d commands not executed before shutdown", left)
+        if _LATENCY.state_file:
+            _LATENCY.save()
+        _CONNECTION_POOL.close()
+        _HELPER_POOL.close()
+        for worker_obj in self._isolated_workers:
+            worker_obj.stop()
 
     def _queue_if_matching_payload(self, command, payload, expected_payload):
         if payload.decode("utf-8") == expected_payload:
             self._queue_command(command)
 
     def update_all(self):
+        """Queues updates of all workers, spread over startup_ramp seconds to avoid a burst on the adapters"""
         _LOGGER.debug("Updating all workers")
-        for command in self._update_commands:
-            self._queue_command(command)
+        commands = list(self._update_commands)
+        for worker_obj, device_commands in self._device_commands:
+            commands += [device_commands[name] for name in worker_obj.ordered_devices()]
+
+        for i, command in enumerate(commands):
+            delay = self._startup_ramp * i / len(commands)
+            if delay:
+                _WORKERS_QUEUE.put_later(command, delay)
+            else:
+                self._queue_command(command)
 
     @staticmethod
     def _queue_command(command):
         _WORKERS_QUEUE.put(command)
 
-    def _update_interval_wrapper(self, command, job_id, client, userdata, c):
+    def _update_interval_wrapper(self, jobs, client, userdata, c):
         _LOGGER.info("Recieved updated interval for %s with: %s", c.topic, c.payload)
         try:
             new_interval = int(c.payload)
-            self._scheduler.remove_job(job_id)
-            self._scheduler.add_job(
-                partial(self._queue_command, command),
-                "interval",
-                seconds=new_interval,
-                id=job_id,
-            )
+            for command, job_id in jobs:
+                if job_id in self._adaptive_intervals:
+                    self._adaptive_intervals[job_id][1].reset(new_interval)
+                self._schedule_command(command, job_id, new_interval)
         except ValueError:
             logger.log_exception(
                 _LOGGER, "Ignoring invalid new interval: %s", c.payload
             )
 
+    def _schedule_command(self, command, job_id, seconds, first_run=None):
+        """
+        (Re)schedules queueing the command every given seconds. Unless first_run is given, each job keeps its own
+        phase within the interval, so jobs sharing an interval don't run at the same moment. Every run gets a
+        random jitter.
+        """
+        if job_id not in self._job_phases:
+            self._job_phases[job_id] = next(self._job_sequence) * JOB_PHASE_STEP % 1
+        if first_run is None:
+            # Between a half and one and a half intervals, the update right after start is done by update_all
+            first_run = seconds * (0.5 + self._job_phases[job_id])
+        self._scheduler.add_job(
+            partial(self._queue_command, command),
+            seconds,
+            job_id,
+            first_run=first_run,
+            jitter=seconds * self._jitter,
+        )
+
     def _on_command_wrapper(self, worker_obj, client, userdata, c):
         _LOGGER.debug(
             "Received command for %s on %s: %s", repr(worker_obj), c.topic, c.payload
@@ -201,7 +555,11 @@ class WorkersManager:
         )
         self._queue_command(
             self.Command(
-                worker_obj.on_command, worker_obj.command_timeout, [topic, c.payload]
+                worker_obj.on_command,
+                worker_obj.command_timeout,
+                [topic, c.payload],
+                adapter=worker_obj.adapter,
+                priority=PRIORITY_COMMAND,
             )
         )
 
@@ -215,3 +573,15 @@ class WorkersManager:
                 )
                 msg.retain = self._config["sensor_config"].get("retain", True)
             self._mqtt.publish(messages)
+
+    def _publish_metrics(self):
+        metrics.gauge("queue_size", _WORKERS_QUEUE.qsize())
+        self._daemons.update_metrics()
+        self._mqtt.publish(
+            [
+                MqttMessage(
+                    topic=self._config["metrics"].get("topic", "gateway/metrics"),
+                    payload=metrics.snapshot(),
+                )
+            ]
+        )
@@ -1,3 +1,226 @@
-from queue import Queue
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from queue import Empty
 
-_WORKERS_QUEUE = Queue()
+from const import DEFAULT_STARVATION_TIMEOUT, DEFAULT_QUEUE_MAX_SIZE
+import logger
+import metrics
+
+_LOGGER = logger.get(__name__)
+
+PRIORITY_COMMAND = 0  # Commands received over MQTT, e.g. actuators
+PRIORITY_CONFIG = 1  # Discovery and configuration
+PRIORITY_UPDATE = 2  # Periodic status updates
+
+PRIORITY_NAMES = {
+    PRIORITY_COMMAND: "command",
+    PRIORITY_CONFIG: "config",
+    PRIORITY_UPDATE: "update",
+}
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Drop the oldest waiting status update
+OVERFLOW_REJECT = "reject"  # Drop the new command
+OVERFLOW_MERGE = "merge"  # New status update takes the place of the oldest one of the same worker
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT, OVERFLOW_MERGE)
+
+
+class WorkersQueue:
+    """
+    Priority queue of commands. Lower priority classes are served only when higher ones are empty, unless their
+    oldest command waits longer than starvation_timeout. A status update identical to one already waiting is
+    merged into it. Commands put with a delay become available once it passes.
+
+    Once max_size commands are waiting, the overflow policy decides what is shed. Commands received over MQTT are
+    never shed, they are queued even beyond max_size.
+
+    Once closed, delayed commands are dropped and getting from an empty queue doesn't wait anymore, so executors
+    can drain it on shutdown.
+    """
+
+    def __init__(
+        self,
+        starvation_timeout=DEFAULT_STARVATION_TIMEOUT,
+        max_size=DEFAULT_QUEUE_MAX_SIZE,
+        overflow=OVERFLOW_DROP_OLDEST,
+    ):
+        self.starvation_timeout = starvation_timeout
+        self.max_size = max_size
+        self.overflow = overflow
+        self._queues = {priority: deque() for priority in PRIORITY_NAMES}
+        self._pending_updates = set()
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._not_empty = threading.Condition(threading.Lock())
+        self._closed = False
+
+    def configure(self, config):
+        self.starvation_timeout = config.get(
+            "starvation_timeout", self.starvation_timeout
+        )
+        self.max_size = config.get("max_size", self.max_size)
+        self.overflow = config.get("overflow", self.overflow)
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown queue overflow policy '{}', expected one of: {}".format(
+                    self.overflow, ", ".join(OVERFLOW_POLICIES)
+                )
+            )
+
+    def put(self, command):
+        """Returns False when the command was shed because the queue is full"""
+        with self._not_empty:
+            queued = self._put(command)
+            self._not_empty.notify()
+        return queued
+
+    def put_later(self, command, delay):
+        with self._not_empty:
+            if self._closed:
+                return
+            heapq.heappush(
+                self._delayed, (time.monotonic() + delay, next(self._sequence), command)
+            )
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        end = time.monotonic() + timeout if timeout is not None else None
+        with self._not_empty:
+            while True:
+                self._promote_delayed()
+                if self._qsize():
+                    break
+
+                now = time.monotonic()
+                if self._closed or (end is not None and end <= now):
+                    raise Empty
+
+                wait = end - now if end is not None else None
+                if self._delayed:
+                    due = self._delayed[0][0] - now
+                    wait = due if wait is None else min(wait, due)
+                self._not_empty.wait(wait)
+
+            priority = self._next_priority()
+            enqueued_at, command = self._queues[priority].popleft()
+            if priority == PRIORITY_UPDATE:
+                self._pending_updates.discard(command.key)
+
+        metrics.observe(
+            "queue_wait.{}".format(PRIORITY_NAMES[priority]),
+            time.monotonic() - enqueued_at,
+        )
+        return command
+
+    def has_pending(self, priority, adapter):
+        with self._not_empty:
+            self._promote_delayed()
+            return any(command.adapter == adapter for _, command in self._queues[priority])
+
+    def take(self, priority, adapter):
+        """Removes the oldest command of the given priority class using the adapter, if any"""
+        with self._not_empty:
+            self._promote_delayed()
+            for item in self._queues[priority]:
+                if item[1].adapter == adapter:
+                    self._queues[priority].remove(item)
+                    if priority == PRIORITY_UPDATE:
+                        self._pending_updates.discard(item[1].key)
+                    break
+            else:
+                return None
+
+        enqueued_at, command = item
+        metrics.observe(
+            "queue_wait.{}".format(PRIORITY_NAMES[priority]),
+            time.monotonic() - enqueued_at,
+        )
+        return command
+
+    def qsize(self):
+        with self._not_empty:
+            return self._qsize()
+
+    def close(self):
+        """Drops delayed commands and wakes up waiting getters, returns the number of commands dropped"""
+        with self._not_empty:
+            self._closed = True
+            dropped = len(self._delayed)
+            self._delayed = []
+            self._not_empty.notify_all()
+        return dropped
+
+    def _put(self, command):
+        if command.priority == PRIORITY_UPDATE and command.key in self._pending_updates:
+            metrics.increment("queue_merged.update")
+            return True
+
+        if (
+            self.max_size
+            and command.priority != PRIORITY_COMMAND
+            and self._qsize() >= self.max_size
+        ):
+            return self._overflow(command)
+
+        if command.priority == PRIORITY_UPDATE:
+            self._pending_updates.add(command.key)
+        self._queues[command.priority].append((time.monotonic(), command))
+        return True
+
+    def _overflow(self, command):
+        updates = self._queues[PRIORITY_UPDATE]
+        if self.overflow == OVERFLOW_DROP_OLDEST and updates:
+            _, dropped = updates.popleft()
+            self._pending_updates.discard(dropped.key)
+            self._shed(dropped)
+            if command.priority == PRIORITY_UPDATE:
+                self._pending_updates.add(command.key)
+            self._queues[command.priority].append((time.monotonic(), command))
+            return True
+
+        if self.overflow == OVERFLOW_MERGE and command.priority == PRIORITY_UPDATE:
+            for i, (enqueued_at, queued) in enumerate(updates):
+                if queued.group == command.group:
+                    # Keeps the place of the older update, so it isn't pushed back by newer ones
+                    updates[i] = (enqueued_at, command)
+                    self._pending_updates.discard(queued.key)
+                    self._pending_updates.add(command.key)
+                    self._shed(queued)
+                    return True
+
+        self._shed(command)
+        return False
+
+    def _shed(self, command):
+        metrics.increment("queue_shed.{}".format(PRIORITY_NAMES[command.priority]))
+        _LOGGER.warning(
+            "Queue is full (%d commands), dropping %s (overflow policy: %s)",
+            self.max_size,
+            command.key,
+            self.overflow,
+        )
+
+    def _promote_delayed(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._put(heapq.heappop(self._delayed)[2])
+
+    def _qsize(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def _next_priority(self):
+        now = time.monotonic()
+        starving = [
+            (q[0][0], priority)
+            for priority, q in self._queues.items()
+            if q and now - q[0][0] > self.starvation_timeout
+        ]
+        if starving:
+            return min(starving)[1]
+
+        return min(priority for priority, q in self._queues.items() if q)
+
+
+_WORKERS_QUEUE = WorkersQueue()